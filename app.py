@@ -1,25 +1,39 @@
 import streamlit as st
 import pandas as pd
-import json
-import os
-from datetime import datetime
-from src.generator import CNABGenerator
-from src.validators import validate_date_not_past, sanitize_text
+from src.config import load_config, EMPRESA_DEFAULTS, NSAAllocator
+from src.generator import CNABGenerator, remessa_file_name
+from src.payment_index import PaymentIndex
+from src.upload import missing_columns, issue_messages, duplicate_issues, SEVERITY_WARNING
+from src.upload_cache import UploadCache
+from src.validators import CENTS_COLUMN
 
-# --- Config & Persistence ---
-CONFIG_FILE = "config.json"
+st.set_page_config(page_title="Gerador Remessa Bradesco 089", page_icon="🏦", layout="wide")
 
-def load_config():
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r") as f:
-            return json.load(f)
-    return {"nsa": 1}
+@st.cache_resource
+def get_upload_cache() -> UploadCache:
+    # One cache per server process, shared by reruns and sessions
+    return UploadCache()
 
-def save_config(nsa):
-    with open(CONFIG_FILE, "w") as f:
-        json.dump({"nsa": nsa}, f)
+upload_cache = get_upload_cache()
 
-st.set_page_config(page_title="Gerador Remessa Bradesco 089", page_icon="🏦", layout="wide")
+@st.cache_resource
+def get_history_index() -> PaymentIndex:
+    # Read-only use (duplicate check); generation opens its own connection
+    return PaymentIndex()
+
+def progress_observer(bar):
+    # Maps CNABGenerator stage events (see src/instrumentation.py) onto a progress bar
+    def on_event(event):
+        stage = event["stage"]
+        if stage == "progress" and event["payments_total"]:
+            done = event["payments_done"] / event["payments_total"]
+            bar.progress(min(done, 1.0), text=f"Lote {event['lote']}: {event['payments_done']}/{event['payments_total']} pagamentos")
+        elif stage == "split_file":
+            bar.progress(event["files_done"] / event["files_total"],
+                         text=f"{event['file_name']} gerado ({event['files_done']}/{event['files_total']})")
+        elif stage == "done":
+            bar.progress(1.0, text=f"{event['records']} registros, {event['bytes']} bytes em {event['seconds']:.2f}s")
+    return on_event
 
 # --- UI Header ---
 st.title("🏦 Gerador de Remessa CNAB 240 - Bradesco Multipag (Layout 089)")
@@ -29,14 +43,24 @@ st.markdown("---")
 st.sidebar.header("⚙️ Configurações da Empresa")
 config = load_config()
 
-nome_empresa = st.sidebar.text_input("Razão Social", config.get("nome_empresa", "DCS-CL CONSTRUTORA E PAVIMENTADORA LTDA"))
-cnpj_empresa = st.sidebar.text_input("CNPJ (Somente Números)", config.get("cnpj", "95258174000165"))
-convenio = st.sidebar.text_input("Código Convênio", config.get("convenio", "458049"))
-agencia = st.sidebar.text_input("Agência (Sem dígito)", config.get("agencia", "0268"))
-conta = st.sidebar.text_input("Conta (Sem dígito)", config.get("conta", "559461"))
-digito_conta = st.sidebar.text_input("Dígito da Conta", config.get("digito_conta", "8"), max_chars=1)
-nsa_atual = st.sidebar.number_input("NSA (Nº Sequencial Arquivo)", min_value=1, value=config.get("nsa", 1))
+nome_empresa = st.sidebar.text_input("Razão Social", config.get("nome_empresa", EMPRESA_DEFAULTS["nome_empresa"]))
+cnpj_empresa = st.sidebar.text_input("CNPJ (Somente Números)", config.get("cnpj", EMPRESA_DEFAULTS["cnpj"]))
+convenio = st.sidebar.text_input("Código Convênio", config.get("convenio", EMPRESA_DEFAULTS["convenio"]))
+agencia = st.sidebar.text_input("Agência (Sem dígito)", config.get("agencia", EMPRESA_DEFAULTS["agencia"]))
+conta = st.sidebar.text_input("Conta (Sem dígito)", config.get("conta", EMPRESA_DEFAULTS["conta"]))
+digito_conta = st.sidebar.text_input("Dígito da Conta", config.get("digito_conta", EMPRESA_DEFAULTS["digito_conta"]), max_chars=1)
+# The NSA is reserved when the file is generated, so parallel sessions never share one
+nsa_allocator = NSAAllocator()
+nsa_manual = None
+if st.sidebar.checkbox("Definir NSA manualmente"):
+    nsa_manual = int(st.sidebar.number_input("NSA (Nº Sequencial Arquivo)", min_value=1, value=nsa_allocator.peek()))
+else:
+    st.sidebar.caption(f"Próximo NSA livre: {nsa_allocator.peek()}")
 pix_flag = st.sidebar.checkbox("Habilitar Remessa PIX", value=True)
+n_arquivos = st.sidebar.number_input("Dividir em N arquivos (NSAs consecutivos)", min_value=1, value=1)
+cache_panel = st.sidebar.expander("🗄️ Cache de planilhas") # Filled at the end of the run
+if cache_panel.button("Limpar cache"):
+    upload_cache.clear()
 
 # --- 1. Download Template ---
 st.subheader("1. Download do Modelo")
@@ -49,75 +73,36 @@ except:
 
 # --- 2. Upload & Validation ---
 st.subheader("2. Upload e Conferência")
-uploaded_file = st.file_uploader("Carregar Excel Preenchido", type=["xlsx"])
+uploaded_file = st.file_uploader("Carregar Planilha Preenchida (Excel, CSV ou Parquet)", type=["xlsx", "csv", "parquet"])
 
 if uploaded_file:
     # Strictly enforce string types
     try:
-        df = pd.read_excel(uploaded_file, dtype=str)
-        # Clean NaNs
-        df = df.fillna("")
-        
-        # Filter Empty Rows (where NOME_FAVORECIDO or VALOR_PAGAMENTO is empty)
-        df = df[df["NOME_FAVORECIDO"].str.strip() != ""]
-        df = df[df["VALOR_PAGAMENTO"].str.strip() != ""]
+        digest, (df, ingest_stats) = upload_cache.read(uploaded_file.getvalue(), uploaded_file.name)
         
         # Verify Columns
-        req_cols = ["NOME_FAVORECIDO", "CPF_CNPJ", "COD_BANCO", "VALOR_PAGAMENTO", "DATA_PAGAMENTO"]
-        missing = [c for c in req_cols if c not in df.columns]
+        missing = missing_columns(df)
         
         if missing:
-            st.error(f"❌ Erro: Colunas faltando no Excel: {', '.join(missing)}")
+            st.error(f"❌ Erro: Colunas faltando na planilha: {', '.join(missing)}")
         else:
             # --- Validations ---
-            errors = []
-            warnings = []
-            
-            total_val = 0.0
-            
-            for idx, row in df.iterrows():
-                line_no = idx + 2
-                
-                # Value Validation
-                try:
-                    val = float(row['VALOR_PAGAMENTO'].replace('R$', '').replace(',', '.')) if row['VALOR_PAGAMENTO'] else 0.0
-                    total_val += val
-                    if val <= 0:
-                        errors.append(f"Linha {line_no}: Valor inválido (R$ {val})")
-                except:
-                    errors.append(f"Linha {line_no}: Formato de valor inválido")
-                
-                # Date Validation
-                dt_str = str(row['DATA_PAGAMENTO']).split()[0] # Handle "2026-01-01 00:00:00"
-                # If excel read as YYYY-MM-DD, try to convert or validate
-                # Ideally user puts DD/MM/YYYY text.
-                # If panda read it as timestamp:
-                if '-' in dt_str:
-                     # Attempt to parse YYYY-MM-DD
-                     try:
-                         # Normalize to DD/MM/YYYY for internal use
-                         dt_obj = pd.to_datetime(dt_str)
-                         row['DATA_PAGAMENTO'] = dt_obj.strftime("%d/%m/%Y")
-                     except:
-                         pass
-                
-                if not validate_date_not_past(row['DATA_PAGAMENTO']):
-                    errors.append(f"Linha {line_no}: Data no passado ou inválida ({row['DATA_PAGAMENTO']})")
-                
-                # Bank Warning
-                banco = str(row['COD_BANCO']).strip()
-                pix_key = str(row.get('CHAVE_PIX', '')).strip()
-                if not pix_key and banco != '237' and banco != '':
-                    warnings.append(f"Linha {line_no}: Transferência para Banco {banco} (Será gerado como TED). Verifique se é intencional.")
+            df, issues, total_val = upload_cache.validate(digest, df)
+            errors = issue_messages(issues)
+            warnings = issue_messages(issues, SEVERITY_WARNING)
+            # Not cached: the payment history changes with every generation
+            warnings += issue_messages(duplicate_issues(df, get_history_index()), SEVERITY_WARNING)
 
             # --- Dashboard ---
             st.markdown("### 📊 Dashboard de Conferência")
             c1, c2, c3 = st.columns(3)
             c1.metric("Total Registros", len(df))
             c1.metric("Soma Total", f"R$ {total_val:,.2f}")
-            c2.info(f"NSA a ser gerado: {nsa_atual}")
+            c2.info(f"NSA a ser gerado: {nsa_manual or nsa_allocator.peek()}")
+            c3.metric("CPF/CNPJ inválidos", int((issues["rule"] == "documento_invalido").sum()))
             
-            st.dataframe(df)
+            st.caption(f"Leitura ({ingest_stats['format']}): {ingest_stats['rows']} linhas em {ingest_stats['seconds']:.2f}s")
+            st.dataframe(df.drop(columns=[CENTS_COLUMN]))
 
             if warnings:
                 with st.expander("⚠️ Alertas não impeditivos"):
@@ -126,6 +111,8 @@ if uploaded_file:
             if errors:
                 st.error("⛔ Foram encontrados erros impeditivos:")
                 for e in errors: st.write(f"- {e}")
+                with st.expander("Detalhes por linha"):
+                    st.dataframe(issues[issues["severity"] == "error"])
             else:
                 # --- Generation ---
                 if st.button("🚀 Gerar Arquivo Remessa (ANSI)"):
@@ -140,31 +127,91 @@ if uploaded_file:
                     }
                     
                     try:
-                        # Progress bar simulation
-                        my_bar = st.progress(0)
-                        
-                        gen = CNABGenerator(nsa=nsa_atual, empresa_data=empresa_data)
-                        my_bar.progress(50)
-                        
-                        file_bytes = gen.generate(df)
-                        my_bar.progress(100)
-                        
-                        fname = f"CB{datetime.now().strftime('%d%m')}{str(nsa_atual).zfill(2)}.REM"
+                        # Progress bar driven by the generator's stage events
+                        my_bar = st.progress(0, text="Preparando geração...")
                         
-                        st.success(f"Arquivo gerado com sucesso! ({len(file_bytes)} bytes)")
-                        st.download_button(
-                            "💾 Download .REM (Layout 089)",
-                            data=file_bytes,
-                            file_name=fname,
-                            mime="text/plain"
-                        )
+                        n_files = max(1, min(int(n_arquivos), len(df)))
+                        # Committed once the files exist; released (when still the last one) on error
+                        # The index connection of this generation is closed with it
+                        with PaymentIndex() as payment_index, \
+                                nsa_allocator.reserve(n_files, at=nsa_manual) as reservation:
+                            gen = CNABGenerator(nsa=reservation.nsa, empresa_data=empresa_data,
+                                                payment_index=payment_index, observer=progress_observer(my_bar))
+                            if n_files > 1:
+                                manifest = gen.generate_split(df, n_files=n_files)
+                            else:
+                                file_bytes = gen.generate(df, columnar=True)
                         
-                        # Increment NSA
-                        save_config(nsa_atual + 1)
-                        st.info("NSA incrementado para a próxima geração.")
+                        if n_files > 1:
+                            st.success(f"{len(manifest['files'])} arquivos gerados (NSA {reservation.nsa} a {manifest['next_nsa'] - 1}).")
+                            st.dataframe(pd.DataFrame(manifest['files']).drop(columns=["content"]))
+                            for entry in manifest['files']:
+                                st.download_button(
+                                    f"💾 Download {entry['file_name']} (NSA {entry['nsa']})",
+                                    data=entry['content'],
+                                    file_name=entry['file_name'],
+                                    mime="text/plain",
+                                    key=f"download_{entry['nsa']}"
+                                )
+                        else:
+                            fname = remessa_file_name(reservation.nsa)
+                            
+                            st.success(f"Arquivo gerado com sucesso! ({len(file_bytes)} bytes)")
+                            st.download_button(
+                                "💾 Download .REM (Layout 089)",
+                                data=file_bytes,
+                                file_name=fname,
+                                mime="text/plain"
+                            )
+                        st.info(f"Próximo NSA livre: {nsa_allocator.peek()}")
                         
                     except Exception as e:
                         st.error(f"Erro na geração: {str(e)}")
                         st.exception(e)
     except Exception as e:
         st.error(f"Erro ao ler arquivo: {e}")
+
+# --- 3. Retorno ---
+st.markdown("---")
+st.subheader("3. Processar Retorno do Banco")
+retorno_files = st.file_uploader("Carregar arquivos de retorno (.RET)", type=["ret", "txt"], accept_multiple_files=True)
+
+if retorno_files:
+    from src.retorno import process_retorno, merge_summaries, describe_ocorrencia
+    try:
+        summaries = [process_retorno(f, name=f.name) for f in retorno_files]
+        merged = merge_summaries(summaries)
+        totals = merged["totals"]
+        
+        r1, r2, r3 = st.columns(3)
+        r1.metric("Pagos", totals["paid"]["count"], f"R$ {totals['paid']['cents'] / 100:,.2f}")
+        r2.metric("Rejeitados", totals["rejected"]["count"], f"R$ {totals['rejected']['cents'] / 100:,.2f}", delta_color="inverse")
+        r3.metric("Pendentes", totals["pending"]["count"], f"R$ {totals['pending']['cents'] / 100:,.2f}", delta_color="off")
+        
+        rows = []
+        for summary in summaries:
+            for lote in summary["lotes"]:
+                rows.append({
+                    "Arquivo": summary["file"],
+                    "Lote": lote["lote"],
+                    "Pagos": lote["paid"]["count"],
+                    "Valor Pago": lote["paid"]["cents"] / 100,
+                    "Rejeitados": lote["rejected"]["count"],
+                    "Valor Rejeitado": lote["rejected"]["cents"] / 100,
+                    "Pendentes": lote["pending"]["count"],
+                    "Valor Pendente": lote["pending"]["cents"] / 100,
+                })
+        st.dataframe(pd.DataFrame(rows))
+        
+        if merged["ocorrencias"]:
+            with st.expander("Ocorrências"):
+                for code, count in merged["ocorrencias"].items():
+                    st.write(f"{code} - {describe_ocorrencia(code)}: {count}")
+    except Exception as e:
+        st.error(f"Erro ao processar retorno: {e}")
+
+# --- Cache stats (after this run's lookups) ---
+cache_stats = upload_cache.stats()
+cache_panel.write(f"Entradas: {cache_stats['entries']}/{cache_stats['max_entries']}")
+cache_panel.write(f"Acertos: {cache_stats['hits']} | Falhas: {cache_stats['misses']} | Descartes: {cache_stats['evictions']}")
+cache_panel.write(f"Taxa de acerto: {cache_stats['hit_rate']:.0%}")
@@ -0,0 +1,245 @@
+"""
+Benchmarks for ingestion, validation, generation and file checking on
+synthetic payrolls (see synthetic.py).
+
+    python -m benchmarks.bench --sizes 1k,10k,100k --out results.json
+    python -m benchmarks.bench --sizes 1k,10k,100k --baseline results.json
+
+Each stage is timed (best of --repeat runs) and then run once more under
+tracemalloc for its peak Python/NumPy allocation; --no-memory skips that
+second run. Setup work (building the payroll, writing the input files) is
+never measured. With --baseline, stages slower (or hungrier) than the
+baseline by more than --threshold are reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import synthetic_payroll
+from src.generator import CNABGenerator
+from src.instrumentation import JsonLinesLog, Profiler
+from src.reader import read_frames
+from src.upload import read_upload, validate_upload
+from validate_cnab import validate_cnab_file
+
+STAGES = ["ingest_csv", "ingest_xlsx", "validate", "generate", "generate_parallel", "generate_per_row",
+          "validate_file", "parse"]
+
+DEFAULT_SIZES = "1k,10k,100k,1M"
+DEFAULT_THRESHOLD = 0.15
+
+EMPRESA_DATA = {
+    "nome": "EMPRESA BENCHMARK LTDA",
+    "cnpj": "95258174000165",
+    "convenio": "458049",
+    "agencia": "0268",
+    "conta": "559461",
+    "digito_conta": "8",
+    "pix_flag": "PIX",
+}
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    for suffix, factor in (("k", 1000), ("m", 1000000)):
+        if text.endswith(suffix):
+            return int(float(text[:-1]) * factor)
+    return int(text)
+
+def measure(func, repeat: int = 1, memory: bool = True) -> dict:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    result = {"seconds": round(min(times), 4)}
+    if memory:
+        tracemalloc.start()
+        try:
+            func()
+            result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+class Workload:
+    """Inputs of every stage for one payroll size, built once outside the measurements."""
+
+    def __init__(self, rows: int, seed: int, workdir: str):
+        self.rows = rows
+        self.workdir = workdir
+        self.df = synthetic_payroll(rows, seed=seed)
+        self.normalized = validate_upload(self.df)[0]
+        self._paths = {}
+
+    def path(self, kind: str) -> str:
+        if kind not in self._paths:
+            path = os.path.join(self.workdir, f"payroll_{self.rows}.{kind}")
+            if kind == "csv":
+                self.df.to_csv(path, sep=";", index=False)
+            elif kind == "xlsx":
+                self.df.to_excel(path, index=False)
+            elif kind == "rem":
+                with open(path, "wb") as f:
+                    CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).write_to(f, self.normalized, columnar=True)
+            self._paths[kind] = path
+        return self._paths[kind]
+
+def stage_runner(stage: str, work: Workload, observer=None, profiler=None):
+    if stage == "ingest_csv":
+        path = work.path("csv")
+        return lambda: read_upload(path)
+    if stage == "ingest_xlsx":
+        path = work.path("xlsx")
+        return lambda: read_upload(path)
+    if stage == "validate":
+        return lambda: validate_upload(work.df)
+    if stage == "generate":
+        return lambda: CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, observer=observer,
+                                     profiler=profiler).generate(work.normalized, columnar=True)
+    if stage == "generate_parallel":
+        return lambda: CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, observer=observer, profiler=profiler,
+                                     workers=os.cpu_count()).generate(work.normalized, columnar=True)
+    if stage == "generate_per_row":
+        return lambda: CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, observer=observer,
+                                     profiler=profiler).generate(work.normalized)
+    if stage == "validate_file":
+        path = work.path("rem")
+        def run():
+            is_valid, errors, _ = validate_cnab_file(path)
+            if not is_valid:
+                raise RuntimeError(f"Generated file failed validation: {errors[:3]}")
+        return run
+    if stage == "parse":
+        path = work.path("rem")
+        return lambda: read_frames(path)
+    raise ValueError(f"Unknown stage: {stage}")
+
+def skip_reason(stage: str, rows: int, args) -> str:
+    if stage == "ingest_xlsx" and rows > args.xlsx_max_rows:
+        return f"xlsx limited to {args.xlsx_max_rows} rows (--xlsx-max-rows)"
+    if stage == "generate_per_row" and rows > args.per_row_max_rows:
+        return f"per-row generation limited to {args.per_row_max_rows} rows (--per-row-max-rows)"
+    return ""
+
+def run_benchmarks(args) -> dict:
+    sizes = [parse_size(s) for s in args.sizes.split(",") if s.strip()]
+    stages = [s.strip() for s in args.stages.split(",")] if args.stages else STAGES
+    results = []
+    log_stream = open(args.log, "a", encoding="utf-8") if args.log else None
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for rows in sizes:
+                work = Workload(rows, args.seed, workdir)
+                for stage in stages:
+                    reason = skip_reason(stage, rows, args)
+                    if reason:
+                        results.append({"stage": stage, "rows": rows, "skipped": reason})
+                        continue
+                    # Generator stage events go to the log tagged with the benchmark being run
+                    observer = JsonLinesLog(log_stream, benchmark=stage, rows=rows) if log_stream else None
+                    run = stage_runner(stage, work, observer)
+                    result = {"stage": stage, "rows": rows, **measure(run, args.repeat, not args.no_memory)}
+                    result["rows_per_second"] = round(rows / result["seconds"]) if result["seconds"] else None
+                    if args.profile and stage.startswith("generate"):
+                        profiler = Profiler()
+                        stage_runner(stage, work, profiler=profiler)()
+                        result["profile"] = profiler.report()
+                    results.append(result)
+                    if log_stream:
+                        JsonLinesLog(log_stream, kind="result")(result)
+                    print(_format_result(result), file=sys.stderr)
+                del work
+    finally:
+        if log_stream:
+            log_stream.close()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+def _format_result(result: dict) -> str:
+    peak = result.get("peak_bytes")
+    peak_text = f"{peak / 2**20:8.1f} MiB" if peak is not None else "           -"
+    return f"{result['stage']:<18} {result['rows']:>9} rows {result['seconds']:9.3f}s {peak_text}"
+
+def compare(current: dict, baseline: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    """
+    Regressions of current against baseline: one dict per (stage, rows, metric)
+    whose value grew by more than threshold (0.15 = 15%).
+    """
+    base = {(r["stage"], r["rows"]): r for r in baseline["results"] if "skipped" not in r}
+    regressions = []
+    for result in current["results"]:
+        old = base.get((result["stage"], result["rows"]))
+        if old is None or "skipped" in result:
+            continue
+        for metric in ("seconds", "peak_bytes"):
+            if metric not in result or not old.get(metric):
+                continue
+            change = result[metric] / old[metric] - 1
+            if change > threshold:
+                regressions.append({
+                    "stage": result["stage"], "rows": result["rows"], "metric": metric,
+                    "baseline": old[metric], "current": result[metric], "change": round(change, 4),
+                })
+    return regressions
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Payroll sizes, e.g. 1k,10k,100k,1M")
+    parser.add_argument("--stages", help=f"Comma separated subset of: {', '.join(STAGES)}")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage (best is kept)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run")
+    parser.add_argument("--xlsx-max-rows", type=int, default=100000)
+    parser.add_argument("--per-row-max-rows", type=int, default=10000)
+    parser.add_argument("--log", help="Append stage events and results (JSON per line) to this file")
+    parser.add_argument("--profile", action="store_true", help="Add a hot path profile of the generate stages")
+    parser.add_argument("--out", help="Write the results JSON here (default: stdout)")
+    parser.add_argument("--baseline", help="Results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown flagged as a regression (default 0.15)")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    report = run_benchmarks(args)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["baseline"] = {"file": args.baseline, "threshold": args.threshold, "regressions": regressions}
+        for r in regressions:
+            print(f"REGRESSION {r['stage']} {r['rows']} rows {r['metric']}: "
+                  f"{r['baseline']} -> {r['current']} (+{r['change']:.0%})", file=sys.stderr)
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Load test of the local job service (src/service.py) on synthetic payrolls.
+
+    python -m src.service --out /tmp/remessas --config /tmp/loadtest.json --index /tmp/loadtest.db &
+    python -m benchmarks.loadtest --jobs 200 --concurrency 32 --rows 1k --out loadtest.json
+
+Every client submits one payroll (the same synthetic CSV, built once),
+polls its status until the job finishes and downloads the .REM. Submissions
+refused with 503 (queue full) are retried after Retry-After and counted;
+the payroll is only sent once the service accepts it (Expect: 100-continue).
+Reports throughput (jobs finished per second) and p50/p99 latency of the
+submission (POST until 202) and of the whole job (POST until the download
+ends). Run the service with a scratch --config and --index: every job
+takes an NSA and records its payments, as in a deployment. Start it again
+with --no-index to measure what the index costs; the report says which of
+the two ran (from GET /health).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import numpy as np
+
+from benchmarks.bench import parse_size
+from benchmarks.synthetic import synthetic_payroll
+
+DEFAULT_POLL_INTERVAL = 0.05
+
+async def request(host: str, port: int, method: str, path: str, body: bytes = b"") -> tuple:
+    """One HTTP/1.1 request; returns (status, headers, body).
+
+    A body is sent with "Expect: 100-continue", only once the server accepts it.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        expect = "Expect: 100-continue\r\n" if body else ""
+        writer.write(f"{method} {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Length: {len(body)}\r\n"
+                     f"{expect}Connection: close\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        while True:
+            status, headers = await _read_head(reader)
+            if status != 100:
+                break
+            writer.write(body)
+            await writer.drain()
+        return status, headers, await reader.readexactly(int(headers.get("content-length", 0)))
+    finally:
+        writer.close()
+
+async def _read_head(reader: asyncio.StreamReader) -> tuple:
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return status, headers
+
+async def run_job(host: str, port: int, content: bytes, query: str, poll: float) -> dict:
+    start = time.perf_counter()
+    rejected = 0
+    while True:
+        status, headers, body = await request(host, port, "POST", f"/jobs?{query}", content)
+        if status != 503:
+            break
+        rejected += 1
+        await asyncio.sleep(float(headers.get("retry-after", 1)))
+    submitted = time.perf_counter()
+    if status != 202:
+        return {"status": f"http {status}", "rejected": rejected}
+    job_id = json.loads(body)["job"]
+    while True:
+        await asyncio.sleep(poll)
+        job = json.loads((await request(host, port, "GET", f"/jobs/{job_id}"))[2])
+        if job["status"] not in ("queued", "running"):
+            break
+    size = 0
+    if job["status"] == "ok":
+        status, _, data = await request(host, port, "GET", f"/jobs/{job_id}/download")
+        size = len(data) if status == 200 else 0
+    return {"status": job["status"], "rejected": rejected, "submit_seconds": submitted - start,
+            "seconds": time.perf_counter() - start, "bytes": size}
+
+def _percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    p50, p99 = np.percentile(values, [50, 99])
+    return {"p50": round(float(p50), 4), "p99": round(float(p99), 4), "max": round(max(values), 4)}
+
+async def run_load(args) -> dict:
+    content = synthetic_payroll(parse_size(args.rows), args.seed).to_csv(index=False, sep=";").encode("utf-8")
+    query = urlencode({"file_name": "folha.csv"})
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def client():
+        async with semaphore:
+            return await run_job(args.host, args.port, content, query, args.poll)
+
+    health = json.loads((await request(args.host, args.port, "GET", "/health"))[2])
+    start = time.perf_counter()
+    jobs = await asyncio.gather(*(client() for _ in range(args.jobs)))
+    elapsed = time.perf_counter() - start
+
+    statuses = {}
+    for job in jobs:
+        statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+    finished = [job for job in jobs if "seconds" in job]
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "url": f"http://{args.host}:{args.port}",
+            "jobs": args.jobs,
+            "concurrency": args.concurrency,
+            "rows": parse_size(args.rows),
+            "upload_bytes": len(content),
+            "index": health["index"],
+            "processes": health["processes"],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(finished) / elapsed, 4),
+        "statuses": statuses,
+        "rejected": sum(job["rejected"] for job in jobs),
+        "submit_latency": _percentiles([job["submit_seconds"] for job in finished]),
+        "job_latency": _percentiles([job["seconds"] for job in finished]),
+    }
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--jobs", type=int, default=100, help="Payrolls submitted in total")
+    parser.add_argument("--concurrency", type=int, default=16, help="Clients submitting at the same time")
+    parser.add_argument("--rows", default="1k", help="Payments per payroll, e.g. 1k")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--poll", type=float, default=DEFAULT_POLL_INTERVAL, help="Seconds between status polls")
+    parser.add_argument("--out", help="Write the results JSON here (default: stdout)")
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    report = asyncio.run(run_load(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0 if set(report["statuses"]) <= {"ok"} else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,151 @@
+"""
+Seeded synthetic payrolls in the upload template format.
+
+Payees are drawn from a population about a third of the payroll size, so
+names, documents, banks and Pix keys repeat the way they do in real payrolls
+(the same employee paid several times, popular names, a few big banks).
+The same (rows, seed, base_date) always produces the same frame.
+"""
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from src.ingest import TEMPLATE_COLUMNS
+from src.validators import sanitize_text
+
+FIRST_NAMES = [
+    "JOSE", "MARIA", "ANA", "JOAO", "ANTONIO", "FRANCISCO", "CARLOS", "PAULO", "PEDRO", "LUCAS",
+    "LUIZ", "MARCOS", "LUIS", "GABRIEL", "RAFAEL", "FRANCISCA", "DANIEL", "MARCELO", "BRUNO", "EDUARDO",
+    "JULIANA", "ADRIANA", "MÁRCIA", "FERNANDA", "PATRÍCIA", "ALINE", "SANDRA", "CAMILA", "AMANDA", "CONCEIÇÃO",
+]
+LAST_NAMES = [
+    "SILVA", "SANTOS", "OLIVEIRA", "SOUZA", "RODRIGUES", "FERREIRA", "ALVES", "PEREIRA", "LIMA", "GOMES",
+    "COSTA", "RIBEIRO", "MARTINS", "CARVALHO", "ALMEIDA", "LOPES", "SOARES", "FERNANDES", "VIEIRA", "BARBOSA",
+    "ROCHA", "DIAS", "NASCIMENTO", "ANDRADE", "MOREIRA", "NUNES", "MARQUES", "MACHADO", "MENDES", "D'ÁVILA",
+]
+COMPANY_SUFFIXES = ["LTDA", "ME", "EIRELI", "S.A.", "SERVICOS LTDA", "COMERCIO E SERVICOS"]
+
+# Bank of the payee account: Bradesco (237) is paid as CC, the rest as TED
+BANKS = ["237", "341", "001", "104", "033", "260", "077", "0104"]
+BANK_WEIGHTS = [0.30, 0.20, 0.15, 0.12, 0.08, 0.08, 0.05, 0.02]
+
+PIX_KEY_TYPES = ["CPF", "Email", "Telefone", "Aleatoria", ""] # '' = key without a type
+PIX_KEY_WEIGHTS = [0.40, 0.25, 0.20, 0.12, 0.03]
+
+def _zipf_choice(rng, n_items: int, size: int, a: float = 1.2) -> np.ndarray:
+    """Indices in [0, n_items) where low indices are much more frequent."""
+    weights = 1.0 / np.arange(1, n_items + 1) ** a
+    return rng.choice(n_items, size=size, p=weights / weights.sum())
+
+def _check_digits(digits: np.ndarray, weights: list) -> np.ndarray:
+    total = (digits[:, :len(weights)] * np.array(weights)).sum(axis=1)
+    rest = total % 11
+    return np.where(rest < 2, 0, 11 - rest)
+
+def _digits_text(digits: np.ndarray) -> np.ndarray:
+    return np.array(["".join(map(str, row)) for row in digits], dtype=object)
+
+def random_cpfs(rng, size: int) -> np.ndarray:
+    """Valid CPFs (11 digits, correct check digits)."""
+    digits = np.zeros((size, 11), dtype=np.int64)
+    digits[:, :9] = rng.integers(0, 10, size=(size, 9))
+    digits[:, 9] = _check_digits(digits, list(range(10, 1, -1)))
+    digits[:, 10] = _check_digits(digits, list(range(11, 1, -1)))
+    return _digits_text(digits)
+
+def random_cnpjs(rng, size: int) -> np.ndarray:
+    """Valid CNPJs (14 digits, branch 0001, correct check digits)."""
+    digits = np.zeros((size, 14), dtype=np.int64)
+    digits[:, :8] = rng.integers(0, 10, size=(size, 8))
+    digits[:, 8:12] = [0, 0, 0, 1]
+    digits[:, 12] = _check_digits(digits, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    digits[:, 13] = _check_digits(digits, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    return _digits_text(digits)
+
+def _format_cpf(cpf: str) -> str:
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+def _format_cnpj(cnpj: str) -> str:
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+def _population(rng, size: int, pix_share: float, company_share: float) -> pd.DataFrame:
+    first = np.array(FIRST_NAMES, dtype=object)[_zipf_choice(rng, len(FIRST_NAMES), size)]
+    last = np.array(LAST_NAMES, dtype=object)[_zipf_choice(rng, len(LAST_NAMES), size)]
+    last2 = np.array(LAST_NAMES, dtype=object)[rng.integers(0, len(LAST_NAMES), size)]
+    names = first + " " + last + " " + last2
+
+    is_company = rng.random(size) < company_share
+    cpfs = random_cpfs(rng, size)
+    cnpjs = random_cnpjs(rng, int(is_company.sum()))
+    documents = cpfs.copy()
+    documents[is_company] = cnpjs
+    names[is_company] = last[is_company] + " " + np.array(COMPANY_SUFFIXES, dtype=object)[
+        rng.integers(0, len(COMPANY_SUFFIXES), int(is_company.sum()))]
+
+    # Mix of typed formats, as pasted from other systems
+    style = rng.integers(0, 3, size)
+    shown = documents.copy()
+    for i in np.flatnonzero(style == 1):
+        shown[i] = _format_cnpj(documents[i]) if is_company[i] else _format_cpf(documents[i])
+    lost_zero = (style == 2) & np.array([d.startswith("0") for d in documents])
+    shown[lost_zero] = [d[1:] for d in documents[lost_zero]] # Leading zero lost by Excel
+
+    bank = np.array(BANKS, dtype=object)[rng.choice(len(BANKS), size=size, p=BANK_WEIGHTS)]
+    agencia = rng.integers(1, 9999, size).astype(str).astype(object)
+    with_dv = rng.random(size) < 0.2
+    agencia[with_dv] = agencia[with_dv] + "-" + rng.integers(0, 10, int(with_dv.sum())).astype(str).astype(object)
+    conta = rng.integers(100, 9999999, size).astype(str).astype(object)
+    digito = rng.integers(0, 10, size).astype(str).astype(object)
+
+    key_type = np.full(size, "", dtype=object)
+    key = np.full(size, "", dtype=object)
+    is_pix = rng.random(size) < pix_share
+    types = np.array(PIX_KEY_TYPES, dtype=object)[rng.choice(len(PIX_KEY_TYPES), size=size, p=PIX_KEY_WEIGHTS)]
+    for i in np.flatnonzero(is_pix):
+        kind = types[i]
+        key_type[i] = kind
+        if kind == "CPF":
+            # The key as registered in the DICT: never missing its leading zero
+            key[i] = _format_cnpj(documents[i]) if is_company[i] else documents[i] if lost_zero[i] else shown[i]
+        elif kind == "Email":
+            key[i] = f"{sanitize_text(first[i]).lower()}.{sanitize_text(last[i]).lower()}{i}@exemplo.com.br"
+        elif kind == "Telefone":
+            key[i] = f"+55 ({rng.integers(1, 10)}{rng.integers(1, 10)}) 9{rng.integers(1000, 9999)}-{rng.integers(1000, 9999)}"
+        elif kind == "Aleatoria":
+            key[i] = "%08x-%04x-4%03x-%04x-%012x" % tuple(int(v) for v in (
+                rng.integers(0, 2**32), rng.integers(0, 2**16), rng.integers(0, 2**12),
+                rng.integers(0x8000, 0xC000), rng.integers(0, 2**48)))
+        else:
+            key[i] = f"chave{i}@exemplo.com.br"
+
+    return pd.DataFrame({
+        "NOME_FAVORECIDO": names,
+        "CPF_CNPJ": shown,
+        "COD_BANCO": bank,
+        "AGENCIA": agencia,
+        "CONTA": conta,
+        "DIGITO_CONTA": digito,
+        "TIPO_CHAVE_PIX": key_type,
+        "CHAVE_PIX": key,
+    })
+
+def synthetic_payroll(rows: int, seed: int = 0, pix_share: float = 0.45, company_share: float = 0.1,
+                      base_date: date = None) -> pd.DataFrame:
+    """
+    Payroll frame of strings with TEMPLATE_COLUMNS, as read_upload returns it.
+    Payment dates fall in the 30 days after base_date (default: tomorrow).
+    """
+    rng = np.random.default_rng(seed)
+    population = _population(rng, max(1, rows // 3), pix_share, company_share)
+    df = population.iloc[_zipf_choice(rng, len(population), rows, a=0.5)].reset_index(drop=True)
+
+    # Salaries: log-normal around R$ 2.500, written like Excel does (no trailing zeros)
+    cents = np.maximum(1, np.round(rng.lognormal(np.log(2500), 0.8, rows) * 100)).astype(np.int64)
+    values = pd.Series(cents / 100).map(repr).str.replace(r"\.0$", "", regex=True)
+    df["VALOR_PAGAMENTO"] = values.to_numpy(dtype=object)
+
+    base = base_date or date.today() + timedelta(days=1)
+    days = [(base + timedelta(days=d)).strftime("%d/%m/%Y") for d in range(30)]
+    df["DATA_PAGAMENTO"] = np.array(days, dtype=object)[rng.integers(0, 30, rows)]
+    df["DESCRICAO"] = np.array(["SALARIO", "FERIAS", "13 SALARIO", "REEMBOLSO"], dtype=object)[
+        rng.choice(4, size=rows, p=[0.8, 0.08, 0.07, 0.05])]
+    return df[TEMPLATE_COLUMNS].astype(str)
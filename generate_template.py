@@ -1,21 +1,10 @@
 import pandas as pd
 import os
+from src.ingest import TEMPLATE_COLUMNS
 
 def create_template():
-    # Columns strictly as requested
-    columns = [
-        "NOME_FAVORECIDO",
-        "CPF_CNPJ",
-        "COD_BANCO",
-        "AGENCIA",
-        "CONTA",
-        "DIGITO_CONTA",
-        "VALOR_PAGAMENTO",
-        "DATA_PAGAMENTO",
-        "TIPO_CHAVE_PIX", # Email, CPF, Telefone, Aleatoria
-        "CHAVE_PIX",
-        "DESCRICAO" # Optional description
-    ]
+    # Columns strictly as requested (also the only columns read from uploads)
+    columns = TEMPLATE_COLUMNS
     
     df = pd.DataFrame(columns=columns)
     
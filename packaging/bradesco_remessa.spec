@@ -26,6 +26,8 @@ tmp_ret = collect_all('streamlit')
 datas += tmp_ret[0]
 binaries = tmp_ret[1]
 hiddenimports = tmp_ret[2]
+# Imported lazily by src/ingest.py for Parquet uploads
+hiddenimports += ['pyarrow.parquet']
 
 # Add other dependencies metadata
 datas += safe_copy_metadata('tqdm')
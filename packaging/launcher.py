@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 import streamlit.web.cli as stcli
 
 import traceback
@@ -12,6 +13,8 @@ def resolve_path(path):
     return os.path.join(basedir, path)
 
 if __name__ == "__main__":
+    # Split generation runs on a process pool: required for frozen Windows builds
+    multiprocessing.freeze_support()
     try:
         print("Initializing Bradesco Remessa App...")
         # Point to the internal app.py
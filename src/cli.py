@@ -0,0 +1,313 @@
+"""
+Headless remessa generation, without Streamlit.
+
+    python -m src.cli generate input.xlsx [more.xlsx "folder/*.xlsx"] --out DIR
+    python -m src.cli retorno "retornos/*.RET"
+    python -m src.cli consulta --cpf 12345678909 --de 2026-03-01 --ate 2026-03-31
+    python -m src.cli append remessas/aberta extra.xlsx --out DIR
+
+generate: each input reserves the next NSA of config.json (the first one
+from --nsa when given), so parallel runs never share an NSA. A
+JSON summary is printed on stdout; the exit code is 0 when every input was
+generated, 1 when any input was rejected or failed, 2 on usage errors.
+Payments repeated in the input or already in the payment index are reported
+as warnings (see duplicates.py).
+retorno: prints the paid / rejected / pending totals of each return file.
+consulta: looks payments up in the local payment index (payments.db).
+append: adds late payments to an open remessa (see incremental.py), started
+with the next NSA on first use, and updates its .REM in --out (only the
+bytes from the first changed lote on are rewritten, see incremental.py).
+Heavy modules (pandas, the generator) are imported only when a command runs.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+
+def _expand_inputs(patterns):
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for path in matches:
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+def _generate_one(path, nsa, empresa_data, out_dir, payment_index=None, log_stream=None, profile=False, workers=1):
+    from .generator import CNABGenerator, remessa_file_name
+    from .records import PaymentRecords
+    from .upload import (read_upload, missing_columns, validate_upload, duplicate_issues,
+                         issue_messages, SEVERITY_WARNING)
+    from .instrumentation import JsonLinesLog, Profiler
+
+    result = {"input": path, "nsa": None, "status": "ok"}
+    try:
+        ingest_stats = {}
+        df = read_upload(path, stats=ingest_stats)
+    except Exception as e:
+        result.update(status="error", errors=[f"Erro ao ler arquivo: {e}"])
+        return result
+
+    result["ingest"] = ingest_stats
+    missing = missing_columns(df)
+    if missing:
+        result.update(status="invalid", errors=[f"Colunas faltando na planilha: {', '.join(missing)}"])
+        return result
+
+    df, issues, total_val = validate_upload(df)
+    errors = issue_messages(issues)
+    duplicates = duplicate_issues(df, payment_index)
+    result.update(payments=len(df), valor_total=round(total_val, 2), duplicates=len(duplicates),
+                  warnings=issue_messages(issues, SEVERITY_WARNING) + issue_messages(duplicates, SEVERITY_WARNING))
+    if errors:
+        result.update(status="invalid", errors=errors)
+        return result
+
+    try:
+        # Compact payments from here on: the DataFrame is released before rendering
+        records = PaymentRecords.from_frame(df)
+        del df
+        observer = JsonLinesLog(log_stream, input=path) if log_stream is not None else None
+        profiler = Profiler() if profile else None
+        gen = CNABGenerator(nsa=nsa, empresa_data=empresa_data, payment_index=payment_index,
+                            observer=observer, profiler=profiler, workers=workers)
+        output = os.path.join(out_dir, remessa_file_name(nsa))
+        size = gen.write_file(output, records)
+    except Exception as e:
+        result.update(status="error", errors=[f"Erro na geração: {e}"])
+        return result
+
+    result.update(nsa=nsa, output=output, bytes=size, lotes=gen.lotes_count,
+                  registros=gen.registros_count + 1)
+    if profiler is not None:
+        result["profile"] = profiler.report()
+    return result
+
+def cmd_generate(args) -> int:
+    from .config import load_config, empresa_from_config, NSAAllocator
+
+    inputs = _expand_inputs(args.inputs)
+    if not inputs:
+        print(json.dumps({"error": "Nenhum arquivo de entrada encontrado"}), file=sys.stderr)
+        return 2
+
+    config = load_config(args.config)
+    allocator = None if args.no_save_nsa else NSAAllocator(args.config)
+    empresa_data = empresa_from_config(config, pix_flag=not args.no_pix)
+    for key in ("nome", "cnpj", "convenio", "agencia", "conta", "digito_conta"):
+        value = getattr(args, key)
+        if value is not None:
+            empresa_data[key] = value
+
+    os.makedirs(args.out, exist_ok=True)
+    nsa = args.nsa if args.nsa is not None else config.get("nsa", 1)
+    at = args.nsa
+
+    payment_index = None
+    if not args.no_index:
+        from .payment_index import PaymentIndex
+        payment_index = PaymentIndex(args.index)
+
+    log_stream = None
+    if args.log:
+        log_stream = sys.stderr if args.log == "-" else open(args.log, "a", encoding="utf-8")
+
+    results = []
+    try:
+        for path in inputs:
+            reservation = None
+            if allocator is not None:
+                try:
+                    reservation = allocator.reserve(1, at=at)
+                except ValueError as e:
+                    results.append({"input": path, "nsa": None, "status": "error", "errors": [str(e)]})
+                    continue
+                nsa = reservation.nsa
+            result = _generate_one(path, nsa, empresa_data, args.out, payment_index, log_stream, args.profile,
+                                   args.workers)
+            results.append(result)
+            if result["status"] == "ok":
+                nsa += 1
+                at = None
+                if reservation is not None:
+                    reservation.commit()
+            elif reservation is not None:
+                reservation.release()
+    finally:
+        if payment_index is not None:
+            payment_index.close()
+        if log_stream is not None and log_stream is not sys.stderr:
+            log_stream.close()
+
+    if allocator is not None:
+        nsa = allocator.peek()
+
+    failed = sum(1 for r in results if r["status"] != "ok")
+    summary = {"files": results, "ok": len(results) - failed, "failed": failed, "next_nsa": nsa}
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+def cmd_append(args) -> int:
+    from .config import load_config, empresa_from_config, NSAAllocator
+    from .generator import remessa_file_name
+    from .incremental import IncrementalRemessa, STATE_FILE
+    from .upload import read_upload, missing_columns, validate_upload, issue_messages
+
+    inputs = _expand_inputs(args.inputs)
+    if not inputs:
+        print(json.dumps({"error": "Nenhum arquivo de entrada encontrado"}), file=sys.stderr)
+        return 2
+
+    if os.path.exists(os.path.join(args.remessa, STATE_FILE)):
+        remessa = IncrementalRemessa.open(args.remessa)
+    else:
+        config = load_config(args.config)
+        empresa_data = empresa_from_config(config, pix_flag=not args.no_pix)
+        if args.no_save_nsa:
+            nsa = args.nsa if args.nsa is not None else config.get("nsa", 1)
+            remessa = IncrementalRemessa.create(args.remessa, nsa, empresa_data)
+        else:
+            try:
+                reservation = NSAAllocator(args.config).reserve(1, at=args.nsa)
+            except ValueError as e:
+                print(json.dumps({"error": str(e)}, ensure_ascii=False), file=sys.stderr)
+                return 2
+            with reservation:
+                remessa = IncrementalRemessa.create(args.remessa, reservation.nsa, empresa_data)
+
+    payment_index = None
+    if not args.no_index:
+        from .payment_index import PaymentIndex
+        payment_index = PaymentIndex(args.index)
+
+    results = []
+    try:
+        for path in inputs:
+            result = {"input": path, "status": "ok"}
+            try:
+                df = read_upload(path)
+                missing = missing_columns(df)
+                if missing:
+                    result.update(status="invalid", errors=[f"Colunas faltando na planilha: {', '.join(missing)}"])
+                else:
+                    df, issues, _ = validate_upload(df)
+                    errors = issue_messages(issues)
+                    if errors:
+                        result.update(status="invalid", errors=errors)
+                    else:
+                        remessa.append(df, payment_index=payment_index)
+                        result["payments"] = len(df)
+            except Exception as e:
+                result.update(status="error", errors=[f"Erro ao adicionar: {e}"])
+            results.append(result)
+    finally:
+        if payment_index is not None:
+            payment_index.close()
+
+    os.makedirs(args.out, exist_ok=True)
+    output = os.path.join(args.out, remessa_file_name(remessa.nsa))
+    size = remessa.write_file(output)
+
+    failed = sum(1 for r in results if r["status"] != "ok")
+    summary = {"files": results, "ok": len(results) - failed, "failed": failed,
+               "output": output, "bytes": size, **remessa.summary()}
+    json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+def cmd_retorno(args) -> int:
+    from .retorno import process_retorno, merge_summaries
+
+    inputs = _expand_inputs(args.inputs)
+    if not inputs:
+        print(json.dumps({"error": "Nenhum arquivo de retorno encontrado"}), file=sys.stderr)
+        return 2
+
+    summaries = []
+    failed = []
+    for path in inputs:
+        try:
+            summaries.append(process_retorno(path))
+        except Exception as e:
+            failed.append({"file": path, "error": str(e)})
+
+    result = {"files": summaries, "failed": failed, "totals": merge_summaries(summaries)}
+    json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 1 if failed else 0
+
+def cmd_consulta(args) -> int:
+    from .payment_index import PaymentIndex
+
+    if not args.cpf and not args.seu_numero:
+        print(json.dumps({"error": "Informe --cpf ou --seu-numero"}), file=sys.stderr)
+        return 2
+
+    with PaymentIndex(args.index) as index:
+        if args.seu_numero:
+            rows = index.find_by_seu_numero(args.seu_numero, args.nsa)
+        else:
+            rows = index.find_by_document(args.cpf, args.de, args.ate)
+
+    json.dump({"payments": rows, "count": len(rows)}, sys.stdout, ensure_ascii=False, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="Gerador de Remessa CNAB 240 Bradesco (sem interface)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    gen = sub.add_parser("generate", help="Gera arquivos .REM a partir de planilhas preenchidas")
+    gen.add_argument("inputs", nargs="+", help="Planilhas (.xlsx, .csv, .parquet) ou padrões glob")
+    gen.add_argument("--out", required=True, help="Diretório de saída dos arquivos .REM")
+    gen.add_argument("--config", default="config.json", help="Arquivo de configuração (NSA e dados da empresa)")
+    gen.add_argument("--nsa", type=int, help="NSA inicial (padrão: o do config.json)")
+    gen.add_argument("--no-save-nsa", action="store_true", help="Não reserva o NSA no config.json (usa --nsa ou o atual sem avançá-lo)")
+    gen.add_argument("--no-pix", action="store_true", help="Não marca o header do arquivo como PIX")
+    gen.add_argument("--index", default="payments.db", help="Índice local de pagamentos (SQLite)")
+    gen.add_argument("--no-index", action="store_true", help="Não registra os pagamentos no índice")
+    gen.add_argument("--log", help="Grava os eventos de cada etapa (JSON por linha) neste arquivo; '-' = stderr")
+    gen.add_argument("--profile", action="store_true", help="Inclui no resumo o tempo gasto em cada função crítica")
+    gen.add_argument("--workers", type=int, default=1, help="Processos que geram os lotes em paralelo (padrão: 1)")
+    gen.add_argument("--nome", help="Razão social")
+    gen.add_argument("--cnpj", help="CNPJ da empresa")
+    gen.add_argument("--convenio", help="Código do convênio")
+    gen.add_argument("--agencia", help="Agência (sem dígito)")
+    gen.add_argument("--conta", help="Conta (sem dígito)")
+    gen.add_argument("--digito-conta", dest="digito_conta", help="Dígito da conta")
+    gen.set_defaults(func=cmd_generate)
+
+    app = sub.add_parser("append", help="Adiciona pagamentos a uma remessa aberta e atualiza o .REM")
+    app.add_argument("remessa", help="Diretório da remessa aberta (criado no primeiro uso)")
+    app.add_argument("inputs", nargs="+", help="Planilhas (.xlsx, .csv, .parquet) ou padrões glob")
+    app.add_argument("--out", required=True, help="Diretório de saída do arquivo .REM")
+    app.add_argument("--config", default="config.json", help="Arquivo de configuração (NSA e dados da empresa)")
+    app.add_argument("--nsa", type=int, help="NSA da nova remessa (padrão: o do config.json)")
+    app.add_argument("--no-save-nsa", action="store_true", help="Não reserva o NSA no config.json (usa --nsa ou o atual sem avançá-lo)")
+    app.add_argument("--no-pix", action="store_true", help="Não marca o header do arquivo como PIX")
+    app.add_argument("--index", default="payments.db", help="Índice local de pagamentos (SQLite)")
+    app.add_argument("--no-index", action="store_true", help="Não registra os pagamentos no índice")
+    app.set_defaults(func=cmd_append)
+
+    ret = sub.add_parser("retorno", help="Resume arquivos de retorno (.RET) do banco")
+    ret.add_argument("inputs", nargs="+", help="Arquivos .RET ou padrões glob")
+    ret.set_defaults(func=cmd_retorno)
+
+    con = sub.add_parser("consulta", help="Consulta pagamentos já enviados no índice local")
+    con.add_argument("--index", default="payments.db", help="Índice local de pagamentos (SQLite)")
+    con.add_argument("--cpf", help="CPF/CNPJ do favorecido")
+    con.add_argument("--de", help="Data de pagamento inicial (AAAA-MM-DD)")
+    con.add_argument("--ate", help="Data de pagamento final (AAAA-MM-DD)")
+    con.add_argument("--seu-numero", dest="seu_numero", help="Seu Número (n_doc_empresa)")
+    con.add_argument("--nsa", type=int, help="NSA da remessa (com --seu-numero)")
+    con.set_defaults(func=cmd_consulta)
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -168,3 +168,103 @@ TRAILER_ARQUIVO = {
     "qtd_contas": (30, 35, PadType.ZERO_LEFT, "0"),
     "cnab_vazio_2": (36, 240, PadType.SPACE_RIGHT, "")
 }
+
+# --- Retorno ---
+# Fields the bank writes over a Segmento A (TED/CC or Pix) in the return file:
+# positions 231-240 (cod_finalidade_doc / cod_finalidade_ted, reservado_banco_fix
+# in Pix) carry up to five 2-char occurrence codes. The other fields read back
+# sit at the same positions in both Segmento A layouts.
+RETORNO_SEGMENTO_A = {
+    "ocorrencias": (231, 240, PadType.SPACE_RIGHT, "")
+}
+
+
+# --- Render Plans ---
+# Each layout is compiled once at import into a LayoutPlan: a 240-char template
+# with every default already formatted in place, plus the slot of each field.
+# Per set of fields a caller supplies, the template is cut once into merged
+# constant runs and those fields' slots, so rendering a line only pads the
+# supplied values and joins them with the constant runs.
+
+RECORD_LENGTH = 240
+
+
+class LayoutPlan:
+    __slots__ = ("layout", "template", "slots", "_bound")
+
+    def __init__(self, layout: dict):
+        self.layout = layout
+        self.slots = {}
+        pieces = []
+        current_pos = 1
+
+        for field_name, spec in sorted(layout.items(), key=lambda item: item[1][0]):
+            start, end, pad_type, default = spec
+            if start != current_pos:
+                raise ValueError(
+                    f"Layout field '{field_name}' starts at {start}, expected {current_pos}"
+                )
+            if end < start:
+                raise ValueError(f"Layout field '{field_name}' ends before it starts ({start}-{end})")
+            length = end - start + 1
+            zero_left = pad_type == PadType.ZERO_LEFT
+            self.slots[field_name] = (start - 1, length, zero_left, default)
+            pieces.append(_pad(default, length, zero_left))
+            current_pos = end + 1
+
+        if current_pos - 1 != RECORD_LENGTH:
+            raise ValueError(f"Layout covers {current_pos - 1} characters, expected {RECORD_LENGTH}")
+
+        self.template = "".join(pieces)
+        self._bound = {} # field names of a call site -> _bind()
+
+    def _bind(self, fields: tuple):
+        # The template cut around the given fields: constant runs merged into
+        # one piece each, plus (piece index, name, length, zero_left) per field
+        variable = sorted((self.slots[name][:3], name) for name in fields if name in self.slots)
+        pieces = []
+        targets = []
+        pos = 0
+        for (start, length, zero_left), name in variable:
+            if start > pos:
+                pieces.append(self.template[pos:start])
+            targets.append((len(pieces), name, length, zero_left))
+            pieces.append(self.template[start:start + length])
+            pos = start + length
+        if pos < RECORD_LENGTH:
+            pieces.append(self.template[pos:])
+        bound = self._bound[fields] = (pieces, targets)
+        return bound
+
+    def render(self, data: dict) -> str:
+        """Renders one 240-char line, writing the given fields into the template."""
+        fields = tuple(data)
+        pieces, targets = self._bound.get(fields) or self._bind(fields)
+        pieces = pieces.copy()
+        for index, name, length, zero_left in targets:
+            value = data[name]
+            if value is None or value == "":
+                continue # Field default, already in the template
+            value = str(value)[:length]
+            pieces[index] = value.zfill(length) if zero_left else value.ljust(length)
+        return "".join(pieces)
+
+
+def _pad(val_str: str, length: int, zero_left: bool) -> str:
+    if len(val_str) > length:
+        val_str = val_str[:length]
+    return val_str.zfill(length) if zero_left else val_str.ljust(length)
+
+
+def compile_layout(layout: dict) -> LayoutPlan:
+    """Compiles a layout dict into a LayoutPlan, validating it covers 240 chars."""
+    return LayoutPlan(layout)
+
+
+HEADER_ARQUIVO_PLAN = compile_layout(HEADER_ARQUIVO)
+HEADER_LOTE_PLAN = compile_layout(HEADER_LOTE)
+SEGMENTO_A_PLAN = compile_layout(SEGMENTO_A)
+SEGMENTO_A_PIX_PLAN = compile_layout(SEGMENTO_A_PIX)
+SEGMENTO_B_PLAN = compile_layout(SEGMENTO_B)
+TRAILER_LOTE_PLAN = compile_layout(TRAILER_LOTE)
+TRAILER_ARQUIVO_PLAN = compile_layout(TRAILER_ARQUIVO)
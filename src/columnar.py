@@ -0,0 +1,35 @@
+"""
+Column helpers shared by the columnar renderer (records.py), the per-row
+path of CNABGenerator and duplicate detection: forma_lancamento of every
+payment at once, optional columns and payment dates.
+"""
+import re
+import numpy as np
+import pandas as pd
+from .validators import clean_non_digits, map_unique
+
+CAMARA_BY_FORMA = {'45': '009', '41': '018'}
+
+# 2026-12-31 (optionally with a time): year first, whatever dayfirst says
+_ISO_DATE_RE = re.compile(r"\d{4}-\d{1,2}-\d{1,2}")
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df.columns:
+        return df[name]
+    return pd.Series([''] * len(df), index=df.index, dtype=object)
+
+
+def classify_forma(df: pd.DataFrame) -> pd.Series:
+    """Vectorized forma_lancamento: 45=Pix, 01=Credit Account (237), 41=TED."""
+    pix_k = map_unique(_column(df, 'CHAVE_PIX'), lambda v: str(v).strip())
+    is_pix = (pix_k != '') & (pix_k.str.lower() != 'nan')
+    banco = map_unique(_column(df, 'COD_BANCO'), lambda v: clean_non_digits(str(v)))
+    forma = np.where(is_pix, '45', np.where(banco == '237', '01', '41'))
+    return pd.Series(forma, index=df.index, dtype=object)
+
+
+def _format_date(value) -> str:
+    # DDMMAAAA; day first unless ISO (pandas warns when dayfirst meets an ISO date)
+    dayfirst = _ISO_DATE_RE.match(str(value).strip()) is None
+    return pd.to_datetime(value, dayfirst=dayfirst).strftime("%d%m%Y")
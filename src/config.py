@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+# --- Config & Persistence ---
+CONFIG_FILE = "config.json"
+
+# Sidecar file locked around every read-modify-write of the config
+LOCK_SUFFIX = ".lock"
+
+# Company profile used when config.json does not define it
+EMPRESA_DEFAULTS = {
+    "nome_empresa": "DCS-CL CONSTRUTORA E PAVIMENTADORA LTDA",
+    "cnpj": "95258174000165",
+    "convenio": "458049",
+    "agencia": "0268",
+    "conta": "559461",
+    "digito_conta": "8",
+}
+
+def load_config(path: str = CONFIG_FILE) -> dict:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            return json.load(f)
+    return {"nsa": 1}
+
+def save_config(nsa: int, path: str = CONFIG_FILE):
+    # Keeps any other key already stored next to the NSA
+    with locked_config(path) as config:
+        config["nsa"] = nsa
+
+# --- Locking ---
+
+_thread_locks = {}
+_thread_locks_guard = threading.Lock()
+
+def _thread_lock(path: str) -> threading.Lock:
+    # File locks are per process on some platforms: threads also queue on this one
+    with _thread_locks_guard:
+        return _thread_locks.setdefault(os.path.abspath(path), threading.Lock())
+
+@contextmanager
+def _file_lock(path: str):
+    with _thread_lock(path), open(path + LOCK_SUFFIX, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _write_atomic(path: str, config: dict):
+    # Readers see the old or the new file, never a partial one
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(config, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+@contextmanager
+def locked_config(path: str = CONFIG_FILE):
+    """Read-modify-write of the config under an exclusive lock (threads and processes)."""
+    with _file_lock(path):
+        config = load_config(path)
+        yield config
+        _write_atomic(path, config)
+
+# --- NSA sequence ---
+
+class NSAReservation:
+    """
+    NSAs taken from the sequence by NSAAllocator.reserve(). commit() once the
+    files are generated; release() gives them back when nothing was reserved
+    after them (otherwise they are skipped: banks accept gaps, not repeats).
+    As a context manager it commits on success and releases on error.
+    """
+
+    def __init__(self, allocator: "NSAAllocator", nsa: int, count: int):
+        self.allocator = allocator
+        self.nsa = nsa
+        self.count = count
+        self.done = False
+
+    @property
+    def nsas(self) -> range:
+        return range(self.nsa, self.nsa + self.count)
+
+    def commit(self):
+        if not self.done:
+            self.allocator._finish(self, release=False)
+            self.done = True
+
+    def release(self):
+        if not self.done:
+            self.allocator._finish(self, release=True)
+            self.done = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.release()
+
+class NSAAllocator:
+    """
+    NSA sequence stored in the config file ("nsa" = next free NSA), safe to
+    share between threads, processes and Streamlit sessions:
+        with NSAAllocator().reserve(3) as reservation:
+            generate(nsa=reservation.nsa ...)  # NSAs reservation.nsas are exclusive to this run
+    Open reservations are recorded under "nsa_reservas" until committed or released.
+    """
+
+    def __init__(self, path: str = CONFIG_FILE):
+        self.path = path
+
+    def peek(self) -> int:
+        """Next free NSA (may be taken by someone else before it is reserved)."""
+        return load_config(self.path).get("nsa", 1)
+
+    def reserve(self, count: int = 1, at: int = None) -> NSAReservation:
+        """
+        Takes count consecutive NSAs: the next free ones, or from at (which
+        must not be below the next free NSA; the NSAs skipped become gaps).
+        """
+        if count < 1:
+            raise ValueError("count must be at least 1")
+        with locked_config(self.path) as config:
+            start = config.get("nsa", 1)
+            if at is not None:
+                if at < start:
+                    raise ValueError(f"NSA {at} já utilizado ou reservado; próximo livre: {start}")
+                start = at
+            config["nsa"] = start + count
+            config.setdefault("nsa_reservas", {})[str(start)] = {
+                "count": count, "pid": os.getpid(), "at": datetime.now().isoformat(timespec="seconds"),
+            }
+        return NSAReservation(self, start, count)
+
+    def _finish(self, reservation: NSAReservation, release: bool):
+        with locked_config(self.path) as config:
+            config.get("nsa_reservas", {}).pop(str(reservation.nsa), None)
+            if release and config.get("nsa") == reservation.nsa + reservation.count:
+                config["nsa"] = reservation.nsa
+            if not config.get("nsa_reservas"):
+                config.pop("nsa_reservas", None)
+
+def empresa_from_config(config: dict, pix_flag: bool = True) -> dict:
+    """Builds the empresa_data dict expected by CNABGenerator."""
+    return {
+        "nome": config.get("nome_empresa", EMPRESA_DEFAULTS["nome_empresa"]),
+        "cnpj": config.get("cnpj", EMPRESA_DEFAULTS["cnpj"]),
+        "convenio": config.get("convenio", EMPRESA_DEFAULTS["convenio"]),
+        "agencia": config.get("agencia", EMPRESA_DEFAULTS["agencia"]),
+        "conta": config.get("conta", EMPRESA_DEFAULTS["conta"]),
+        "digito_conta": config.get("digito_conta", EMPRESA_DEFAULTS["digito_conta"]),
+        "pix_flag": "PIX" if pix_flag else ""
+    }
@@ -0,0 +1,170 @@
+"""
+Duplicate payment detection, inside an upload and against every remessa
+already generated (the payment index).
+
+A payment is identified by a 64-bit hash of its normalized key:
+    CPF/CNPJ | cents | payment date | Pix key, or bank/agency/account
+The generator stores the key of each payment in the index (payments.payment_key),
+and find_duplicates() looks an upload's keys up in bulk. A Bloom filter kept
+next to the index (payments.db.bloom.npz) answers most keys "never paid"
+without touching SQLite; its positives are confirmed by the index.
+"""
+import hashlib
+import os
+import threading
+import zipfile
+import numpy as np
+import pandas as pd
+from .columnar import _column, _format_date, classify_forma
+from .validators import clean_non_digits, determine_inscription_type, map_unique, payment_cents
+
+BLOOM_SUFFIX = ".bloom.npz"
+BLOOM_BITS_PER_KEY = 10 # ~1% false positives with BLOOM_HASHES
+BLOOM_HASHES = 7
+BLOOM_MIN_BITS = 1 << 20
+
+# Keys per SQLite lookup query (below the host parameter limit)
+LOOKUP_BATCH = 500
+
+DUPLICATE_COLUMNS = ["row", "kind", "payment_key", "first_row", "nsa", "lote", "n_registro", "data_pagamento"]
+
+def _hash_key(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+def payment_keys(cpf_cnpj, cents, dates, pix_keys, bancos, agencias, contas) -> np.ndarray:
+    """
+    int64 keys of payments given as parallel sequences: document digits,
+    cents, DDMMAAAA dates, Pix key ('' when not Pix) and the digits of bank,
+    agency and account (ignored for Pix).
+    """
+    keys = np.empty(len(cents), dtype=np.int64)
+    for i, (doc, value, date, pix, banco, agencia, conta) in enumerate(
+            zip(cpf_cnpj, cents, dates, pix_keys, bancos, agencias, contas)):
+        pix = str(pix).strip().lower()
+        if pix:
+            target = f"pix:{pix}"
+        else:
+            target = f"conta:{str(banco).lstrip('0')}/{str(agencia).lstrip('0')}/{str(conta).lstrip('0')}"
+        keys[i] = _hash_key(f"{doc}|{int(value)}|{date}|{target}")
+    return keys
+
+def _safe_format_date(value) -> str:
+    try:
+        return _format_date(value)
+    except (ValueError, TypeError):
+        return str(value).strip()
+
+def upload_payment_keys(df: pd.DataFrame) -> np.ndarray:
+    """Keys of a validated upload (validate_upload output), as the generator stores them."""
+    cents, _ = payment_cents(df)
+    is_pix = classify_forma(df) == '45'
+    digits = lambda name: map_unique(_column(df, name), lambda v: clean_non_digits(str(v)))
+    return payment_keys(
+        map_unique(df["CPF_CNPJ"], lambda v: determine_inscription_type(v)[1]),
+        cents,
+        map_unique(df["DATA_PAGAMENTO"], _safe_format_date),
+        map_unique(_column(df, "CHAVE_PIX"), lambda v: str(v).strip()).where(is_pix, ""),
+        digits("COD_BANCO"), digits("AGENCIA"), digits("CONTA"),
+    )
+
+class BloomFilter:
+    """Bit array answering "surely absent" / "maybe present" for int64 keys."""
+
+    def __init__(self, n_bits: int, n_hashes: int = BLOOM_HASHES, n_keys: int = 0, bits: np.ndarray = None):
+        self.n_bits = int(n_bits)
+        self.n_hashes = int(n_hashes)
+        self.n_keys = int(n_keys) # Keys added, compared with the index to detect a stale file
+        self.bits = bits if bits is not None else np.zeros((self.n_bits + 7) // 8, dtype=np.uint8)
+
+    @classmethod
+    def for_capacity(cls, capacity: int) -> "BloomFilter":
+        n_bits = max(BLOOM_MIN_BITS, 1 << int(np.ceil(np.log2(max(1, capacity) * BLOOM_BITS_PER_KEY))))
+        return cls(n_bits)
+
+    @property
+    def capacity(self) -> int:
+        return self.n_bits // BLOOM_BITS_PER_KEY
+
+    def _positions(self, keys: np.ndarray) -> np.ndarray:
+        # Double hashing over the two halves of the (already uniform) key
+        keys = np.asarray(keys, dtype=np.int64).view(np.uint64)
+        h1 = keys & np.uint64(0xFFFFFFFF)
+        h2 = (keys >> np.uint64(32)) | np.uint64(1)
+        steps = np.arange(self.n_hashes, dtype=np.uint64)
+        return (h1[:, None] + steps * h2[:, None]) % np.uint64(self.n_bits)
+
+    def add(self, keys: np.ndarray):
+        positions = self._positions(keys).ravel()
+        np.bitwise_or.at(self.bits, positions >> np.uint64(3),
+                         (np.uint8(1) << (positions & np.uint64(7)).astype(np.uint8)))
+        self.n_keys += len(keys)
+
+    def might_contain(self, keys: np.ndarray) -> np.ndarray:
+        positions = self._positions(keys)
+        hit = (self.bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return hit.all(axis=1)
+
+    def save(self, path: str):
+        # Own temporary file per process and thread: concurrent savers never interleave writes
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                np.savez(f, bits=self.bits, meta=np.array([self.n_bits, self.n_hashes, self.n_keys], dtype=np.int64))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    @classmethod
+    def load(cls, path: str) -> "BloomFilter":
+        """Filter saved in path; raises ValueError when the file is not a readable filter."""
+        try:
+            return cls._load(path)
+        except (KeyError, EOFError, zipfile.BadZipFile) as e:
+            raise ValueError(f"Filtro de pagamentos ilegível: {path} ({e})") from e
+
+    @classmethod
+    def _load(cls, path: str) -> "BloomFilter":
+        with np.load(path) as data:
+            n_bits, n_hashes, n_keys = (int(v) for v in data["meta"])
+            bits = data["bits"]
+        if bits.dtype != np.uint8 or len(bits) != (n_bits + 7) // 8:
+            raise ValueError(f"Filtro de pagamentos ilegível: {path} ({len(bits)} bytes para {n_bits} bits)")
+        return cls(n_bits, n_hashes, n_keys, bits)
+
+def find_duplicates(df: pd.DataFrame, payment_index=None, use_filter: bool = True) -> pd.DataFrame:
+    """
+    Payments of a validated upload that repeat an earlier row of the upload
+    (kind 'upload', first_row) or a payment already indexed (kind 'history',
+    with its nsa / lote / n_registro / data_pagamento). 'row' is the Excel line.
+    """
+    if len(df) == 0:
+        return pd.DataFrame(columns=DUPLICATE_COLUMNS)
+    keys = upload_payment_keys(df)
+    line_no = np.asarray(df.index) + 2
+    found = []
+
+    repeated = pd.Series(keys).duplicated(keep="first").to_numpy()
+    if repeated.any():
+        first_line = pd.Series(line_no).groupby(keys).transform("first").to_numpy()
+        found.append(pd.DataFrame({
+            "row": line_no[repeated], "kind": "upload", "payment_key": keys[repeated],
+            "first_row": first_line[repeated],
+        }))
+
+    if payment_index is not None:
+        candidates = np.unique(keys)
+        if use_filter:
+            candidates = candidates[payment_index.key_filter().might_contain(candidates)]
+        history = payment_index.find_keys(candidates)
+        if len(history):
+            rows = pd.DataFrame({"row": line_no, "payment_key": keys}).merge(history, on="payment_key")
+            rows["kind"] = "history"
+            found.append(rows)
+
+    if not found:
+        return pd.DataFrame(columns=DUPLICATE_COLUMNS)
+    result = pd.concat(found, ignore_index=True).reindex(columns=DUPLICATE_COLUMNS)
+    for column in ("row", "first_row", "nsa", "lote", "n_registro"):
+        result[column] = result[column].astype("Int64") # Blank where the kind does not apply
+    return result.sort_values(["row", "kind"], kind="stable", ignore_index=True)
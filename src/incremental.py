@@ -0,0 +1,310 @@
+"""
+Incremental remessa: late payments appended to an already generated file.
+
+The open remessa lives in a directory:
+    state.json      NSA, empresa data, file header and per lote counts / cent totals
+    lote_<forma>_<n>.seg  Header de Lote + detail records of one lote, each record + CRLF
+
+Appending renders only the new detail records (columnar path) and writes
+them at the end of their lote's segment; the Trailer de Lote and Trailer de
+Arquivo are re-rendered from the updated counts and cent totals. An append
+thus costs O(new payments) whatever the size of the remessa. The state is
+saved last, so bytes of an interrupted append are ignored and overwritten.
+A full lote (max_lote_records, as in CNABGenerator) is followed by a new
+lote of the same forma; lotes after it are renumbered in place.
+
+write_file() keeps the .REM itself up to date the same way: when the file
+is the one it last wrote, it seeks back to the old Trailer de Lote of the
+first lote that changed and rewrites from there (the new records of that
+lote, its trailer, any lotes after it and the Trailer de Arquivo). Late
+payments to the last lote of the file (Pix, forma 45) cost O(new payments);
+an append to an earlier lote also rewrites the lotes that follow it.
+
+Payments are numbered (Seu Número) in append order: after appending df1,
+df2, ... write_to() produces the same bytes as CNABGenerator.generate() on
+pd.concat([df1, df2, ...], ignore_index=True), header timestamp aside (it is
+fixed when the remessa is created). Appends are not safe to run concurrently
+on the same directory.
+"""
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+from .generator import CNABGenerator, lote_payments_limit
+from .records import PaymentRecords, render_records
+
+STATE_FILE = "state.json"
+
+# One record on disk: 240 characters + CRLF
+RECORD_BYTES = 242
+
+def _encode_records(lines) -> bytes:
+    # cp1252 is single-byte, so encoding the joined text equals joining the encoded records
+    return "".join(line + "\r\n" for line in lines).encode('cp1252', errors='replace')
+
+def _matrix_records(matrix: np.ndarray) -> bytes:
+    # Rendered detail records (records.render_records), each + CRLF
+    out = np.empty((len(matrix), RECORD_BYTES), dtype=np.uint8)
+    out[:, :-2] = matrix
+    out[:, -2:] = np.frombuffer(b"\r\n", dtype=np.uint8)
+    return out.tobytes()
+
+class IncrementalRemessa:
+    def __init__(self, path: str, state: dict):
+        self.path = path
+        self.state = state
+        self._gen = CNABGenerator(nsa=state["nsa"], empresa_data=state["empresa_data"],
+                                  max_lote_records=state["max_lote_records"])
+
+    @classmethod
+    def create(cls, path: str, nsa: int, empresa_data: dict, max_lote_records: int = None) -> "IncrementalRemessa":
+        """Starts an empty remessa in path (which must not hold one already)."""
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, STATE_FILE)):
+            raise FileExistsError(f"Remessa já iniciada em {path}")
+        gen = CNABGenerator(nsa=nsa, empresa_data=empresa_data, max_lote_records=max_lote_records)
+        state = {
+            "nsa": nsa,
+            "empresa_data": dict(empresa_data),
+            "max_lote_records": gen.max_lote_records,
+            "header": gen._header_arquivo_line(),
+            "next_row": 0,
+            # In file order (by forma, then opening order):
+            # forma, segment, payments, records (as in its trailer), total_cents
+            "lotes": [],
+            # The .REM as last written by write_file: path, size, mtime_ns, (segment, records) per lote
+            "written": None,
+        }
+        remessa = cls(path, state)
+        remessa._save_state()
+        return remessa
+
+    @classmethod
+    def open(cls, path: str) -> "IncrementalRemessa":
+        with open(os.path.join(path, STATE_FILE), encoding="utf-8") as f:
+            return cls(path, json.load(f))
+
+    # --- Counts ---
+
+    @property
+    def nsa(self) -> int:
+        return self.state["nsa"]
+
+    @property
+    def payments(self) -> int:
+        return self.state["next_row"]
+
+    @property
+    def lotes_count(self) -> int:
+        return len(self.state["lotes"])
+
+    @property
+    def registros(self) -> int:
+        """Records of the finished file, headers and trailers included."""
+        return sum(lote["records"] for lote in self.state["lotes"]) + 2
+
+    @property
+    def total_cents(self) -> int:
+        return sum(lote["total_cents"] for lote in self.state["lotes"])
+
+    def summary(self) -> dict:
+        return {
+            "nsa": self.nsa,
+            "payments": self.payments,
+            "lotes": self.lotes_count,
+            "registros": self.registros,
+            "valor_total": self.total_cents / 100,
+        }
+
+    # --- Storage ---
+
+    def _segment_path(self, lote: dict) -> str:
+        return os.path.join(self.path, lote["segment"])
+
+    def _save_state(self):
+        # Written last and atomically: the segments hold extra bytes until the state counts them
+        target = os.path.join(self.path, STATE_FILE)
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(target + ".tmp", target)
+
+    def _sync_lote_numbers(self):
+        # A lote inserted before others shifts their number; patch the lote field of their records
+        for lote_seq, lote in enumerate(self.state["lotes"], start=1):
+            expected = np.frombuffer(str(lote_seq).zfill(4).encode("ascii"), dtype=np.uint8)
+            records = np.memmap(self._segment_path(lote), dtype=np.uint8, mode="r+",
+                                shape=(lote["records"] - 1, RECORD_BYTES))
+            if not np.array_equal(records[0, 3:7], expected):
+                records[:, 3:7] = expected
+                records.flush()
+            del records
+
+    # --- Appending ---
+
+    def append(self, df: pd.DataFrame, payment_index=None) -> dict:
+        """
+        Adds validated payments (validate_upload output) to the remessa.
+        Every value is rendered before anything is written, so a bad value
+        (or a remessa outgrowing the layout limits) leaves the remessa unchanged.
+        Returns summary().
+        """
+        if len(df) == 0:
+            return self.summary()
+        df = df.copy(deep=False)
+        df.index = pd.RangeIndex(self.state["next_row"], self.state["next_row"] + len(df))
+        records = PaymentRecords.from_frame(df)
+
+        # Fill the last lote of each forma, then open new ones after it
+        lotes = [dict(lote) for lote in self.state["lotes"]]
+        parts = [] # (lote, payments, records already in its segment; 0 = new lote)
+        for forma, group in records.by_forma():
+            limit = lote_payments_limit(forma, self.state["max_lote_records"])
+            same = [lote for lote in lotes if lote["forma"] == forma]
+            start = 0
+            if same and same[-1]["payments"] < limit:
+                start = limit - same[-1]["payments"]
+                parts.append((same[-1], group[:start], same[-1]["records"] - 1))
+            while start < len(group):
+                lote = {"forma": forma, "segment": f"lote_{forma}_{len(same)}.seg",
+                        "payments": 0, "records": 2, "total_cents": 0}
+                same.append(lote)
+                lotes.append(lote)
+                parts.append((lote, group[start:start + limit], 0))
+                start += limit
+        lotes.sort(key=lambda lote: lote["forma"]) # Stable: opening order within a forma
+        lote_seqs = {id(lote): seq for seq, lote in enumerate(lotes, start=1)}
+        # The finished file must still fit the trailer fields (see CNABGenerator.MAX_FILE_RECORDS)
+        records_after = 2 + sum(lote["records"] for lote in lotes) + sum(
+            len(group) * (2 if lote["forma"] == '45' else 1) for lote, group, _ in parts)
+        self._gen.check_file_limits(len(lotes), records_after)
+
+        rendered = []
+        index_batches = [] if payment_index is not None else None
+        for lote, group, on_disk in parts:
+            lote_seq = lote_seqs[id(lote)]
+            matrix, items, total = render_records(
+                lote["forma"], group, lote_seq, lote["records"] - 2, lote["total_cents"], index_batches
+            )
+            data = _matrix_records(matrix)
+            if not on_disk:
+                data = _encode_records([self._gen._header_lote_line(lote_seq, lote["forma"])]) + data
+            rendered.append((lote, data, on_disk))
+            lote.update(payments=lote["payments"] + len(group), records=items + 2, total_cents=total)
+
+        for lote, data, on_disk in rendered:
+            # After the records counted by the state (drops an interrupted append)
+            with open(self._segment_path(lote), "r+b" if on_disk else "wb") as f:
+                f.seek(on_disk * RECORD_BYTES)
+                f.write(data)
+                f.truncate()
+
+        opened = sorted(lote_seqs[id(lote)] for lote, _, on_disk in parts if not on_disk)
+        if payment_index is not None:
+            self._index_payments(payment_index, opened, index_batches)
+
+        self.state["lotes"] = lotes
+        self.state["next_row"] += len(df)
+        self._save_state()
+        if opened and opened[0] <= len(self.state["lotes"]) - len(opened):
+            self._sync_lote_numbers() # Some existing lote moved
+        return self.summary()
+
+    def _index_payments(self, payment_index, opened: list, batches: list):
+        writer = payment_index.writer(self.nsa, replace=False)
+        try:
+            for lote_seq in opened: # Ascending, so each shift sees the numbers left by the previous one
+                writer.shift_lotes(lote_seq)
+            for batch in batches:
+                writer.add(batch)
+            writer.commit()
+        finally:
+            writer.close()
+
+    # --- Output ---
+
+    def write_to(self, fileobj) -> int:
+        """Writes the complete remessa; returns the number of bytes written."""
+        self._sync_lote_numbers()
+        header = (self.state["header"] + "\r\n").encode('cp1252', errors='replace')
+        fileobj.write(header)
+        return len(header) + self._write_lotes(fileobj, 0, 0)
+
+    def _write_lotes(self, fileobj, first: int, skip_records: int) -> int:
+        # Lotes from index first on (the first one without its skip_records leading records) + Trailer de Arquivo
+        written = 0
+        for lote_seq, lote in enumerate(self.state["lotes"][first:], start=first + 1):
+            skip = skip_records if lote_seq == first + 1 else 0
+            with open(self._segment_path(lote), "rb") as f:
+                f.seek(skip * RECORD_BYTES)
+                written += _copy_exact(f, fileobj, (lote["records"] - 1 - skip) * RECORD_BYTES)
+            trailer = _encode_records([self._gen._trailer_lote_line(lote_seq, lote["records"] - 2, lote["total_cents"])])
+            fileobj.write(trailer)
+            written += len(trailer)
+        trailer = self._gen._trailer_arquivo_line(self.lotes_count, self.registros).encode('cp1252', errors='replace')
+        fileobj.write(trailer)
+        return written + len(trailer)
+
+    def _unchanged_prefix(self, path: str):
+        # (first changed lote, its records still valid in the file) when path holds what write_file last wrote
+        written = self.state.get("written")
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        if (not written or written["path"] != os.path.abspath(path)
+                or (written["size"], written["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns)):
+            return None
+        lotes = self.state["lotes"]
+        for first, (segment, records) in enumerate(written["lotes"]):
+            if first == len(lotes) or lotes[first]["segment"] != segment:
+                return first, 0 # A lote was inserted here: renumbered from here on
+            if lotes[first]["records"] != records:
+                return first, records - 1 # Grew: its header and old details stay
+        return len(written["lotes"]), 0
+
+    def write_file(self, path: str) -> int:
+        """
+        Writes the remessa to path; returns its size. When path holds the
+        remessa as this method last wrote it, only the bytes from the first
+        changed lote on are rewritten; otherwise the whole file is.
+        """
+        prefix = self._unchanged_prefix(path)
+        # Forgotten while writing: an interrupted write is followed by a full one
+        self.state["written"] = None
+        self._save_state()
+        if prefix is None:
+            with open(path, "wb") as f:
+                size = self.write_to(f)
+        else:
+            self._sync_lote_numbers()
+            first, skip_records = prefix
+            offset = RECORD_BYTES * (1 + sum(lote["records"] for lote in self.state["lotes"][:first]) + skip_records)
+            with open(path, "r+b") as f:
+                f.seek(offset)
+                size = offset + self._write_lotes(f, first, skip_records)
+                f.truncate()
+        stat = os.stat(path)
+        self.state["written"] = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                                 "lotes": [(lote["segment"], lote["records"]) for lote in self.state["lotes"]]}
+        self._save_state()
+        return size
+
+    def finalize(self) -> bytes:
+        """The complete remessa as bytes (same as CNABGenerator.generate)."""
+        buf = io.BytesIO()
+        self.write_to(buf)
+        return buf.getvalue()
+
+def _copy_exact(src, dst, size: int, chunk_size: int = 1024 * 1024) -> int:
+    # Bytes past the state's record count (an interrupted append) are left out
+    remaining = size
+    while remaining:
+        chunk = src.read(min(chunk_size, remaining))
+        if not chunk:
+            raise ValueError(f"Segmento incompleto: {getattr(src, 'name', '')}")
+        dst.write(chunk)
+        remaining -= len(chunk)
+    return size
@@ -0,0 +1,241 @@
+"""
+Payroll ingestion: xlsx, CSV and Parquet exports become the same frame of
+strings, restricted to TEMPLATE_COLUMNS and without empty rows.
+
+xlsx files are streamed in openpyxl read-only mode and every format is read in
+chunks of CHUNK_ROWS, dropping empty rows as they are read. The index is the
+spreadsheet line minus 2 (header on line 1), so validation messages point at
+the right line even when empty rows were skipped.
+
+Cells are converted the way pd.read_excel(dtype=str) did: whole numbers without
+'.0', dates as 'AAAA-MM-DD HH:MM:SS', the pandas NA strings and Excel errors as ''.
+"""
+import codecs
+import io
+import os
+import time
+import tracemalloc
+import pandas as pd
+from pandas.io.parsers.readers import STR_NA_VALUES
+from .validators import map_unique
+
+TEMPLATE_COLUMNS = [
+    "NOME_FAVORECIDO",
+    "CPF_CNPJ",
+    "COD_BANCO",
+    "AGENCIA",
+    "CONTA",
+    "DIGITO_CONTA",
+    "VALOR_PAGAMENTO",
+    "DATA_PAGAMENTO",
+    "TIPO_CHAVE_PIX", # Email, CPF, Telefone, Aleatoria
+    "CHAVE_PIX",
+    "DESCRICAO" # Optional description
+]
+
+# A row is empty when any of these is blank
+KEY_COLUMNS = ("NOME_FAVORECIDO", "VALOR_PAGAMENTO")
+
+FORMATS = ("xlsx", "csv", "parquet")
+
+CHUNK_ROWS = 10000
+
+_EXCEL_ERRORS = {'#NULL!', '#DIV/0!', '#VALUE!', '#REF!', '#NAME?', '#NUM!', '#N/A'}
+_NA_STRINGS = frozenset(STR_NA_VALUES) | _EXCEL_ERRORS
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return "" if value in _NA_STRINGS else value
+    if isinstance(value, float):
+        if value != value: # NaN
+            return ""
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+def _source_name(source) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return os.fspath(source)
+    return getattr(source, "name", "") or ""
+
+def detect_format(source) -> str:
+    """Format from the file extension, or from the first bytes when there is none."""
+    ext = os.path.splitext(_source_name(source))[1].lower().lstrip(".")
+    if ext in ("xlsx", "xlsm"):
+        return "xlsx"
+    if ext in ("csv", "txt"):
+        return "csv"
+    if ext in ("parquet", "pq"):
+        return "parquet"
+
+    head = _read_head(source, 4)
+    if head.startswith(b"PK\x03\x04"):
+        return "xlsx"
+    if head == b"PAR1":
+        return "parquet"
+    return "csv"
+
+def _read_head(source, size: int) -> bytes:
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(size)
+    pos = source.tell()
+    head = source.read(size)
+    source.seek(pos)
+    return head
+
+def _selected(header) -> list:
+    """(position, name) of the template columns present in a header row."""
+    return [(i, name) for i, name in enumerate(header) if name in TEMPLATE_COLUMNS]
+
+def _key_positions(names) -> list:
+    return [names.index(key) for key in KEY_COLUMNS if key in names]
+
+def _chunk_frame(rows, index, names) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=names, index=pd.Index(index, dtype="int64"), dtype=str)
+
+# --- xlsx ---
+
+def iter_xlsx_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(source, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0]
+        rows_iter = ws.iter_rows(values_only=True)
+        header = next(rows_iter, None) or ()
+        selected = _selected([_cell_text(v) for v in header])
+        names = [name for _, name in selected]
+        positions = [i for i, _ in selected]
+        keys = _key_positions(names)
+
+        rows, index = [], []
+        emitted = False
+        for line, row in enumerate(rows_iter, 2):
+            width = len(row)
+            values = [_cell_text(row[i]) if i < width else "" for i in positions]
+            if any(not values[k].strip() for k in keys):
+                continue
+            rows.append(values)
+            index.append(line - 2)
+            if len(rows) >= chunk_rows:
+                yield _chunk_frame(rows, index, names)
+                emitted = True
+                rows, index = [], []
+        if rows or not emitted:
+            yield _chunk_frame(rows, index, names)
+    finally:
+        wb.close()
+
+# --- CSV ---
+
+def _csv_dialect(source):
+    """(encoding, separator) sniffed from the first 64KB: UTF-8 (with or without BOM) or cp1252; ';' or ','."""
+    sample = _read_head(source, 65536)
+    try:
+        text = codecs.getincrementaldecoder("utf-8-sig")().decode(sample, final=False)
+        encoding = "utf-8-sig"
+    except UnicodeDecodeError:
+        text = sample.decode("cp1252", errors="replace")
+        encoding = "cp1252"
+    first_line = text.split("\n", 1)[0]
+    sep = ";" if first_line.count(";") > first_line.count(",") else ","
+    return encoding, sep
+
+def iter_csv_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    encoding, sep = _csv_dialect(source)
+    reader = pd.read_csv(
+        source, sep=sep, encoding=encoding, dtype=str, usecols=lambda c: c in TEMPLATE_COLUMNS,
+        skip_blank_lines=False, chunksize=chunk_rows,
+    )
+    emitted = False
+    with reader:
+        for chunk in reader:
+            chunk = _finish_chunk(chunk)
+            if len(chunk) or not emitted:
+                yield chunk
+                emitted = True
+
+# --- Parquet ---
+
+def iter_parquet_chunks(source, chunk_rows: int = CHUNK_ROWS):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Leitura de arquivos Parquet requer o pacote pyarrow") from e
+
+    pf = pq.ParquetFile(source)
+    names = [name for name in pf.schema_arrow.names if name in TEMPLATE_COLUMNS]
+    offset = 0
+    emitted = False
+    for batch in pf.iter_batches(batch_size=chunk_rows, columns=names):
+        chunk = batch.to_pandas()
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        offset += len(chunk)
+        chunk = _finish_chunk(chunk)
+        if len(chunk) or not emitted:
+            yield chunk
+            emitted = True
+    if not emitted:
+        yield _chunk_frame([], [], names)
+
+def _finish_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Cell conversion and empty row filter for frames read by pandas / pyarrow."""
+    data = {name: map_unique(chunk[name], _cell_text) for name in chunk.columns}
+    chunk = pd.DataFrame(data, index=chunk.index, dtype=str)
+    keep = None
+    for key in KEY_COLUMNS:
+        if key in chunk.columns:
+            filled = chunk[key].str.strip() != ""
+            keep = filled if keep is None else keep & filled
+    return chunk if keep is None else chunk[keep]
+
+# --- Entry points ---
+
+_READERS = {
+    "xlsx": iter_xlsx_chunks,
+    "csv": iter_csv_chunks,
+    "parquet": iter_parquet_chunks,
+}
+
+def iter_payroll_chunks(source, fmt: str = None, chunk_rows: int = CHUNK_ROWS):
+    """
+    Yields DataFrames of at most chunk_rows rows. source: path, bytes or a
+    binary file object (e.g. a Streamlit upload).
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    fmt = fmt or detect_format(source)
+    if fmt not in _READERS:
+        raise ValueError(f"Formato não suportado: {fmt} (use {', '.join(FORMATS)})")
+    return _READERS[fmt](source, chunk_rows)
+
+def read_payroll(source, fmt: str = None, chunk_rows: int = CHUNK_ROWS, stats: dict = None,
+                 trace_memory: bool = False) -> pd.DataFrame:
+    """
+    Whole payroll as one frame of strings.
+    stats: optional dict filled with format, rows, seconds and, with
+    trace_memory=True, peak_bytes allocated while reading (tracemalloc).
+    """
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    if trace_memory:
+        tracemalloc.reset_peak()
+    t0 = time.perf_counter()
+    try:
+        if isinstance(source, (bytes, bytearray)):
+            source = io.BytesIO(source)
+        fmt = fmt or detect_format(source)
+        chunks = list(iter_payroll_chunks(source, fmt, chunk_rows))
+        df = chunks[0] if len(chunks) == 1 else pd.concat(chunks)
+        if stats is not None:
+            stats.update(format=fmt, rows=len(df), seconds=round(time.perf_counter() - t0, 4))
+            if trace_memory:
+                stats["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+    return df
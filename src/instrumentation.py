@@ -0,0 +1,127 @@
+"""
+Observers and profiler for CNABGenerator.
+
+An observer is any callable taking one event dict. The generator emits:
+    start           payments_total (and files_total in split mode)
+    classification  seconds, payments, lotes
+    progress        lote, payments_done, payments_total
+    lote            lote, forma, payments, records, seconds
+    encoding        seconds, records, bytes (encode time only; not in the byte backend)
+    split_file      file_nsa, file_name, payments, bytes, files_done, files_total
+    done            seconds, records, lotes, payments, bytes
+Every event also carries 'stage' and the generator's 'nsa'. Timings are wall
+time while the generator is consumed, so they include whatever the consumer
+does between records (e.g. writing them to disk).
+"""
+import importlib
+import json
+import sys
+import time
+from collections import OrderedDict
+from functools import wraps
+
+class EventRecorder:
+    """Observer keeping every event in memory (tests, benchmarks)."""
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event: dict):
+        self.events.append(event)
+
+    def by_stage(self, stage: str) -> list:
+        return [e for e in self.events if e["stage"] == stage]
+
+class JsonLinesLog:
+    """Observer writing one JSON object per event (structured log for the CLI and benchmarks)."""
+
+    def __init__(self, stream=None, **context):
+        self.stream = stream or sys.stderr
+        self.context = context # Extra keys added to every line (e.g. input file)
+
+    def __call__(self, event: dict):
+        record = {"ts": round(time.time(), 3), **self.context, **event}
+        self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+def chain(*observers):
+    """Single observer forwarding each event to every non-None observer."""
+    active = [o for o in observers if o is not None]
+    if not active:
+        return None
+    if len(active) == 1:
+        return active[0]
+    def forward(event):
+        for observer in active:
+            observer(event)
+    return forward
+
+# Module level functions on the generation hot paths: (module, attribute)
+HOT_FUNCTIONS = [
+    (".generator", "sanitize_text"),
+    (".generator", "clean_non_digits"),
+    (".generator", "checked_cents"),
+    (".generator", "format_cents"),
+    (".generator", "determine_inscription_type"),
+    (".records", "sanitize_text"),
+    (".records", "clean_non_digits_column"),
+    (".records", "payment_cents"),
+    (".records", "validate_documents"),
+    (".records", "segmento_b_keys"),
+    (".generator", "render_records"),
+]
+
+# Generator methods wrapped on the instance being profiled (called by every render path)
+HOT_METHODS = ["_generate_line", "_plan_lotes"]
+
+class Profiler:
+    """
+    Counts calls and inclusive time of the hot paths while a generator runs:
+        profiler = Profiler()
+        CNABGenerator(nsa, empresa_data, profiler=profiler).generate(df)
+        profiler.report()  # {"_generate_line": {"calls": ..., "seconds": ...}, ...}
+    Module functions are patched for the duration of the run, so profile one
+    generation at a time (not concurrent Streamlit sessions).
+    """
+
+    def __init__(self):
+        self.stats = OrderedDict()
+
+    def _wrap(self, name: str, func):
+        entry = self.stats.setdefault(name, {"calls": 0, "seconds": 0.0})
+        clock = time.perf_counter
+
+        @wraps(func)
+        def timed(*args, **kwargs):
+            t0 = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry["seconds"] += clock() - t0
+                entry["calls"] += 1
+        return timed
+
+    def attach(self, generator):
+        """Patches the hot paths; returns the callable that restores them."""
+        restore = []
+        for module_name, attr in HOT_FUNCTIONS:
+            module = importlib.import_module(module_name, __package__)
+            original = getattr(module, attr)
+            setattr(module, attr, self._wrap(attr, original))
+            restore.append((module, attr, original))
+        for attr in HOT_METHODS:
+            setattr(generator, attr, self._wrap(attr, getattr(generator, attr)))
+
+        def detach():
+            for module, attr, original in restore:
+                setattr(module, attr, original)
+            for attr in HOT_METHODS:
+                generator.__dict__.pop(attr, None)
+        return detach
+
+    def report(self) -> dict:
+        """Hot paths the run went through, sorted by time spent, seconds rounded to microseconds."""
+        # Per-row and columnar runs reach different functions: the others are left out
+        called = [item for item in self.stats.items() if item[1]["calls"]]
+        ranked = sorted(called, key=lambda item: item[1]["seconds"], reverse=True)
+        return {name: {"calls": s["calls"], "seconds": round(s["seconds"], 6)} for name, s in ranked}
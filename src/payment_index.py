@@ -0,0 +1,318 @@
+"""
+Local SQLite index of every payment sent in a remessa.
+
+Each generation bulk-inserts its Segmento A records (NSA, lote, n_registro,
+Seu Número, CPF/CNPJ, value, date, Pix key) in one short transaction once
+the file rendered, so return lines and support questions ("was this CPF
+paid in March?") resolve with indexed lookups instead of re-reading old
+.REM files. Each payment also
+carries its duplicate-detection key (see duplicates.py).
+"""
+import itertools
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from .duplicates import BloomFilter, BLOOM_SUFFIX, LOOKUP_BATCH, payment_keys
+
+DEFAULT_INDEX_FILE = "payments.db"
+
+# Rows sent to SQLite per executemany call
+INSERT_BATCH_ROWS = 20000
+
+COLUMNS = (
+    "nsa", "lote", "n_registro", "n_doc_empresa", "forma_lancamento",
+    "cpf_cnpj", "valor_cents", "data_pagamento", "chave_pix", "payment_key",
+)
+
+# Columns a writer fills, in insert order
+_STORED_COLUMNS = COLUMNS[:-1] + ("generated_at", "payment_key")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    nsa INTEGER NOT NULL,
+    lote INTEGER NOT NULL,
+    n_registro INTEGER NOT NULL,
+    n_doc_empresa TEXT NOT NULL,
+    forma_lancamento TEXT NOT NULL,
+    cpf_cnpj TEXT NOT NULL,
+    valor_cents INTEGER NOT NULL,
+    data_pagamento TEXT NOT NULL, -- YYYY-MM-DD
+    chave_pix TEXT NOT NULL DEFAULT '',
+    generated_at TEXT NOT NULL,
+    payment_key INTEGER,
+    PRIMARY KEY (nsa, lote, n_registro)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_payments_doc ON payments (n_doc_empresa, nsa);
+CREATE INDEX IF NOT EXISTS ix_payments_cpf_date ON payments (cpf_cnpj, data_pagamento);
+"""
+
+_KEY_INDEX = "CREATE INDEX IF NOT EXISTS ix_payments_key ON payments (payment_key) WHERE payment_key IS NOT NULL"
+
+
+class PaymentIndex:
+    def __init__(self, path: str = DEFAULT_INDEX_FILE):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(payments)")]
+        if "payment_key" not in columns:
+            # Indexes created before duplicate detection: older payments stay without a key
+            self.conn.execute("ALTER TABLE payments ADD COLUMN payment_key INTEGER")
+        self.conn.execute(_KEY_INDEX)
+        self.conn.commit()
+        self.filter_path = None if path == ":memory:" else path + BLOOM_SUFFIX
+        self._filter = None
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def writer(self, nsa: int, replace: bool = True) -> "PaymentIndexWriter":
+        """
+        Opens the transaction of one generation. It replaces what was indexed
+        for the NSA, unless replace=False (payments appended to an open remessa).
+        """
+        return PaymentIndexWriter(self, nsa, replace)
+
+    # --- Lookups ---
+
+    def _query(self, sql: str, params=()) -> list:
+        return [dict(row) for row in self.conn.execute(sql, params)]
+
+    def find_by_position(self, nsa: int, lote: int, n_registro: int):
+        """Payment of a Segmento A, e.g. a return line of a known remessa."""
+        rows = self._query(
+            "SELECT * FROM payments WHERE nsa = ? AND lote = ? AND n_registro = ?",
+            (nsa, lote, n_registro),
+        )
+        return rows[0] if rows else None
+
+    def find_by_seu_numero(self, n_doc_empresa: str, nsa: int = None) -> list:
+        n_doc_empresa = str(n_doc_empresa).strip()
+        if n_doc_empresa.isdigit():
+            n_doc_empresa = n_doc_empresa.zfill(10) # Generated Seu Número is the zero-filled row ID
+        if nsa is None:
+            return self._query("SELECT * FROM payments WHERE n_doc_empresa = ? ORDER BY nsa", (n_doc_empresa,))
+        return self._query(
+            "SELECT * FROM payments WHERE n_doc_empresa = ? AND nsa = ?", (n_doc_empresa, nsa)
+        )
+
+    def find_by_document(self, cpf_cnpj: str, date_from: str = None, date_to: str = None) -> list:
+        """Payments to a CPF/CNPJ, optionally within [date_from, date_to] (YYYY-MM-DD)."""
+        from .validators import determine_inscription_type
+        _, cpf_cnpj = determine_inscription_type(cpf_cnpj)
+        sql = "SELECT * FROM payments WHERE cpf_cnpj = ?"
+        params = [cpf_cnpj]
+        if date_from:
+            sql += " AND data_pagamento >= ?"
+            params.append(date_from)
+        if date_to:
+            sql += " AND data_pagamento <= ?"
+            params.append(date_to)
+        return self._query(sql + " ORDER BY data_pagamento, nsa", params)
+
+    def paid_in_month(self, cpf_cnpj: str, year: int, month: int) -> list:
+        return self.find_by_document(cpf_cnpj, f"{year:04d}-{month:02d}-01", f"{year:04d}-{month:02d}-31")
+
+    def count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0]
+
+    # --- Duplicate keys ---
+
+    def find_keys(self, keys) -> pd.DataFrame:
+        """Indexed payments whose payment_key is one of keys."""
+        keys = [int(k) for k in keys]
+        frames = []
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = keys[start:start + LOOKUP_BATCH]
+            frames.append(pd.read_sql_query(
+                "SELECT payment_key, nsa, lote, n_registro, data_pagamento FROM payments "
+                f"WHERE payment_key IN ({', '.join('?' * len(batch))}) ORDER BY nsa, lote, n_registro",
+                self.conn, params=batch,
+            ))
+        if not frames:
+            return pd.DataFrame(columns=["payment_key", "nsa", "lote", "n_registro", "data_pagamento"])
+        return pd.concat(frames, ignore_index=True)
+
+    def _key_count(self) -> int:
+        return self.conn.execute("SELECT COUNT(payment_key) FROM payments WHERE payment_key IS NOT NULL").fetchone()[0]
+
+    def _stored_filter(self):
+        # The filter file next to the index; None when missing or unreadable (rebuilt from the index)
+        if not self.filter_path or not os.path.exists(self.filter_path):
+            return None
+        try:
+            return BloomFilter.load(self.filter_path)
+        except (OSError, ValueError):
+            return None
+
+    def key_filter(self) -> BloomFilter:
+        """
+        Bloom filter of the stored payment keys. Loaded from the file next to
+        the index, rebuilt when it no longer matches the index (e.g. another
+        process wrote payments or an NSA was regenerated) or cannot be read.
+        """
+        count = self._key_count()
+        if self._filter is not None and self._filter.n_keys == count:
+            return self._filter
+        loaded = self._stored_filter()
+        if loaded is not None and loaded.n_keys == count:
+            self._filter = loaded
+            return loaded
+        keys = np.fromiter(
+            (row[0] for row in self.conn.execute("SELECT payment_key FROM payments WHERE payment_key IS NOT NULL")),
+            dtype=np.int64, count=count,
+        )
+        self._filter = BloomFilter.for_capacity(count * 2)
+        self._filter.add(keys)
+        if self.filter_path:
+            self._filter.save(self.filter_path)
+        return self._filter
+
+    def _keys_committed(self, keys: list, count_before: int):
+        # Extends the filter with a generation's keys when nothing else changed the index
+        current = self._filter
+        if current is None:
+            current = self._stored_filter()
+        if current is None or current.n_keys != count_before or current.n_keys + len(keys) > current.capacity:
+            self._filter = None # Rebuilt by the next key_filter()
+            return
+        current.add(np.asarray(keys, dtype=np.int64))
+        self._filter = current
+        if self.filter_path:
+            current.save(self.filter_path)
+
+
+class PaymentIndexWriter:
+    """
+    Collects the payments of one generation and writes them to the index in a
+    single short transaction: commit() makes them visible, close() without
+    commit drops them (e.g. generation failed halfway). While the file renders,
+    batches go to a TEMP table of this connection on a background thread
+    (SQLite releases the GIL while stepping), which takes no lock on the index;
+    commit() then replaces the NSA and copies the rows over inside one
+    BEGIN IMMEDIATE, so concurrent generations only wait for each other's copy.
+    """
+
+    _ids = itertools.count()
+
+    def __init__(self, index: PaymentIndex, nsa: int, replace: bool = True):
+        self.index = index
+        self.nsa = int(nsa)
+        self.replace = replace
+        self.generated_at = datetime.now().isoformat(timespec="seconds")
+        self._buffer = []
+        self._thread = ThreadPoolExecutor(max_workers=1)
+        self._pending = None
+        self._keys = []
+        self._shifts = [] # first_lote of every shift_lotes, applied to the stored rows at commit
+        self._table = f"temp.pending_payments_{next(self._ids)}"
+        self.index.conn.execute(f"CREATE TABLE {self._table} AS SELECT {', '.join(_STORED_COLUMNS)} FROM payments WHERE 0")
+        self.index.conn.commit()
+
+    def shift_lotes(self, first_lote: int):
+        """Renumbers lote >= first_lote to lote + 1 (a lote was inserted before them)."""
+        self._flush()
+        self._wait()
+        self.index.conn.execute(f"UPDATE {self._table} SET lote = lote + 1 WHERE lote >= ?", (first_lote,))
+        self.index.conn.commit()
+        self._shifts.append(first_lote)
+
+    def add(self, batch):
+        """
+        batch: DataFrame with columns lote, n_registro, n_doc_empresa,
+        forma_lancamento, cpf_cnpj, valor (zero-padded cents), data_pagamento
+        (DDMMAAAA) and chave_pix, as rendered in the file, plus the digits of
+        banco, agencia and conta for the duplicate key.
+        """
+        if len(batch) == 0:
+            return
+        valor = pd.to_numeric(batch["valor"], errors="coerce").fillna(0).astype("int64")
+        blank = [""] * len(batch)
+        keys = payment_keys(batch["cpf_cnpj"], valor, batch["data_pagamento"], batch["chave_pix"],
+                            batch.get("banco", blank), batch.get("agencia", blank), batch.get("conta", blank)).tolist()
+        self._keys.extend(keys)
+        datas = batch["data_pagamento"].astype(object)
+        ddmmyyyy = datas.str.len() == 8
+        datas = datas.where(~ddmmyyyy, datas.str[4:] + "-" + datas.str[2:4] + "-" + datas.str[:2])
+        self._buffer.extend(zip(
+            [self.nsa] * len(batch),
+            batch["lote"].astype(int).tolist(),
+            batch["n_registro"].astype(int).tolist(),
+            batch["n_doc_empresa"].tolist(),
+            batch["forma_lancamento"].tolist(),
+            batch["cpf_cnpj"].tolist(),
+            valor.tolist(),
+            datas.tolist(),
+            batch["chave_pix"].tolist(),
+            [self.generated_at] * len(batch),
+            keys,
+        ))
+        if len(self._buffer) >= INSERT_BATCH_ROWS:
+            self._flush()
+
+    def _insert(self, rows):
+        self.index.conn.executemany(
+            f"INSERT INTO {self._table} ({', '.join(_STORED_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(_STORED_COLUMNS))})",
+            rows,
+        )
+        self.index.conn.commit()
+
+    def _wait(self):
+        if self._pending is not None:
+            pending, self._pending = self._pending, None
+            pending.result() # Re-raises insert errors
+
+    def _flush(self):
+        self._wait()
+        if self._buffer:
+            self._pending = self._thread.submit(self._insert, self._buffer)
+            self._buffer = []
+
+    def commit(self):
+        self._flush()
+        self._wait()
+        conn = self.index.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys_before = self.index._key_count()
+            deleted = 0
+            if self.replace:
+                deleted = conn.execute("DELETE FROM payments WHERE nsa = ?", (self.nsa,)).rowcount
+            for first_lote in self._shifts:
+                # Two steps, so no intermediate row collides on the primary key
+                conn.execute("UPDATE payments SET lote = -(lote + 1) WHERE nsa = ? AND lote >= ?", (self.nsa, first_lote))
+                conn.execute("UPDATE payments SET lote = -lote WHERE nsa = ? AND lote < 0", (self.nsa,))
+            columns = ", ".join(_STORED_COLUMNS)
+            conn.execute(f"INSERT OR REPLACE INTO payments ({columns}) SELECT {columns} FROM {self._table} ORDER BY rowid")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if deleted:
+            self.index._filter = None # Regenerated NSA: rebuilt on demand
+        else:
+            self.index._keys_committed(self._keys, keys_before)
+
+    def close(self):
+        try:
+            self._buffer = []
+            try:
+                self._wait()
+            finally:
+                self.index.conn.execute(f"DROP TABLE IF EXISTS {self._table}")
+                self.index.conn.commit()
+        finally:
+            self._thread.shutdown()
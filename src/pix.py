@@ -0,0 +1,116 @@
+"""
+Pix keys: the key type is detected from the key itself (precompiled
+patterns) and the key is normalized to its DICT format:
+
+    type        forma_iniciacao  normalized key
+    e-mail      01               lowercase, at most 77 characters
+    telefone    02               +55, DDD and number: +5511987654321
+    CPF/CNPJ    03               11 / 14 digits, valid check digits
+    aleatória   04               EVP (UUID), lowercase
+
+Phone and document keys may be typed with separators ('+55 (11) 98765-4321',
+'123.456.789-09'). An 11 digit key that is both a valid CPF and a phone
+number is taken as a CPF unless TIPO_CHAVE_PIX says 'Telefone'.
+
+Everything runs over whole columns: the patterns once per distinct key,
+the CPF / CNPJ check digits with validators.validate_documents.
+"""
+import re
+from typing import Tuple
+import numpy as np
+import pandas as pd
+from .validators import map_unique, sanitize_text, validate_documents
+
+# Key types, as the forma_iniciacao of Segmento B
+EMAIL = "01"
+TELEFONE = "02"
+DOCUMENTO = "03"
+ALEATORIA = "04"
+
+KEY_TYPE_NAMES = {EMAIL: "e-mail", TELEFONE: "telefone", DOCUMENTO: "CPF/CNPJ", ALEATORIA: "chave aleatória"}
+
+EMAIL_MAX_LENGTH = 77
+
+# Matched on the lowercased key
+_EMAIL_RE = re.compile(r"[a-z0-9.!#$%&'*+/=?^_`{|}~-]+@[a-z0-9](?:[a-z0-9-]*[a-z0-9])?(?:\.[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)+")
+_EVP_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+# Matched once the separators are removed: DDD without zeros, mobile (9 + 8 digits) or landline number
+_SEPARATORS_RE = re.compile(r"[\s().\-/]")
+_PHONE_RE = re.compile(r"(?:\+55|55)?([1-9]{2}(?:9\d{8}|[2-8]\d{7}))")
+_DIGITS_RE = re.compile(r"\d{11}|\d{14}")
+
+
+def hint_type(tipo_chave) -> str:
+    """Key type named by the free-text TIPO_CHAVE_PIX ('' when it names none)."""
+    tipo = str(tipo_chave).upper()
+    if "EMAIL" in tipo: return EMAIL
+    if "TELEFONE" in tipo: return TELEFONE
+    if "CPF" in tipo or "CNPJ" in tipo: return DOCUMENTO
+    if "ALEATORIA" in tipo: return ALEATORIA
+    return ""
+
+
+def _key_shape(key: str) -> Tuple[str, str, str]:
+    # (email / evp type or '', phone in DICT format or '', digits of a possible CPF / CNPJ or '')
+    if "@" in key:
+        lower = key.lower()
+        if len(lower) <= EMAIL_MAX_LENGTH and _EMAIL_RE.fullmatch(lower):
+            return EMAIL, lower, ""
+        return "", "", ""
+    if len(key) == 36 and _EVP_RE.fullmatch(key.lower()):
+        return ALEATORIA, key.lower(), ""
+    compact = _SEPARATORS_RE.sub("", key)
+    phone = _PHONE_RE.fullmatch(compact)
+    phone = "+55" + phone.group(1) if phone else ""
+    return "", phone, compact if _DIGITS_RE.fullmatch(compact) else ""
+
+
+def classify_pix_keys(keys: pd.Series, tipos: pd.Series = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Type and normalized form of each Pix key of a column; tipos (TIPO_CHAVE_PIX)
+    only breaks the CPF / phone tie. Returns (key type array, normalized key
+    array); keys matching no format get type '' and keep their text (stripped).
+    """
+    keys = keys.fillna("").astype(str).str.strip()
+    # The patterns once per distinct key
+    codes, uniques = pd.factorize(keys.to_numpy(dtype=object), use_na_sentinel=False)
+    shapes = [_key_shape(key) for key in uniques]
+    kind = np.array([shape[0] for shape in shapes], dtype="U2")
+    text = np.array([shape[1] for shape in shapes], dtype=object)
+    phone = (text != "") & (kind == "")
+
+    # Documents: the check digits of every digit-only key at once
+    candidates = np.flatnonzero([shape[2] != "" for shape in shapes])
+    document = np.zeros(len(uniques), dtype=bool)
+    numero = np.full(len(uniques), "", dtype=object)
+    if len(candidates):
+        _, digits, valid = validate_documents(pd.Series([shapes[i][2] for i in candidates], dtype=object))
+        document[candidates] = valid
+        numero[candidates] = digits.astype(str)
+
+    kind, text, phone, document, numero = kind[codes], text[codes], phone[codes], document[codes], numero[codes]
+    if tipos is not None:
+        document &= ~(phone & (map_unique(tipos, hint_type).to_numpy(dtype=object) == TELEFONE))
+    kind[document] = DOCUMENTO
+    kind[phone & ~document] = TELEFONE
+    normalized = np.where(document, numero, text)
+    unknown = kind == ""
+    normalized[unknown] = keys.to_numpy(dtype=object)[unknown]
+    return kind, normalized
+
+
+def segmento_b_keys(keys: pd.Series, tipos: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    forma_iniciacao and chave_pix_ou_conta of the Segmento B of each Pix payment.
+    Keys matching no format keep the TIPO_CHAVE_PIX type ('01' when it names
+    none) and the sanitized text; CPF / CNPJ keys are left out of the record.
+    """
+    kind, chave = classify_pix_keys(keys, tipos)
+    unknown = kind == ""
+    if unknown.any():
+        hints = map_unique(tipos[unknown], hint_type).to_numpy(dtype=object)
+        kind[unknown] = np.where(hints == "", EMAIL, hints)
+        chave[unknown] = map_unique(pd.Series(chave[unknown]), lambda v: sanitize_text(v, allow_email=True)).to_numpy()
+    # Redundancy Check: suppress key if CPF/CNPJ
+    chave[kind == DOCUMENTO] = ""
+    return kind, chave
@@ -0,0 +1,247 @@
+"""
+CNAB 240 reader: parses .REM files back into records using the layouts in
+cnab_definitions.
+
+CNABReader memory-maps the file. Iterating it yields CNABRecord objects whose
+raw bytes are memoryview slices of the map (no copy); fields are only decoded
+when accessed. to_frames() loads the whole file column-wise with NumPy into
+one DataFrame per record type.
+"""
+import mmap
+import numpy as np
+import pandas as pd
+from .cnab_definitions import (
+    HEADER_ARQUIVO, HEADER_LOTE, SEGMENTO_A, SEGMENTO_A_PIX, SEGMENTO_B,
+    TRAILER_LOTE, TRAILER_ARQUIVO, RECORD_LENGTH, PadType
+)
+
+ENCODING = 'cp1252'
+
+LAYOUTS = {
+    "header_arquivo": HEADER_ARQUIVO,
+    "header_lote": HEADER_LOTE,
+    "segmento_a": SEGMENTO_A,
+    "segmento_a_pix": SEGMENTO_A_PIX,
+    "segmento_b": SEGMENTO_B,
+    "trailer_lote": TRAILER_LOTE,
+    "trailer_arquivo": TRAILER_ARQUIVO,
+}
+
+_KIND_BY_REGISTRO = {
+    ord('0'): "header_arquivo",
+    ord('1'): "header_lote",
+    ord('5'): "trailer_lote",
+    ord('9'): "trailer_arquivo",
+}
+
+PIX_FORMA = b"45"
+
+
+def record_kind(raw, lote_forma: bytes = b"") -> str:
+    """Record type from the registro (col 8) and segmento (col 14) codes."""
+    if len(raw) < 14:
+        return "unknown"
+    registro = raw[7]
+    if registro == ord('3'):
+        segmento = raw[13]
+        if segmento == ord('A'):
+            return "segmento_a_pix" if lote_forma == PIX_FORMA else "segmento_a"
+        if segmento == ord('B'):
+            return "segmento_b"
+        return "unknown"
+    return _KIND_BY_REGISTRO.get(registro, "unknown")
+
+
+def field_value(raw, spec) -> str:
+    """Decodes one field; space padded fields are returned without trailing spaces."""
+    start, end, pad_type, _ = spec
+    text = bytes(raw[start - 1:end]).decode(ENCODING, errors='replace')
+    return text.rstrip(' ') if pad_type == PadType.SPACE_RIGHT else text
+
+
+class CNABRecord:
+    __slots__ = ("kind", "line_no", "offset", "raw")
+
+    def __init__(self, kind: str, line_no: int, offset: int, raw):
+        self.kind = kind
+        self.line_no = line_no # 1-based
+        self.offset = offset # Byte offset in the file
+        self.raw = raw # memoryview, no CRLF
+
+    @property
+    def layout(self) -> dict:
+        return LAYOUTS.get(self.kind, {})
+
+    def __getitem__(self, name: str) -> str:
+        return field_value(self.raw, self.layout[name])
+
+    def get(self, name: str, default=None):
+        spec = self.layout.get(name)
+        return default if spec is None else field_value(self.raw, spec)
+
+    def to_dict(self) -> dict:
+        return {name: field_value(self.raw, spec) for name, spec in self.layout.items()}
+
+    @property
+    def text(self) -> str:
+        return bytes(self.raw).decode(ENCODING, errors='replace')
+
+    def __len__(self):
+        return len(self.raw)
+
+    def __repr__(self):
+        return f"CNABRecord({self.kind}, line {self.line_no})"
+
+
+class CNABReader:
+    """
+    Usage:
+        with CNABReader("CB181012.REM") as reader:
+            for record in reader:
+                print(record.kind, record["lote"])
+    Records share the reader's memory map and are only valid while it is open.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # Empty file
+            self._map = None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(b"")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            try:
+                self._map.close()
+            except BufferError:
+                # Records handed out still reference the map; it is freed with them
+                pass
+            self._map = None
+        self._file.close()
+
+    def iter_raw(self):
+        """Yields (line_no, offset, memoryview) for each line, without the line break."""
+        view = self._view
+        size = len(view)
+        data = self._map
+        offset = 0
+        line_no = 0
+        while offset < size:
+            end = data.find(b"\n", offset)
+            if end == -1:
+                end = size
+                next_offset = size
+            else:
+                next_offset = end + 1
+            stop = end - 1 if end > offset and view[end - 1] == 13 else end
+            line_no += 1
+            yield line_no, offset, view[offset:stop]
+            offset = next_offset
+
+    def __iter__(self):
+        lote_forma = b""
+        for line_no, offset, raw in self.iter_raw():
+            kind = record_kind(raw)
+            if kind == "header_lote":
+                lote_forma = bytes(raw[11:13])
+            elif kind == "segmento_a" and lote_forma == PIX_FORMA:
+                kind = "segmento_a_pix"
+            yield CNABRecord(kind, line_no, offset, raw)
+
+    def records(self):
+        return iter(self)
+
+    def to_matrix(self) -> np.ndarray:
+        """All lines as an (n, 240) uint8 matrix; short lines are space padded."""
+        size = len(self._view)
+        stride = RECORD_LENGTH + 2
+        if size and (size + 2) % stride == 0:
+            # Fixed CRLF layout (as generated): reshape the map, no line scanning
+            n = (size + 2) // stride
+            flat = np.frombuffer(self._map, dtype=np.uint8)
+            padded = np.empty(n * stride, dtype=np.uint8)
+            padded[:size] = flat
+            padded[size:] = (13, 10)
+            del flat
+            rows = padded.reshape(n, stride)
+            if (rows[:, RECORD_LENGTH] == 13).all() and (rows[:, RECORD_LENGTH + 1] == 10).all():
+                return np.ascontiguousarray(rows[:, :RECORD_LENGTH])
+
+        lines = [bytes(raw[:RECORD_LENGTH]).ljust(RECORD_LENGTH) for _, _, raw in self.iter_raw()]
+        if not lines:
+            return np.empty((0, RECORD_LENGTH), dtype=np.uint8)
+        return np.frombuffer(b"".join(lines), dtype=np.uint8).reshape(len(lines), RECORD_LENGTH)
+
+    def to_frames(self) -> dict:
+        """
+        Bulk mode: one DataFrame per record kind, one string column per layout
+        field plus 'line_no'. Space padded fields are right-stripped.
+        """
+        matrix = self.to_matrix()
+        kinds = classify_matrix(matrix)
+        frames = {}
+        for kind, layout in LAYOUTS.items():
+            rows = np.flatnonzero(kinds == kind)
+            frames[kind] = _matrix_frame(matrix[rows], layout, rows + 1)
+        return frames
+
+
+def classify_matrix(matrix: np.ndarray) -> np.ndarray:
+    """Vectorized record_kind over an (n, 240) matrix."""
+    n = len(matrix)
+    kinds = np.full(n, "unknown", dtype=object)
+    if n == 0:
+        return kinds
+    registro = matrix[:, 7]
+    for code, kind in _KIND_BY_REGISTRO.items():
+        kinds[registro == code] = kind
+
+    detail = registro == ord('3')
+    seg_b = detail & (matrix[:, 13] == ord('B'))
+    seg_a = detail & (matrix[:, 13] == ord('A'))
+    kinds[seg_b] = "segmento_b"
+
+    # Seg A belongs to a Pix lote when the last lote header before it has forma 45
+    is_header_lote = registro == ord('1')
+    header_pix = is_header_lote & (matrix[:, 11] == PIX_FORMA[0]) & (matrix[:, 12] == PIX_FORMA[1])
+    last_header = np.maximum.accumulate(np.where(is_header_lote, np.arange(n), -1))
+    in_pix_lote = np.where(last_header >= 0, header_pix[np.maximum(last_header, 0)], False)
+    kinds[seg_a & in_pix_lote] = "segmento_a_pix"
+    kinds[seg_a & ~in_pix_lote] = "segmento_a"
+    return kinds
+
+
+def _matrix_frame(matrix: np.ndarray, layout: dict, line_no: np.ndarray) -> pd.DataFrame:
+    data = {"line_no": line_no}
+    for name, (start, end, pad_type, _) in sorted(layout.items(), key=lambda item: item[1][0]):
+        width = end - start + 1
+        column = np.ascontiguousarray(matrix[:, start - 1:end]).view(f"S{width}").ravel()
+        if pad_type == PadType.SPACE_RIGHT:
+            column = np.char.rstrip(column, b' ')
+        if not len(column) or column.view(np.uint8).max() < 128:
+            values = column.astype(str) # Pure ASCII: decoded in C
+        else:
+            values = np.char.decode(column, ENCODING, errors='replace')
+        data[name] = values.astype(object)
+    return pd.DataFrame(data)
+
+
+def read_records(path: str):
+    """Lazy iterator of CNABRecord for a file."""
+    with CNABReader(path) as reader:
+        yield from reader
+
+
+def read_frames(path: str) -> dict:
+    """Bulk mode: {kind: DataFrame} for a whole file."""
+    with CNABReader(path) as reader:
+        return reader.to_frames()
@@ -0,0 +1,278 @@
+"""
+Compact representation of validated payments for the generation pipeline.
+
+PaymentRecords holds one row of a NumPy structured array per payment: the
+integer cents, the row id (Seu Número) and one fixed-width byte field per
+variable CNAB detail field (bank, agency, account, name, date, document,
+Pix initiation and key), already cleaned / sanitized. It is built once per
+upload with batch operations and replaces the DataFrame rows, iterrows()
+Series and per-record dicts between validation and output: a payment takes
+a couple hundred bytes instead of a dozen Python string objects.
+
+render_records() writes the Segmento A (and B, for Pix) records of a lote
+into a (records, 240) byte matrix: the layout template is broadcast once and
+each field is copied into its slot, truncated and padded like
+LayoutPlan.render, so the bytes equal the per-row path of CNABGenerator.
+"""
+import numpy as np
+import pandas as pd
+from .cnab_definitions import RECORD_LENGTH, SEGMENTO_A_PLAN, SEGMENTO_A_PIX_PLAN, SEGMENTO_B_PLAN, _pad
+from .columnar import CAMARA_BY_FORMA, _column, _format_date, classify_forma
+from .pix import segmento_b_keys
+from .validators import (
+    clean_non_digits_column, map_unique, payment_cents, sanitize_text, validate_documents
+)
+
+# Byte fields of a payment, in array order (chave_pix is the raw key, kept for the payment index)
+TEXT_FIELDS = (
+    "forma", "banco", "agencia", "conta", "nome", "data", "tipo_inscricao", "inscricao",
+    "forma_iniciacao", "chave", "chave_pix",
+)
+
+# Longest value kept for fields rendered into a single slot
+NOME_LENGTH = SEGMENTO_A_PLAN.slots["nome_favorecido"][1]
+CHAVE_LENGTH = SEGMENTO_B_PLAN.slots["chave_pix_ou_conta"][1]
+
+
+def _to_bytes(values, encoding: str = "cp1252") -> np.ndarray:
+    # Sanitized CNAB fields are ASCII: NumPy encodes them in one pass
+    values = np.asarray(values, dtype=object)
+    try:
+        return values.astype(np.bytes_)
+    except UnicodeEncodeError:
+        return np.array([str(v).encode(encoding, errors="replace") for v in values], dtype=np.bytes_)
+
+
+class PaymentRecords:
+    """
+    Validated payments as a structured array (row_id, cents and TEXT_FIELDS).
+    Slicing or indexing returns PaymentRecords over the selected rows.
+    """
+    __slots__ = ("data",)
+
+    # Rows converted at a time: bounds the pandas temporaries of from_frame
+    BLOCK_ROWS = 65536
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "PaymentRecords":
+        """Builds the records of a validated upload; raises ValueError on an unparseable value."""
+        if len(df) <= cls.BLOCK_ROWS:
+            return cls(_frame_block(df))
+        blocks = [_frame_block(df.iloc[start:start + cls.BLOCK_ROWS]) for start in range(0, len(df), cls.BLOCK_ROWS)]
+        # Each text field as wide as its longest value in any block
+        dtype = [(name, max((block.dtype[name] for block in blocks), key=lambda d: d.itemsize))
+                 for name in blocks[0].dtype.names]
+        data = np.empty(len(df), dtype=dtype)
+        start = 0
+        while blocks:
+            block = blocks.pop(0)
+            for name in data.dtype.names:
+                data[name][start:start + len(block)] = block[name]
+            start += len(block)
+        return cls(data)
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, key) -> "PaymentRecords":
+        return PaymentRecords(self.data[key])
+
+    @property
+    def nbytes(self) -> int:
+        return self.data.nbytes
+
+    def by_forma(self):
+        """(forma, records) per forma_lancamento in ascending order, rows in their original order."""
+        forma = self.data["forma"]
+        for value in np.unique(forma):
+            yield value.decode("ascii"), PaymentRecords(self.data[forma == value])
+
+
+def checked_cents(df: pd.DataFrame) -> np.ndarray:
+    """Cents of the payments of df (see payment_cents); invalid or negative values raise ValueError."""
+    cents, valid = payment_cents(df)
+    if not valid.all():
+        raise ValueError(f"Valor inválido: {df['VALOR_PAGAMENTO'].iloc[int(np.argmin(valid))]!r}")
+    if len(cents) and cents.min() < 0:
+        raise ValueError(f"Valor negativo: {df['VALOR_PAGAMENTO'].iloc[int(np.argmin(cents))]!r}")
+    return cents
+
+
+def _frame_block(df: pd.DataFrame) -> np.ndarray:
+    # Structured array of the payments of df (see PaymentRecords.from_frame)
+    cents = checked_cents(df)
+
+    forma = classify_forma(df)
+    is_pix = (forma == "45").to_numpy()
+    tipo_inscricao, inscricao, _ = validate_documents(df["CPF_CNPJ"])
+    chave_pix = map_unique(_column(df, "CHAVE_PIX"), lambda v: str(v).strip()).where(is_pix, "")
+    # Segmento B of the Pix payments: key type detected from the key, key in its DICT format
+    forma_iniciacao = np.full(len(df), "", dtype=object)
+    chave = np.full(len(df), "", dtype=object)
+    forma_iniciacao[is_pix], chave[is_pix] = segmento_b_keys(chave_pix[is_pix], _column(df, "TIPO_CHAVE_PIX")[is_pix])
+
+    columns = {
+        "forma": forma,
+        "banco": clean_non_digits_column(df["COD_BANCO"]),
+        "agencia": clean_non_digits_column(df["AGENCIA"]),
+        "conta": clean_non_digits_column(df["CONTA"]),
+        "nome": map_unique(df["NOME_FAVORECIDO"], lambda v: sanitize_text(v)[:NOME_LENGTH]),
+        "data": map_unique(df["DATA_PAGAMENTO"], _format_date),
+        "forma_iniciacao": forma_iniciacao,
+        "chave": [key[:CHAVE_LENGTH] for key in chave],
+    }
+    arrays = {name: _to_bytes(values) for name, values in columns.items()}
+    arrays["tipo_inscricao"] = tipo_inscricao.astype(np.bytes_)
+    arrays["inscricao"] = inscricao # Already the cp1252 bytes
+    arrays["chave_pix"] = _to_bytes(chave_pix, "utf-8") # Stored as typed, for the payment index
+
+    dtype = [("row_id", np.int64), ("cents", np.int64)] + [(name, arrays[name].dtype) for name in TEXT_FIELDS]
+    data = np.empty(len(df), dtype=dtype)
+    data["row_id"] = np.asarray(df.index, dtype=np.int64)
+    data["cents"] = cents
+    for name in TEXT_FIELDS:
+        data[name] = arrays[name]
+    return data
+
+
+# --- Rendering ---
+
+def _slot(plan, field: str):
+    _, length, zero_left, default = plan.slots[field]
+    return plan.layout[field][0] - 1, length, zero_left, default
+
+
+def _put_text(out: np.ndarray, plan, field: str, values: np.ndarray):
+    # values[:length], then zfill / ljust; empty values keep the template (field default)
+    start, length, zero_left, default = _slot(plan, field)
+    values = np.ascontiguousarray(values) # Fields of the structured array are strided
+    n, width = len(values), values.dtype.itemsize
+    chars = values.view(np.uint8).reshape(n, width)
+    slot = out[:, start:start + length]
+    if not zero_left:
+        # NumPy pads byte strings with NULs: they become the spaces of ljust
+        keep = min(width, length)
+        slot[:, :keep] = chars[:, :keep]
+        slot[:, keep:] = ord(" ")
+        slot[slot == 0] = ord(" ")
+        if default:
+            slot[chars[:, 0] == 0] = _template(plan)[start:start + length]
+        return
+    # Right-aligned: one block copy per distinct value length
+    lengths = np.minimum(np.char.str_len(values), length)
+    for size in np.unique(lengths):
+        if size == 0 and default:
+            continue
+        rows = np.flatnonzero(lengths == size)
+        slot[rows, :length - size] = ord("0")
+        slot[rows, length - size:] = chars[rows, :size]
+
+
+def _put_digits(out: np.ndarray, plan, field: str, values: np.ndarray, width: int = None):
+    # str(value).zfill(width) at the start of the slot, digit by digit (values are never negative)
+    start, length, _, _ = _slot(plan, field)
+    width = width or length
+    values = np.asarray(values, dtype=np.int64)
+    if len(values) and values.max() >= 10 ** width:
+        _put_text(out, plan, field, np.char.zfill(values.astype(str), width).astype(np.bytes_))
+        return
+    for position in range(start + width - 1, start - 1, -1):
+        out[:, position] = 48 + values % 10
+        values = values // 10
+
+
+def _put_scalar(out: np.ndarray, plan, field: str, value: str):
+    if value == "":
+        return
+    start, length, zero_left, _ = _slot(plan, field)
+    out[:, start:start + length] = np.frombuffer(_pad(value, length, zero_left).encode("cp1252"), dtype=np.uint8)
+
+
+def _template(plan) -> np.ndarray:
+    return np.frombuffer(plan.template.encode("cp1252"), dtype=np.uint8)
+
+
+def _index_batch(forma: str, lote: str, data: np.ndarray, n_registro: np.ndarray) -> pd.DataFrame:
+    """Segmento A data of the records as expected by PaymentIndexWriter.add."""
+    text = lambda name, encoding="cp1252": np.char.decode(data[name], encoding).astype(object)
+    return pd.DataFrame({
+        "lote": lote,
+        "n_registro": n_registro,
+        "n_doc_empresa": np.char.zfill((data["row_id"] + 1).astype(str), 10).astype(object),
+        "forma_lancamento": forma,
+        "cpf_cnpj": text("inscricao"),
+        "valor": np.maximum(data["cents"], 0),
+        "data_pagamento": text("data"),
+        "chave_pix": text("chave_pix", "utf-8"),
+        "banco": text("banco"),
+        "agencia": text("agencia"),
+        "conta": text("conta"),
+    })
+
+
+def render_records(forma: str, records: PaymentRecords, lote_seq: int,
+                   items_offset: int = 0, start_total: int = 0, index_rows: list = None, out: np.ndarray = None):
+    """
+    Renders the detail records of one lote (or of a slice of it, continuing from
+    items_offset records and a running total of start_total cents).
+    Returns (matrix, items_in_lot, total_cents_lot), matrix being the cp1252
+    bytes of the records as a (records, 240) uint8 array.
+    When index_rows is a list, the payment index batch of the slice is appended to it.
+    With out (a (records, 240) uint8 view, e.g. over the output buffer) the
+    records are written there instead of a new matrix.
+    """
+    n = len(records)
+    is_pix = forma == '45'
+    matrix = out if out is not None else np.empty((n * 2 if is_pix else n, RECORD_LENGTH), dtype=np.uint8)
+    if n == 0:
+        return matrix, items_offset, start_total
+
+    data = records.data
+    lote = str(lote_seq)
+    total_cents_lot = start_total + int(data["cents"].sum())
+    seq = np.arange(1, n + 1)
+    n_registro_a = items_offset + (seq * 2 - 1 if is_pix else seq)
+
+    plan = SEGMENTO_A_PIX_PLAN if is_pix else SEGMENTO_A_PLAN
+    seg_a = matrix[0::2] if is_pix else matrix
+    seg_a[:] = _template(plan)
+    _put_scalar(seg_a, plan, "lote", lote)
+    _put_digits(seg_a, plan, "n_registro", n_registro_a)
+    _put_scalar(seg_a, plan, "camara", CAMARA_BY_FORMA.get(forma, '000'))
+    _put_text(seg_a, plan, "banco_favorecido", data["banco"])
+    _put_text(seg_a, plan, "agencia_favorecido", data["agencia"])
+    _put_text(seg_a, plan, "conta_favorecido", data["conta"])
+    _put_text(seg_a, plan, "nome_favorecido", data["nome"])
+    _put_digits(seg_a, plan, "n_doc_empresa", data["row_id"] + 1, width=10) # Seu Numero = ROW ID
+    _put_text(seg_a, plan, "data_pagamento", data["data"])
+    _put_digits(seg_a, plan, "valor_pagamento", data["cents"])
+    _put_text(seg_a, plan, "tipo_inscricao_fav", data["tipo_inscricao"])
+    if is_pix:
+        _put_scalar(seg_a, plan, "numero_inscricao_fav_part1", "0")
+    else:
+        _put_text(seg_a, plan, "numero_inscricao_fav", data["inscricao"])
+        _put_scalar(seg_a, plan, "cod_finalidade_ted", "00005" if forma == '41' else "")
+
+    if index_rows is not None:
+        index_rows.append(_index_batch(forma, lote, data, n_registro_a))
+    if not is_pix:
+        return matrix, items_offset + n, total_cents_lot
+
+    # Segment B for PIX
+    seg_b = matrix[1::2]
+    seg_b[:] = _template(SEGMENTO_B_PLAN)
+    _put_scalar(seg_b, SEGMENTO_B_PLAN, "lote", lote)
+    _put_digits(seg_b, SEGMENTO_B_PLAN, "n_registro", n_registro_a + 1)
+    _put_text(seg_b, SEGMENTO_B_PLAN, "forma_iniciacao", data["forma_iniciacao"])
+    _put_text(seg_b, SEGMENTO_B_PLAN, "tipo_inscricao_fav", data["tipo_inscricao"])
+    _put_text(seg_b, SEGMENTO_B_PLAN, "numero_inscricao_fav", data["inscricao"])
+    _put_text(seg_b, SEGMENTO_B_PLAN, "chave_pix_ou_conta", data["chave"])
+    return matrix, items_offset + n * 2, total_cents_lot
+
+
+def record_lines(matrix: np.ndarray) -> list:
+    """The rows of a rendered matrix as 240-byte bytes objects."""
+    return np.ascontiguousarray(matrix).view(f"S{RECORD_LENGTH}").ravel().tolist()
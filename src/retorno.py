@@ -0,0 +1,172 @@
+"""
+Retorno (.RET) processing for Bradesco Multipag CNAB 240 return files.
+
+The return file mirrors the remessa layouts in cnab_definitions; the bank fills
+positions 231-240 of each Segmento A with up to five 2-char occurrence codes.
+Files are streamed line by line (memory-mapped when given a path), so memory
+stays constant regardless of the file size; only per-lote counters are kept.
+"""
+from .cnab_definitions import SEGMENTO_A, RETORNO_SEGMENTO_A
+from .reader import CNABReader, field_value, record_kind
+
+# Positions 231-240: Códigos das Ocorrências para Retorno
+OCORRENCIAS_SPEC = RETORNO_SEGMENTO_A["ocorrencias"]
+
+STATUS_PAID = "paid"
+STATUS_REJECTED = "rejected"
+STATUS_PENDING = "pending"
+STATUSES = (STATUS_PAID, STATUS_REJECTED, STATUS_PENDING)
+
+OCORRENCIAS = {
+    "00": "Crédito ou Débito Efetivado",
+    "01": "Insuficiência de Fundos - Débito Não Efetuado",
+    "02": "Crédito ou Débito Cancelado pelo Pagador/Credor",
+    "03": "Débito Autorizado pela Agência - Efetuado",
+    "AA": "Controle Inválido",
+    "AB": "Tipo de Operação Inválido",
+    "AC": "Tipo de Serviço Inválido",
+    "AD": "Forma de Lançamento Inválida",
+    "AE": "Tipo/Número de Inscrição Inválido",
+    "AF": "Código de Convênio Inválido",
+    "AG": "Agência/Conta Corrente/DV Inválido",
+    "AH": "Nº Sequencial do Registro no Lote Inválido",
+    "AI": "Código de Segmento de Detalhe Inválido",
+    "AJ": "Tipo de Movimento Inválido",
+    "AK": "Código da Câmara de Compensação do Banco Favorecido Inválido",
+    "AL": "Código do Banco Favorecido Inválido",
+    "AM": "Agência Mantenedora da Conta Corrente do Favorecido Inválida",
+    "AN": "Conta Corrente/DV do Favorecido Inválido",
+    "AO": "Nome do Favorecido Não Informado",
+    "AP": "Data Lançamento Inválida",
+    "AQ": "Tipo/Quantidade da Moeda Inválido",
+    "AR": "Valor do Lançamento Inválido",
+    "AS": "Aviso ao Favorecido - Identificação Inválida",
+    "AT": "Tipo/Número de Inscrição do Favorecido Inválido",
+    "AU": "Logradouro do Favorecido Não Informado",
+    "AV": "Nº do Local do Favorecido Não Informado",
+    "AW": "Cidade do Favorecido Não Informada",
+    "AX": "CEP/Complemento do Favorecido Inválido",
+    "AY": "Sigla do Estado do Favorecido Inválida",
+    "BD": "Inclusão Efetuada com Sucesso",
+    "BE": "Pagamento Agendado",
+    "HA": "Lote Não Aceito",
+    "HB": "Inscrição da Empresa Inválida para o Contrato",
+    "HC": "Convênio com a Empresa Inexistente/Inválido para o Contrato",
+    "HD": "Agência/Conta Corrente da Empresa Inexistente/Inválido para o Contrato",
+    "HE": "Tipo de Serviço Inválido para o Contrato",
+    "HF": "Conta Corrente da Empresa com Saldo Insuficiente",
+    "HG": "Lote de Serviço Fora de Sequência",
+    "HH": "Lote de Serviço Inválido",
+    "TA": "Lote Não Aceito - Totais do Lote com Diferença",
+}
+
+PAID_CODES = {"00", "03"}
+PENDING_CODES = {"BD", "BE"}
+
+
+def split_ocorrencias(value: str) -> list:
+    """'00BD      ' -> ['00', 'BD']"""
+    value = value.strip()
+    return [value[i:i + 2] for i in range(0, len(value), 2) if value[i:i + 2].strip()]
+
+
+def payment_status(codes: list) -> str:
+    """Paid / rejected / pending from the occurrence codes of a Segmento A."""
+    if not codes:
+        return STATUS_PENDING
+    if codes[0] in PAID_CODES:
+        return STATUS_PAID
+    if all(code in PENDING_CODES for code in codes):
+        return STATUS_PENDING
+    return STATUS_REJECTED
+
+
+def _iter_raw_lines(source):
+    """Yields raw lines (no line break) from a path or a binary file object."""
+    if isinstance(source, str):
+        with CNABReader(source) as reader:
+            for _, _, raw in reader.iter_raw():
+                yield raw
+        return
+    for line in source:
+        yield line.rstrip(b"\r\n")
+
+
+def _int_field(raw, name: str) -> int:
+    value = field_value(raw, SEGMENTO_A[name])
+    return int(value) if value.isdigit() else 0
+
+
+def iter_payments(source):
+    """
+    Streams the Segmento A records of a return file as dicts with the payment
+    identification, amount in cents, occurrence codes and resulting status.
+    """
+    lote_forma = b""
+    for raw in _iter_raw_lines(source):
+        kind = record_kind(raw, lote_forma)
+        if kind == "header_lote":
+            lote_forma = bytes(raw[11:13])
+            continue
+        if kind not in ("segmento_a", "segmento_a_pix"):
+            continue
+
+        codes = split_ocorrencias(field_value(raw, OCORRENCIAS_SPEC))
+        yield {
+            "lote": _int_field(raw, "lote"),
+            "n_registro": _int_field(raw, "n_registro"),
+            "n_doc_empresa": field_value(raw, SEGMENTO_A["n_doc_empresa"]),
+            "n_doc_banco": field_value(raw, SEGMENTO_A["n_doc_banco"]),
+            "nome_favorecido": field_value(raw, SEGMENTO_A["nome_favorecido"]),
+            "data_pagamento": field_value(raw, SEGMENTO_A["data_pagamento"]),
+            "valor_cents": _int_field(raw, "valor_pagamento"),
+            "ocorrencias": codes,
+            "status": payment_status(codes),
+        }
+
+
+def _empty_totals() -> dict:
+    return {status: {"count": 0, "cents": 0} for status in STATUSES}
+
+
+def process_retorno(source, name: str = None) -> dict:
+    """
+    Aggregates paid / rejected / pending counts and amounts (in cents) per lote
+    and for the whole file, plus the number of payments per occurrence code.
+    """
+    lotes = {}
+    totals = _empty_totals()
+    ocorrencias = {}
+
+    for payment in iter_payments(source):
+        lote = lotes.setdefault(payment["lote"], _empty_totals())
+        status = payment["status"]
+        for bucket in (lote[status], totals[status]):
+            bucket["count"] += 1
+            bucket["cents"] += payment["valor_cents"]
+        for code in payment["ocorrencias"]:
+            ocorrencias[code] = ocorrencias.get(code, 0) + 1
+
+    return {
+        "file": name or (source if isinstance(source, str) else getattr(source, "name", "")),
+        "lotes": [{"lote": lote, **counts} for lote, counts in sorted(lotes.items())],
+        "totals": totals,
+        "ocorrencias": dict(sorted(ocorrencias.items())),
+    }
+
+
+def merge_summaries(summaries: list) -> dict:
+    """Totals of several processed return files (e.g. a whole month)."""
+    totals = _empty_totals()
+    ocorrencias = {}
+    for summary in summaries:
+        for status in STATUSES:
+            totals[status]["count"] += summary["totals"][status]["count"]
+            totals[status]["cents"] += summary["totals"][status]["cents"]
+        for code, count in summary["ocorrencias"].items():
+            ocorrencias[code] = ocorrencias.get(code, 0) + count
+    return {"files": len(summaries), "totals": totals, "ocorrencias": dict(sorted(ocorrencias.items()))}
+
+
+def describe_ocorrencia(code: str) -> str:
+    return OCORRENCIAS.get(code, "Código não catalogado")
@@ -0,0 +1,383 @@
+"""
+Local HTTP job service: other systems submit payrolls without the Streamlit UI.
+
+    python -m src.service --out remessas [--port 8089 --queue 16 --uploads 4 --processes 4]
+
+    POST /jobs?file_name=folha.xlsx[&cnpj=...&pix=0]   body: the payroll (xlsx, CSV or Parquet)
+        202 {"job": ..., "status": "queued"}; 503 + Retry-After when the queue is full
+        (sent before the body to clients using Expect: 100-continue)
+    GET  /jobs/<job>            status: queued, running, ok, invalid (validation errors) or error
+    GET  /jobs/<job>/download   the .REM once the status is ok (409 before)
+    GET  /health                queue depth, whether payments are indexed and jobs per status
+
+The company profile comes from config.json; the query string overrides its
+fields (nome, cnpj, convenio, agencia, conta, digito_conta; pix=0 for a
+header without the PIX flag). Every job reserves its NSA in config.json
+when it starts (config.NSAAllocator), committed only if the file is written.
+
+Submissions wait in a bounded queue. Room is checked once the request
+headers are read, before any of the body: when the queue (counting the
+uploads still arriving) is full, or --uploads bodies are already being
+received, the submission is refused with 503 and the client retries later.
+Clients sending "Expect: 100-continue" are refused before they send the
+body; the body of other refused requests is read and discarded. Accepted
+bodies are streamed to a spool file UPLOAD_CHUNK_BYTES at a time, so memory
+does not grow with the number or size of the uploads.
+
+A fixed number of worker tasks (one per pool process) take jobs off the
+queue and run the CPU-bound part (reading, validation and rendering, as in
+`python -m src.cli generate`) on a process pool, so the event loop only
+moves bytes: uploads go to disk and downloads out with sendfile. Spool files
+are removed once their job ends, whatever the outcome. Job statuses are kept
+in memory until the service stops.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qs, urlsplit
+
+EMPRESA_FIELDS = ("nome", "cnpj", "convenio", "agencia", "conta", "digito_conta")
+
+DEFAULT_QUEUE_SIZE = 16
+DEFAULT_MAX_UPLOADS = 4 # Request bodies received at the same time
+DEFAULT_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 1024 * 1024
+# Seconds a client refused with 503 should wait before submitting again
+RETRY_AFTER = 1
+
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 413: "Payload Too Large", 503: "Service Unavailable"}
+_FILE_NAME_RE = re.compile(r"[^A-Za-z0-9._-]")
+
+def _run_job(path: str, nsa: int, empresa_data: dict, out_dir: str, index_path: str = None) -> dict:
+    # In a pool process: read, validate and render one payroll (see cli._generate_one)
+    from .cli import _generate_one
+    payment_index = None
+    if index_path:
+        from .payment_index import PaymentIndex
+        payment_index = PaymentIndex(index_path)
+    try:
+        return _generate_one(path, nsa, empresa_data, out_dir, payment_index)
+    finally:
+        if payment_index is not None:
+            payment_index.close()
+
+def _write_spool(path: str, data: bytes):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def _remove(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="milliseconds")
+
+class JobService:
+    def __init__(self, out_dir: str, config_path: str = "config.json", index_path: str = None,
+                 queue_size: int = DEFAULT_QUEUE_SIZE, processes: int = None, spool_dir: str = None,
+                 max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES, max_uploads: int = DEFAULT_MAX_UPLOADS):
+        from .config import NSAAllocator
+        self.out_dir = out_dir
+        self.config_path = config_path
+        self.index_path = index_path
+        self.queue_size = queue_size
+        self.processes = processes or os.cpu_count() or 1
+        self.max_upload_bytes = max_upload_bytes
+        self.max_uploads = max_uploads
+        self.allocator = NSAAllocator(config_path)
+        self.jobs = {} # job id -> status dict (what GET /jobs/<job> returns)
+        self._spool_dir = spool_dir
+        self._own_spool = spool_dir is None
+        self._queue = None
+        self._uploads = None # Semaphore of the bodies being received
+        self._receiving = 0 # Admitted submissions whose body is still arriving
+        self._pool = None
+        self._workers = []
+        self._server = None
+
+    # --- Lifecycle ---
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8089):
+        """Starts the worker tasks and the HTTP server; returns the asyncio server."""
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self._own_spool:
+            self._spool_dir = tempfile.mkdtemp(prefix="remessa_jobs_")
+        else:
+            os.makedirs(self._spool_dir, exist_ok=True)
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._uploads = asyncio.Semaphore(self.max_uploads)
+        self._pool = ProcessPoolExecutor(max_workers=self.processes)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.processes)]
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    @property
+    def port(self) -> int:
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        # Running jobs are cancelled: their NSA reservations are released
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+        while self._queue is not None and not self._queue.empty():
+            _, path, _ = self._queue.get_nowait()
+            _remove(path)
+        if self._own_spool and self._spool_dir:
+            shutil.rmtree(self._spool_dir, ignore_errors=True)
+
+    # --- Jobs ---
+
+    @contextlib.asynccontextmanager
+    async def _upload_slot(self):
+        # A place in the queue and an upload slot, taken before the body is read; raises asyncio.QueueFull
+        if self._queue.qsize() + self._receiving >= self.queue_size or self._uploads.locked():
+            raise asyncio.QueueFull()
+        async with self._uploads:
+            self._receiving += 1
+            try:
+                yield
+            finally:
+                self._receiving -= 1
+
+    def _spool_path(self, file_name: str):
+        job_id = uuid.uuid4().hex
+        return job_id, os.path.join(self._spool_dir, f"{job_id}_{_FILE_NAME_RE.sub('_', os.path.basename(file_name))}")
+
+    def _enqueue(self, job_id: str, path: str, file_name: str, overrides: dict) -> dict:
+        # Cannot overflow: the upload slot kept a place in the queue
+        job = {"job": job_id, "status": "queued", "file_name": file_name, "submitted": _now()}
+        self._queue.put_nowait((job, path, overrides))
+        self.jobs[job_id] = job
+        return job
+
+    async def submit(self, content: bytes, file_name: str, overrides: dict) -> dict:
+        """Queues a payroll already in memory; raises asyncio.QueueFull when the queue is full."""
+        async with self._upload_slot():
+            job_id, path = self._spool_path(file_name)
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, _write_spool, path, content)
+                return self._enqueue(job_id, path, file_name, overrides)
+            except BaseException:
+                _remove(path)
+                raise
+
+    async def _receive(self, reader: asyncio.StreamReader, length: int, file_name: str, overrides: dict) -> dict:
+        # Streams the request body into a spool file and queues it
+        loop = asyncio.get_running_loop()
+        job_id, path = self._spool_path(file_name)
+        try:
+            with open(path, "wb") as f:
+                remaining = length
+                while remaining:
+                    chunk = await reader.read(min(UPLOAD_CHUNK_BYTES, remaining))
+                    if not chunk:
+                        raise asyncio.IncompleteReadError(b"", remaining)
+                    await loop.run_in_executor(None, f.write, chunk)
+                    remaining -= len(chunk)
+            return self._enqueue(job_id, path, file_name, overrides)
+        except BaseException:
+            _remove(path)
+            raise
+
+    def _empresa_data(self, overrides: dict) -> dict:
+        from .config import load_config, empresa_from_config
+        empresa_data = empresa_from_config(load_config(self.config_path), pix_flag=overrides.get("pix", "1") != "0")
+        empresa_data.update({key: overrides[key] for key in EMPRESA_FIELDS if key in overrides})
+        return empresa_data
+
+    async def _worker(self):
+        while True:
+            job, path, overrides = await self._queue.get()
+            try:
+                await self._run(job, path, overrides)
+            finally:
+                _remove(path)
+                self._queue.task_done()
+
+    async def _run(self, job: dict, path: str, overrides: dict):
+        loop = asyncio.get_running_loop()
+        job.update(status="running", started=_now())
+        reservation = None
+        try:
+            empresa_data = await loop.run_in_executor(None, self._empresa_data, overrides)
+            reservation = await loop.run_in_executor(None, self.allocator.reserve)
+            result = await loop.run_in_executor(self._pool, _run_job, path, reservation.nsa, empresa_data,
+                                                self.out_dir, self.index_path)
+        except asyncio.CancelledError:
+            if reservation is not None:
+                await loop.run_in_executor(None, reservation.release)
+            raise
+        except Exception as e:
+            result = {"status": "error", "errors": [str(e)]}
+        if reservation is not None:
+            await loop.run_in_executor(None, reservation.commit if result["status"] == "ok" else reservation.release)
+        result.pop("input", None)
+        job.update(result, finished=_now())
+
+    def health(self) -> dict:
+        statuses = {}
+        for job in self.jobs.values():
+            statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return {"queued": self._queue.qsize(), "receiving": self._receiving, "queue_size": self.queue_size,
+                "processes": self.processes, "index": bool(self.index_path), "jobs": statuses}
+
+    # --- HTTP ---
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # One request per connection (Connection: close)
+        try:
+            method, target, headers = await self._read_head(reader)
+            length = int(headers.get("content-length") or 0)
+            if length > self.max_upload_bytes:
+                await self._send_json(writer, 413, {"error": f"Arquivo maior que {self.max_upload_bytes} bytes"})
+                return
+            await self._route(reader, writer, method, target, headers, length)
+        except (ValueError, asyncio.IncompleteReadError):
+            await self._send_json(writer, 400, {"error": "Requisição inválida"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    @staticmethod
+    async def _read_head(reader: asyncio.StreamReader):
+        method, target, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                return method, target, headers
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+    @staticmethod
+    async def _discard(reader: asyncio.StreamReader, length: int):
+        # Reads and drops the body of a refused request, so the client gets the reply and not a reset
+        while length:
+            chunk = await reader.read(min(UPLOAD_CHUNK_BYTES, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+
+    async def _route(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, target: str,
+                     headers: dict, length: int):
+        # Only POST /jobs reads the request body
+        url = urlsplit(target)
+        parts = [part for part in url.path.split("/") if part]
+        if parts == ["jobs"]:
+            if method != "POST":
+                return await self._send_json(writer, 405, {"error": "Use POST"})
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            if not length:
+                return await self._send_json(writer, 400, {"error": "Planilha vazia"})
+            expect = headers.get("expect", "").lower() == "100-continue"
+            try:
+                async with self._upload_slot():
+                    if expect:
+                        writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+                    job = await self._receive(reader, length, query.pop("file_name", "planilha"), query)
+            except asyncio.QueueFull:
+                if not expect:
+                    await self._discard(reader, length)
+                return await self._send_json(writer, 503, {"error": "Fila cheia", "queued": self._queue.qsize()},
+                                             {"Retry-After": str(RETRY_AFTER)})
+            return await self._send_json(writer, 202, job, {"Location": f"/jobs/{job['job']}"})
+        if method != "GET":
+            return await self._send_json(writer, 405, {"error": "Use GET"})
+        if parts == ["health"]:
+            return await self._send_json(writer, 200, self.health())
+        job = self.jobs.get(parts[1]) if len(parts) in (2, 3) and parts[0] == "jobs" else None
+        if job is None or (len(parts) == 3 and parts[2] != "download"):
+            return await self._send_json(writer, 404, {"error": "Não encontrado"})
+        if len(parts) == 2:
+            return await self._send_json(writer, 200, job)
+        if job["status"] != "ok":
+            return await self._send_json(writer, 409, {"error": f"Job {job['status']}", "status": job["status"]})
+        await self._send_file(writer, job["output"])
+
+    @staticmethod
+    def _head(status: int, headers: dict) -> bytes:
+        lines = [f"HTTP/1.1 {status} {_REASONS[status]}"] + [f"{k}: {v}" for k, v in headers.items()]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _send_json(self, writer: asyncio.StreamWriter, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(self._head(status, {"Content-Type": "application/json; charset=utf-8",
+                                         "Content-Length": len(body), "Connection": "close", **(headers or {})}))
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_file(self, writer: asyncio.StreamWriter, path: str):
+        with open(path, "rb") as f:
+            writer.write(self._head(200, {
+                "Content-Type": "text/plain; charset=cp1252", "Content-Length": os.fstat(f.fileno()).st_size,
+                "Content-Disposition": f'attachment; filename="{os.path.basename(path)}"', "Connection": "close",
+            }))
+            await writer.drain()
+            await asyncio.get_running_loop().sendfile(writer.transport, f)
+
+async def serve(args):
+    service = JobService(args.out, config_path=args.config, index_path=None if args.no_index else args.index,
+                         queue_size=args.queue, processes=args.processes, spool_dir=args.spool,
+                         max_upload_bytes=args.max_upload_mb * 1024 * 1024, max_uploads=args.uploads)
+    server = await service.start(args.host, args.port)
+    print(json.dumps({"listening": f"http://{args.host}:{service.port}", "processes": service.processes,
+                      "queue": service.queue_size}), file=sys.stderr)
+    stop = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        except NotImplementedError: # Windows: Ctrl+C still raises KeyboardInterrupt
+            pass
+    try:
+        await stop.wait()
+    finally:
+        await service.close()
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m src.service", description="Serviço local de geração de remessas (HTTP)")
+    parser.add_argument("--out", required=True, help="Diretório de saída dos arquivos .REM")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--config", default="config.json", help="Arquivo de configuração (NSA e dados da empresa)")
+    parser.add_argument("--index", default="payments.db", help="Índice local de pagamentos (SQLite)")
+    parser.add_argument("--no-index", action="store_true", help="Não registra os pagamentos no índice")
+    parser.add_argument("--queue", type=int, default=DEFAULT_QUEUE_SIZE, help="Jobs aguardando na fila (acima disso: 503)")
+    parser.add_argument("--processes", type=int, help="Processos que geram os arquivos (padrão: CPUs)")
+    parser.add_argument("--uploads", type=int, default=DEFAULT_MAX_UPLOADS,
+                        help="Planilhas recebidas ao mesmo tempo (acima disso: 503)")
+    parser.add_argument("--spool", help="Diretório das planilhas recebidas (padrão: temporário)")
+    parser.add_argument("--max-upload-mb", type=int, default=DEFAULT_MAX_UPLOAD_BYTES // (1024 * 1024))
+    return parser
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
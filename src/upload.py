@@ -0,0 +1,157 @@
+"""
+Upload reading and validation rules shared by the Streamlit app and the CLI.
+
+Every rule runs as a column operation over the whole upload; per-value work
+(date parsing) is done once per distinct value with map_unique.
+"""
+import numpy as np
+import pandas as pd
+from .validators import (
+    validate_date_not_past, map_unique, parse_cents_column, format_amounts, validate_documents, CENTS_COLUMN
+)
+from .ingest import read_payroll
+from .duplicates import find_duplicates
+from .pix import classify_pix_keys, hint_type, KEY_TYPE_NAMES
+
+REQUIRED_COLUMNS = ["NOME_FAVORECIDO", "CPF_CNPJ", "COD_BANCO", "VALOR_PAGAMENTO", "DATA_PAGAMENTO"]
+
+# Bump whenever a rule below changes: cached validation results are keyed by it
+RULES_VERSION = 5
+
+# Columns of the issues frame returned by validate_upload
+ISSUE_COLUMNS = ["row", "column", "rule", "severity", "message"]
+
+# Inscription type (validate_documents) -> name in the messages; '0' = neither length
+DOCUMENT_NAMES = {"1": "CPF", "2": "CNPJ", "0": "CPF/CNPJ"}
+
+SEVERITY_ERROR = "error"
+SEVERITY_WARNING = "warning"
+
+def read_upload(source, stats: dict = None) -> pd.DataFrame:
+    """Reads an uploaded payroll (xlsx, CSV or Parquet; path, bytes or file object) as strings, without empty rows."""
+    return read_payroll(source, stats=stats)
+
+def missing_columns(df: pd.DataFrame) -> list:
+    return [c for c in REQUIRED_COLUMNS if c not in df.columns]
+
+def _text_column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name not in df.columns:
+        return pd.Series("", index=df.index, dtype=object)
+    return df[name].fillna("").astype(str)
+
+def _normalize_date(value: str) -> str:
+    """'2026-01-01 00:00:00' (Excel date read as text) -> '01/01/2026'; other values kept."""
+    parts = value.split()
+    dt_str = parts[0] if parts else ""
+    if '-' in dt_str:
+        try:
+            return pd.to_datetime(dt_str).strftime("%d/%m/%Y")
+        except (ValueError, OverflowError):
+            pass
+    return dt_str
+
+def _issues(mask: pd.Series, line_no: pd.Series, column: str, rule: str, severity: str, messages) -> pd.DataFrame:
+    rows = line_no[mask]
+    return pd.DataFrame({
+        "row": rows.to_numpy(),
+        "column": column,
+        "rule": rule,
+        "severity": severity,
+        "message": list(messages(rows)),
+    }, columns=ISSUE_COLUMNS)
+
+def validate_upload(df: pd.DataFrame):
+    """
+    Runs the upload rules on the whole frame.
+
+    Returns (normalized, issues, total_val):
+        normalized: copy of df with DATA_PAGAMENTO as DD/MM/AAAA, ready for CNABGenerator;
+            the value parsed once into CENTS_COLUMN (Int64 cents, <NA> when invalid), which
+            the generator uses as is, and VALOR_PAGAMENTO shown as '1234.56' (from 'R$ 1.234,56' etc.)
+        issues: DataFrame with ISSUE_COLUMNS, 'row' being the Excel line
+        total_val: sum of the valid values
+    """
+    line_no = pd.Series(np.asarray(df.index) + 2, index=df.index)
+    normalized = df.copy()
+    found = []
+
+    # Value (integer cents; an empty value counts as zero)
+    raw_val = _text_column(df, "VALOR_PAGAMENTO")
+    cents, parsed = parse_cents_column(raw_val)
+    empty = raw_val.str.replace("R$", "", regex=False).str.strip() == ""
+    bad_format = pd.Series(~parsed, index=df.index) & ~empty
+    bad_value = ~bad_format & (cents <= 0)
+    found.append(_issues(bad_format, line_no, "VALOR_PAGAMENTO", "valor_formato", SEVERITY_ERROR,
+                         lambda rows: (f"Linha {n}: Formato de valor inválido" for n in rows)))
+    found.append(_issues(bad_value, line_no, "VALOR_PAGAMENTO", "valor_positivo", SEVERITY_ERROR,
+                         lambda rows: (f"Linha {n}: Valor inválido (R$ {c / 100})" for n, c in zip(rows, cents[bad_value.to_numpy()]))))
+    normalized["VALOR_PAGAMENTO"] = pd.Series(format_amounts(cents), index=df.index).where(~bad_format, raw_val)
+    normalized[CENTS_COLUMN] = pd.Series(cents, index=df.index, dtype="Int64").mask(bad_format)
+
+    # Date
+    dates = map_unique(_text_column(df, "DATA_PAGAMENTO"), _normalize_date)
+    bad_date = ~map_unique(dates, validate_date_not_past).astype(bool)
+    found.append(_issues(bad_date, line_no, "DATA_PAGAMENTO", "data_futura", SEVERITY_ERROR,
+                         lambda rows: (f"Linha {n}: Data no passado ou inválida ({d})" for n, d in zip(rows, dates[bad_date]))))
+    normalized["DATA_PAGAMENTO"] = dates
+
+    # CPF / CNPJ (length and check digits)
+    documents = _text_column(df, "CPF_CNPJ")
+    tipo, _, valid = validate_documents(documents)
+    bad_document = pd.Series(~valid, index=df.index)
+    found.append(_issues(bad_document, line_no, "CPF_CNPJ", "documento_invalido", SEVERITY_ERROR,
+                         lambda rows: (f"Linha {n}: {DOCUMENT_NAMES[t]} inválido ({d})"
+                                       for n, t, d in zip(rows, tipo[~valid], documents[bad_document]))))
+
+    # Bank (TED to another bank without a Pix key)
+    banco = _text_column(df, "COD_BANCO").str.strip()
+    pix_key = _text_column(df, "CHAVE_PIX").str.strip()
+    ted = (pix_key == "") & (banco != "237") & (banco != "")
+    found.append(_issues(ted, line_no, "COD_BANCO", "ted_outro_banco", SEVERITY_WARNING,
+                         lambda rows: (f"Linha {n}: Transferência para Banco {b} (Será gerado como TED). Verifique se é intencional."
+                                       for n, b in zip(rows, banco[ted]))))
+
+    # Pix key (type detected from the key; TIPO_CHAVE_PIX should agree)
+    tipo_chave = _text_column(df, "TIPO_CHAVE_PIX")
+    kind = pd.Series("", index=df.index, dtype=object)
+    has_key = pix_key != ""
+    kind[has_key] = classify_pix_keys(pix_key[has_key], tipo_chave[has_key])[0]
+    bad_key = has_key & (kind == "")
+    found.append(_issues(bad_key, line_no, "CHAVE_PIX", "chave_pix_invalida", SEVERITY_ERROR,
+                         lambda rows: (f"Linha {n}: Chave Pix inválida ({k})" for n, k in zip(rows, pix_key[bad_key]))))
+    hint = map_unique(tipo_chave, hint_type)
+    other_type = has_key & ~bad_key & (hint != "") & (hint != kind)
+    found.append(_issues(other_type, line_no, "TIPO_CHAVE_PIX", "chave_pix_tipo", SEVERITY_WARNING,
+                         lambda rows: (f"Linha {n}: Chave Pix é {KEY_TYPE_NAMES[k]}, não {t}"
+                                       for n, k, t in zip(rows, kind[other_type], tipo_chave[other_type]))))
+
+    issues = pd.concat(found, ignore_index=True)
+    issues = issues.sort_values("row", kind="stable", ignore_index=True)
+    total_val = int(cents[~bad_format.to_numpy()].sum()) / 100
+    return normalized, issues, total_val
+
+def duplicate_issues(normalized: pd.DataFrame, payment_index=None) -> pd.DataFrame:
+    """
+    Warnings (ISSUE_COLUMNS) for payments repeated inside the upload or
+    already sent in an indexed remessa. Not cached with validate_upload:
+    the history changes with every generation.
+    """
+    dups = find_duplicates(normalized, payment_index)
+    in_upload = dups[dups["kind"] == "upload"]
+    in_history = dups[dups["kind"] == "history"].drop_duplicates("row")
+    messages = [f"Linha {r.row}: Pagamento repetido (mesmo favorecido, valor, data e destino da linha {r.first_row})"
+                for r in in_upload.itertuples()]
+    messages += [f"Linha {r.row}: Pagamento já enviado na remessa NSA {r.nsa} (lote {r.lote}, registro {r.n_registro})"
+                 for r in in_history.itertuples()]
+    issues = pd.DataFrame({
+        "row": list(in_upload["row"]) + list(in_history["row"]),
+        "column": "",
+        "rule": ["duplicado_planilha"] * len(in_upload) + ["duplicado_historico"] * len(in_history),
+        "severity": SEVERITY_WARNING,
+        "message": messages,
+    }, columns=ISSUE_COLUMNS)
+    return issues.sort_values("row", kind="stable", ignore_index=True)
+
+def issue_messages(issues: pd.DataFrame, severity: str = SEVERITY_ERROR) -> list:
+    """Messages of one severity, in row order."""
+    return issues.loc[issues["severity"] == severity, "message"].tolist()
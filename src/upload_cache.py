@@ -0,0 +1,87 @@
+"""
+Bounded LRU cache for the parse and validation stages of an upload.
+
+Streamlit reruns the whole script on every widget interaction. Keying the
+stages by a hash of the uploaded bytes (plus RULES_VERSION and the day, which
+the date rule depends on) lets a rerun skip every stage whose inputs did not
+change. Cached frames are shared between reruns: callers must not modify them.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from datetime import date
+from .upload import read_upload, validate_upload, RULES_VERSION
+
+DEFAULT_MAX_ENTRIES = 8
+
+def content_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class UploadCache:
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock() # Streamlit sessions run on separate threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    # --- Upload stages ---
+
+    def read(self, data: bytes, name: str = ""):
+        """(df, ingest stats) of an upload; name only matters for its extension."""
+        digest = content_digest(data)
+        ext = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+
+        def compute():
+            stats = {}
+            return read_upload(_named_buffer(data, name), stats=stats), stats
+
+        return digest, self.get_or_compute(("read", digest, ext), compute)
+
+    def validate(self, digest: str, df):
+        """(normalized, issues, total_val) of a frame returned by read()."""
+        key = ("validate", digest, RULES_VERSION, date.today().isoformat())
+        return self.get_or_compute(key, lambda: validate_upload(df))
+
+def _named_buffer(data: bytes, name: str) -> io.BytesIO:
+    """Binary file object over the bytes, named for format detection."""
+    buf = io.BytesIO(data)
+    buf.name = name
+    return buf
@@ -1,13 +1,37 @@
 import re
-from typing import Tuple
+from functools import lru_cache
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from typing import Optional, Tuple
+import numpy as np
+import pandas as pd
 from unidecode import unidecode
 from datetime import datetime
 
+_NON_DIGITS_RE = re.compile(r'\D')
+_STRICT_TEXT_RE = re.compile(r'[^A-Z0-9 ]')
+_EMAIL_TEXT_RE = re.compile(r'[^A-Z0-9 @\.\-\_]')
+
+# Names, banks and agencies repeat a lot in real payrolls: both sanitizers are
+# memoized in a bounded LRU cache (see sanitize_cache_info / clear_sanitize_cache).
+SANITIZE_CACHE_SIZE = 65536
+
 def clean_non_digits(value: str) -> str:
     """Removes non-digit characters."""
     if not value:
         return ""
-    return re.sub(r'\D', '', str(value))
+    try:
+        return _clean_non_digits_cached(value)
+    except TypeError: # Unhashable input
+        return _clean_non_digits(value)
+
+def _clean_non_digits(value) -> str:
+    value = str(value)
+    # Fast path: already plain ASCII digits
+    if value.isascii() and value.isdigit():
+        return value
+    return _NON_DIGITS_RE.sub('', value)
+
+_clean_non_digits_cached = lru_cache(maxsize=SANITIZE_CACHE_SIZE, typed=True)(_clean_non_digits)
 
 def sanitize_text(text: str, allow_email=False) -> str:
     """
@@ -17,21 +41,59 @@ def sanitize_text(text: str, allow_email=False) -> str:
     """
     if not text: 
         return ""
-    
-    # 1. Unidecode (Avó -> Avo)
-    text = unidecode(str(text))
+    try:
+        return _sanitize_text_cached(text, bool(allow_email))
+    except TypeError: # Unhashable input
+        return _sanitize_text(text, bool(allow_email))
+
+def _sanitize_text(text, allow_email: bool) -> str:
+    text = str(text)
+    # 1. Unidecode (Avó -> Avo), skipped for pure ASCII text
+    if not text.isascii():
+        text = unidecode(text)
     # 2. Upper
     text = text.upper()
     
     if allow_email:
         # Allow A-Z, 0-9, space, @, ., -, _
-        text = re.sub(r'[^A-Z0-9 @\.\-\_]', '', text)
+        text = _EMAIL_TEXT_RE.sub('', text)
     else:
         # Strict: A-Z, 0-9, Space
-        text = re.sub(r'[^A-Z0-9 ]', '', text)
+        text = _STRICT_TEXT_RE.sub('', text)
         
     return text.strip()
 
+_sanitize_text_cached = lru_cache(maxsize=SANITIZE_CACHE_SIZE, typed=True)(_sanitize_text)
+
+def sanitize_cache_info() -> dict:
+    """Hit/miss counters and size of the sanitizer caches."""
+    return {
+        "clean_non_digits": _clean_non_digits_cached.cache_info()._asdict(),
+        "sanitize_text": _sanitize_text_cached.cache_info()._asdict(),
+    }
+
+def clear_sanitize_cache():
+    _clean_non_digits_cached.cache_clear()
+    _sanitize_text_cached.cache_clear()
+
+def map_unique(series: pd.Series, func) -> pd.Series:
+    """Applies func once per distinct value of the column and broadcasts the results back."""
+    codes, uniques = pd.factorize(series.to_numpy(dtype=object), use_na_sentinel=False)
+    mapped = np.empty(len(uniques), dtype=object)
+    for i, value in enumerate(uniques):
+        mapped[i] = func(value)
+    return pd.Series(mapped[codes], index=series.index, dtype=object)
+
+def clean_non_digits_column(series: pd.Series) -> pd.Series:
+    """Batch clean_non_digits over a whole column."""
+    return map_unique(series, clean_non_digits)
+
+def sanitize_text_column(series: pd.Series, allow_email=False) -> pd.Series:
+    """Batch sanitize_text over a whole column."""
+    if allow_email:
+        return map_unique(series, lambda v: sanitize_text(v, allow_email=True))
+    return map_unique(series, sanitize_text)
+
 def validate_date_not_past(date_str: str) -> bool:
     """Input DD/MM/AAAA. Checks if >= today."""
     try:
@@ -56,6 +118,318 @@ def determine_inscription_type(value: str) -> Tuple[str, str]:
     else:
         return '0', cleaned
 
+# --- CPF / CNPJ check digits ---
+# Digit weights of the first and second check digits (modulo 11: remainders
+# 0 and 1 give 0, the others 11 - remainder)
+_CPF_WEIGHTS = tuple(np.arange(size + 1, 1, -1, dtype=np.int16) for size in (9, 10))
+_CNPJ_WEIGHTS = tuple(np.array(weights, dtype=np.int16) for weights in
+                      ([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]))
+
+# Rows per block of validate_documents (bounds the character matrices)
+_DOCUMENT_BLOCK_ROWS = 262144
+# Longer values skip the vectorized cleaning
+_DOCUMENT_MAX_CHARS = 32
+# More distinct digit layouts in a block than this: digits are moved one column at a time
+_DOCUMENT_MAX_LAYOUTS = 64
+
+def _check_digits_ok(digits: np.ndarray, weights) -> np.ndarray:
+    """Rows of an (n, 11) or (n, 14) digit matrix whose two last digits are the check digits."""
+    ok = np.ones(len(digits), dtype=bool)
+    for weight in weights:
+        size = len(weight)
+        rest = (digits[:, :size] @ weight) % 11
+        ok &= digits[:, size] == np.where(rest < 2, 0, 11 - rest)
+    # Repeated digits (000.000.000-00, 111...) pass the arithmetic but are not documents
+    return ok & (digits != digits[:, :1]).any(axis=1)
+
+def _right_align_digits(chars: np.ndarray, digit: np.ndarray, count: np.ndarray) -> np.ndarray:
+    """
+    The digits of each row of chars right-aligned into 14 columns of ASCII
+    zeros (the padding of 10 / 13 digit numbers comes for free); rows with
+    more than 14 digits are left as zeros.
+    """
+    n, width = chars.shape
+    numero = np.full((n, 14), 48, dtype=np.uint8)
+    # Payrolls format their documents a few ways: one block copy per layout of the digits
+    packed = np.zeros((n, 4), dtype=np.uint8)
+    packed[:, :(width + 7) // 8] = np.packbits(digit, axis=1, bitorder="little")
+    codes, layouts = pd.factorize(packed.view(np.uint32).ravel())
+    if len(layouts) <= _DOCUMENT_MAX_LAYOUTS:
+        for code, layout in enumerate(layouts):
+            columns = np.flatnonzero(np.unpackbits(np.array([layout], dtype=np.uint32).view(np.uint8),
+                                                   bitorder="little")[:width])
+            if len(columns) <= 14:
+                rows = np.flatnonzero(codes == code)
+                numero[rows, 14 - len(columns):] = chars[rows][:, columns]
+        return numero
+    column = 13 - count
+    fits = count <= 14
+    for j in range(width):
+        rows = np.flatnonzero(digit[:, j] & fits)
+        column[rows] += 1
+        numero[rows, column[rows]] = chars[rows, j]
+    return numero
+
+def _documents_block(chars: np.ndarray):
+    """
+    determine_inscription_type over an (n, width) matrix of ASCII bytes
+    (0 = padding). Returns (tipo, numero as S14 right-aligned in zeros, valid);
+    numero only holds the number for tipo '1' (last 11 digits) and '2'.
+    """
+    digit = (chars >= 48) & (chars <= 57)
+    count = digit.sum(axis=1)
+    numero = _right_align_digits(chars, digit, count)
+    is_cpf = (count == 10) | (count == 11)
+    is_cnpj = (count == 13) | (count == 14)
+    tipo = np.where(is_cpf, "1", np.where(is_cnpj, "2", "0"))
+    digits = (numero - 48).astype(np.int16)
+    valid = np.zeros(len(chars), dtype=bool)
+    valid[is_cpf] = _check_digits_ok(digits[is_cpf, 3:], _CPF_WEIGHTS)
+    valid[is_cnpj] = _check_digits_ok(digits[is_cnpj], _CNPJ_WEIGHTS)
+    return tipo, numero.view("S14").ravel(), valid
+
+def validate_documents(series: pd.Series) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    determine_inscription_type for a whole column, plus the CPF / CNPJ check digits.
+    Returns (tipo, numero, valid) arrays: tipo '1' (CPF), '2' (CNPJ) or '0';
+    numero the cleaned (zero padded) digits as cp1252 bytes, as written to the
+    file; valid True where the check digits match.
+    """
+    try:
+        values = series.to_numpy(dtype=object)
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    except TypeError: # Not only strings
+        values = series.fillna("").astype(str).to_numpy(dtype=object)
+        lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+    n = len(values)
+    tipo = np.full(n, "0", dtype="U1")
+    numero = np.zeros(n, dtype="S14")
+    valid = np.zeros(n, dtype=bool)
+    short = lengths <= _DOCUMENT_MAX_CHARS
+    fast = np.zeros(n, dtype=bool)
+
+    for start in range(0, n, _DOCUMENT_BLOCK_ROWS):
+        rows = np.arange(start, min(n, start + _DOCUMENT_BLOCK_ROWS))
+        rows = rows[short[rows]]
+        if not len(rows):
+            continue
+        width = max(1, int(lengths[rows].max()))
+        try:
+            chars = values[rows].astype(f"S{width}")
+        except UnicodeEncodeError:
+            # Non-ASCII text (other scripts' digits count for clean_non_digits) goes to the scalar path
+            rows = rows[np.fromiter(map(str.isascii, values[rows]), dtype=bool, count=len(rows))]
+            chars = values[rows].astype(f"S{width}")
+        chars = chars.view(np.uint8).reshape(len(rows), width)
+        tipo[rows], numero[rows], valid[rows] = _documents_block(chars)
+        fast[rows] = True
+
+    # A CPF is the last 11 of the 14 columns
+    cpf = np.flatnonzero(tipo == "1")
+    numero[cpf] = np.ascontiguousarray(numero[cpf].view(np.uint8).reshape(-1, 14)[:, 3:]).view("S11").ravel()
+
+    slow = np.flatnonzero(~fast | (tipo == "0"))
+    if len(slow):
+        # Other lengths keep all their digits; long or non-ASCII values once per distinct value
+        pairs = map_unique(pd.Series(values[slow]), determine_inscription_type)
+        slow_tipo = np.array([t for t, _ in pairs], dtype="U1")
+        slow_numero = [num.encode("cp1252", errors="replace") for _, num in pairs]
+        numero = numero.astype(f"S{max([14] + [len(num) for num in slow_numero])}")
+        tipo[slow], numero[slow] = slow_tipo, slow_numero
+        # Check digits of the ASCII numbers among them (other scripts' digits are never valid)
+        recheck = slow[(slow_tipo != "0") & np.array([num.isascii() for _, num in pairs], dtype=bool)]
+        if len(recheck):
+            valid[recheck] = validate_documents(pd.Series(numero[recheck].astype("U")))[2]
+    return tipo, numero, valid
+
+# --- Money (integer cents) ---
+# The decimal separator is the last ',' or '.' of the value; the other one is
+# a thousands separator. A lone separator repeated ("1.234.567") is thousands.
+# Amounts are rounded half-up at the cents on the exact decimal text.
+
+_MONEY_STRIP_RE = re.compile(r'R\$|\s')
+_MONEY_PATTERNS = {
+    ",": re.compile(r'(?:\d{1,3}(?:\.\d{3})+|\d*),\d*'),
+    ".": re.compile(r'(?:\d{1,3}(?:,\d{3})+|\d*)\.\d*'),
+    "": re.compile(r'\d{1,3}(?:\.\d{3})+|\d{1,3}(?:,\d{3})+|\d+'),
+}
+# int64 safe; CNAB value fields hold at most 18 digits of cents anyway
+_MONEY_MAX_INT_DIGITS = 16
+
+def _decimal_separator(text: str) -> str:
+    comma, dot = text.rfind(","), text.rfind(".")
+    if comma >= 0 and dot >= 0:
+        return "," if comma > dot else "."
+    if comma >= 0:
+        return "," if text.count(",") == 1 else ""
+    if dot >= 0:
+        return "." if text.count(".") == 1 else ""
+    return ""
+
+def _decimal_cents(text: str) -> Optional[int]:
+    # Anything else float() used to accept (e.g. '1e3')
+    try:
+        amount = Decimal(text)
+        if not amount.is_finite() or amount.adjusted() >= _MONEY_MAX_INT_DIGITS:
+            return None
+        return int((amount * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+    except InvalidOperation:
+        return None
+
+def parse_cents(value) -> Optional[int]:
+    """'R$ 1.234,56', '1234.56', '1,234.56', 150.5 -> int cents; None when not a number."""
+    if value is None:
+        return None
+    text = _MONEY_STRIP_RE.sub('', str(value))
+    negative = text.startswith("-")
+    if text[:1] in ("+", "-") and text:
+        text = text[1:]
+    sep = _decimal_separator(text)
+    if not _MONEY_PATTERNS[sep].fullmatch(text) or not any(c.isdigit() for c in text):
+        cents = _decimal_cents(text)
+        if cents is None:
+            return None
+    else:
+        if sep == ",":
+            text = text.replace(".", "").replace(",", ".")
+        else:
+            text = text.replace(",", "") if sep == "." else text.replace(",", "").replace(".", "")
+        int_part, _, frac = text.partition(".")
+        if len(int_part) > _MONEY_MAX_INT_DIGITS:
+            return None
+        frac = (frac + "000")[:3]
+        cents = int(int_part or "0") * 100 + int(frac[:2]) + (frac[2] >= "5")
+    return -cents if negative else cents
+
+# Integer cents of VALOR_PAGAMENTO in the frame validate_upload returns (see payment_cents)
+CENTS_COLUMN = "VALOR_CENTAVOS"
+
+# Rows per block of the vectorized money parser (bounds the character matrices)
+_MONEY_BLOCK_ROWS = 262144
+# Longer values skip the vectorized parser
+_MONEY_MAX_CHARS = 40
+
+def _parse_cents_block(chars: np.ndarray):
+    """
+    parse_cents over an (n, width) matrix of code points (0 = padding), for the
+    values made of digits, separators, one leading sign, blanks and 'R$'.
+    Returns (cents, matched); unmatched rows are left to parse_cents.
+    """
+    n, width = chars.shape
+    digit = (chars >= 48) & (chars <= 57)
+    comma = chars == 44
+    dot = chars == 46
+    sign = (chars == 45) | (chars == 43)
+    r_dollar = (chars == 82) & (np.roll(chars, -1, axis=1) == 36)
+    r_dollar[:, -1] = False
+    r_dollar |= np.roll(r_dollar, 1, axis=1) & (chars == 36)
+    blank = (chars == 0) | (chars == 32) | (chars == 9) | (chars == 10) | (chars == 13) | (chars == 160)
+    matched = ~(~(digit | comma | dot | sign | r_dollar | blank)).any(axis=1) & digit.any(axis=1)
+
+    # One sign, before every digit and separator
+    positions = np.arange(width)
+    first_char = np.where((digit | comma | dot).any(axis=1), np.argmax(digit | comma | dot, axis=1), width)
+    sign_count = sign.sum(axis=1)
+    sign_pos = np.argmax(sign, axis=1)
+    matched &= (sign_count == 0) | ((sign_count == 1) & (sign_pos < first_char))
+    negative = (sign & (chars == 45)).any(axis=1)
+
+    # Decimal separator: last of ',' / '.'; a lone separator kind repeated is thousands
+    n_comma, n_dot = comma.sum(axis=1), dot.sum(axis=1)
+    last_comma = np.where(n_comma > 0, width - 1 - np.argmax(comma[:, ::-1], axis=1), -1)
+    last_dot = np.where(n_dot > 0, width - 1 - np.argmax(dot[:, ::-1], axis=1), -1)
+    sep_is_comma = (n_comma > 0) & ((last_comma > last_dot) | (n_dot == 0)) & ~((n_dot == 0) & (n_comma > 1))
+    sep_is_dot = (n_dot > 0) & ((last_dot > last_comma) | (n_comma == 0)) & ~((n_comma == 0) & (n_dot > 1))
+    dec_pos = np.where(sep_is_comma, last_comma, np.where(sep_is_dot, last_dot, width))
+    # The decimal separator kind may not repeat
+    matched &= ~(sep_is_comma & (n_comma > 1)) & ~(sep_is_dot & (n_dot > 1))
+    thousands = np.where(sep_is_comma[:, None], dot, np.where(sep_is_dot[:, None], comma, comma | dot))
+    matched &= ~(thousands & (positions >= dec_pos[:, None])).any(axis=1)
+
+    # Thousands groups: 1-3 digits, then exactly 3 digits up to the decimal separator (or the end)
+    has_thousands = thousands.any(axis=1)
+    cum_digits = np.cumsum(digit, axis=1)
+    int_digits = np.where(dec_pos < width, cum_digits[np.arange(n), np.minimum(dec_pos, width - 1)], cum_digits[:, -1])
+    boundary = np.concatenate([thousands, np.zeros((n, 1), dtype=bool)], axis=1)
+    boundary[np.arange(n), np.minimum(dec_pos, width)] = True
+    cum_at = np.concatenate([cum_digits, cum_digits[:, -1:]], axis=1)
+    cum_at[np.arange(n), np.minimum(dec_pos, width)] = int_digits
+    at_boundary = np.where(boundary, cum_at, 0)
+    previous = np.concatenate([np.zeros((n, 1), dtype=cum_at.dtype),
+                               np.maximum.accumulate(at_boundary, axis=1)[:, :-1]], axis=1)
+    group = cum_at - previous
+    first_boundary = boundary & (previous == 0)
+    bad_group = boundary & ((first_boundary & ((group < 1) | (group > 3))) | (~first_boundary & (group != 3)))
+    matched &= ~has_thousands | ~bad_group.any(axis=1)
+    matched &= int_digits <= _MONEY_MAX_INT_DIGITS
+
+    # Value: integer digits by place value, then the first three decimals (half-up)
+    values = np.where(digit, chars - 48, 0).astype(np.int64)
+    is_int = digit & (positions < dec_pos[:, None])
+    place = np.clip(int_digits[:, None] - cum_digits, 0, 18)
+    integer = np.where(is_int, values * 10 ** place, 0).sum(axis=1)
+    decimal_rank = np.where(digit & ~is_int, cum_digits - int_digits[:, None], 0)
+    tenths = np.where(decimal_rank == 1, values, 0).sum(axis=1)
+    hundredths = np.where(decimal_rank == 2, values, 0).sum(axis=1)
+    round_up = np.where(decimal_rank == 3, values, 0).sum(axis=1) >= 5
+    cents = np.where(matched, integer * 100 + tenths * 10 + hundredths + round_up, 0)
+    return np.where(negative, -cents, cents), matched
+
+def parse_cents_column(series: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized parse_cents for a whole column.
+    Returns (cents int64 array, valid bool array); invalid entries hold 0.
+    """
+    values = series.fillna("").astype(str).to_numpy(dtype=object)
+    n = len(values)
+    cents = np.zeros(n, dtype=np.int64)
+    valid = np.zeros(n, dtype=bool)
+    lengths = np.fromiter(map(len, values), dtype=np.int64, count=n)
+    short = lengths <= _MONEY_MAX_CHARS
+
+    for start in range(0, n, _MONEY_BLOCK_ROWS):
+        rows = np.arange(start, min(n, start + _MONEY_BLOCK_ROWS))
+        rows = rows[short[rows]]
+        if not len(rows):
+            continue
+        width = max(1, int(lengths[rows].max()))
+        chars = values[rows].astype(f"U{width}").view(np.uint32).reshape(len(rows), width)
+        block_cents, block_matched = _parse_cents_block(chars)
+        cents[rows] = block_cents
+        valid[rows] = block_matched
+
+    # Everything else ('1e3', thousands typed oddly, garbage) once per distinct value
+    rest = np.flatnonzero(~valid)
+    if len(rest):
+        parsed = map_unique(pd.Series(values[rest]), parse_cents)
+        ok = parsed.notna().to_numpy(dtype=bool)
+        cents[rest[ok]] = parsed[ok].astype(np.int64).to_numpy()
+        valid[rest[ok]] = True
+    return cents, valid
+
+def payment_cents(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Integer cents of each payment: the CENTS_COLUMN validate_upload adds
+    (<NA> = invalid value) or, for frames that skipped it, VALOR_PAGAMENTO
+    parsed with parse_cents_column. Returns (cents int64 array, valid bool array).
+    """
+    if CENTS_COLUMN in df.columns:
+        cents = df[CENTS_COLUMN]
+        return cents.fillna(0).to_numpy(dtype=np.int64), cents.notna().to_numpy(dtype=bool)
+    return parse_cents_column(df["VALOR_PAGAMENTO"])
+
+def format_cents(cents: int) -> str:
+    """Cents as the digits of a CNAB value field (1 -> '001'); negative amounts -> '000'."""
+    if cents < 0:
+        return "000"
+    return str(cents).zfill(3)
+
+def format_amounts(cents: np.ndarray) -> np.ndarray:
+    """Cents as plain decimal text (123456 -> '1234.56', -5 -> '-0.05')."""
+    amount = np.abs(cents)
+    text = np.char.add(np.char.add((amount // 100).astype(str), "."), np.char.zfill((amount % 100).astype(str), 2))
+    return np.where(cents < 0, np.char.add("-", text), text).astype(object)
+
 def format_value(value) -> str:
     """Formats float to string with 2 decimal places, no dots."""
     try:
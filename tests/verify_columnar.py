@@ -0,0 +1,165 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.getcwd())
+
+import pandas as pd
+from src.generator import CNABGenerator
+from src.records import PaymentRecords
+from src.upload import validate_upload
+
+EMPRESA_DATA = {
+    "nome": "TESTE EMPRESA",
+    "cnpj": "12345678000199",
+    "convenio": "12345",
+    "agencia": "1234",
+    "conta": "12345",
+    "digito_conta": "0",
+    "pix_flag": "PIX"
+}
+
+def build_mixed_df():
+    # PIX with every key type, TED to other banks and CC (Bradesco 237)
+    data = [
+        ["JOÃO TED", "111.222.333-44", "341", "1234", "55555", "100.00", "25/12/2026", "", ""],
+        ["MARIA PIX", "555.666.777-88", "237", "1234", "66666", "50.5", "25/12/2026", "Email", "Maria@Pix.com"],
+        ["CONCEIÇÃO CC", "12.345.678/0001-95", "237", "0268-1", "98765-4", "1234.56", "01/11/2026", "", ""],
+        ["FONE PIX", "2345678901", "001", "12", "1", "0.01", "2026-12-31", "Telefone", "+55 (11) 98765-4321"],
+        ["CPF PIX", "123.456.789-09", "104", "1", "2", "99999.99", "01/11/2026", "CPF", "123.456.789-09"],
+        ["EVP PIX", "1234567800019", "260", "1", "2", "12.345", "01/11/2026", "Aleatoria", "123e4567-e89b-12d3-a456-426614174000"],
+        ["SEM TIPO PIX", "999", "077", "1", "2", "10", "01/11/2026", "", "chave_sem_tipo"],
+        ["OUTRO TED", "111.222.333-44", "0104", "0001", "123", "7.1", "25/12/2026", "", ""],
+        ["OUTRO CC", "555.666.777-88", "237", "0001", "321", "8", "25/12/2026", "", ""],
+    ]
+    cols = ["NOME_FAVORECIDO", "CPF_CNPJ", "COD_BANCO", "AGENCIA", "CONTA", "VALOR_PAGAMENTO",
+            "DATA_PAGAMENTO", "TIPO_CHAVE_PIX", "CHAVE_PIX"]
+    df = pd.DataFrame(data * 5, columns=cols)
+    # Non-contiguous index, as left by the empty row filter in the app
+    df.index = df.index * 3 + 1
+    return df
+
+def test_columnar_matches_per_row():
+    df = build_mixed_df()
+
+    per_row = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(df.copy())
+    columnar = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(df.copy(), columnar=True)
+
+    # Skip the file header: it carries the generation time
+    per_row_lines = per_row.split(b'\r\n')
+    columnar_lines = columnar.split(b'\r\n')
+    assert len(per_row_lines) == len(columnar_lines)
+    assert per_row_lines[1:] == columnar_lines[1:]
+    assert all(len(line) == 240 for line in columnar_lines)
+
+def test_lote_split_and_parallel_rendering():
+    df = build_mixed_df()
+
+    per_row = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, max_lote_records=7).generate(df.copy())
+    gen = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, max_lote_records=7, workers=2)
+    parallel = gen.generate(df.copy(), columnar=True)
+
+    lines = parallel.split(b'\r\n')
+    assert per_row.split(b'\r\n')[1:] == lines[1:]
+    # 10 CC -> 2 lotes, 10 TED -> 2, 25 Pix (2 records each, 3 per lote) -> 9
+    assert gen.lotes_count == 13
+    details = [line for line in lines if line[7:8] == b'3']
+    assert max(int(line[8:13]) for line in details) == 7
+    assert lines[-1][17:23] == b'000013'
+
+def test_payment_records_render_like_the_frame():
+    df = build_mixed_df()
+    records = PaymentRecords.from_frame(df)
+
+    from_frame = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(df.copy(), columnar=True)
+    from_records = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(records)
+    assert from_records.split(b'\r\n')[1:] == from_frame.split(b'\r\n')[1:]
+    # One fixed-width row per payment, far below the DataFrame's object strings
+    assert records.nbytes < df.memory_usage(deep=True).sum() / 2
+    assert [forma for forma, _ in records.by_forma()] == ['01', '41', '45']
+    assert list(records[5:8].data["row_id"]) == list(df.index[5:8])
+
+def test_check_documents():
+    df = build_mixed_df()
+    valid = df[df["CPF_CNPJ"].isin(["12.345.678/0001-95", "123.456.789-09"])]
+    for payments in (df, PaymentRecords.from_frame(df)):
+        try:
+            CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, check_documents=True).generate(payments)
+            assert False, "invalid CPF accepted"
+        except ValueError as e:
+            assert "CPF/CNPJ inválido" in str(e)
+    strict = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, check_documents=True).generate(valid.copy())
+    plain = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(valid.copy())
+    assert strict.split(b'\r\n')[1:] == plain.split(b'\r\n')[1:]
+
+def test_validated_cents_and_negative_values():
+    df = build_mixed_df()
+    expected = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(df.copy())
+    # The generator takes the cents validate_upload parsed, not the value text
+    normalized = validate_upload(df)[0].assign(VALOR_PAGAMENTO="ignorado")
+    for columnar in (False, True):
+        generated = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(normalized, columnar=columnar)
+        assert generated.split(b'\r\n')[1:] == expected.split(b'\r\n')[1:]
+
+    negative = df.copy()
+    negative.loc[negative.index[3], "VALOR_PAGAMENTO"] = "-10,00"
+    for payments in (negative, validate_upload(negative)[0]):
+        for columnar in (False, True):
+            try:
+                CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA).generate(payments, columnar=columnar)
+                assert False, "negative value accepted"
+            except ValueError as e:
+                assert "Valor negativo" in str(e)
+
+def test_render_into_buffer_and_mmap():
+    df = build_mixed_df()
+    gen = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA)
+    expected = gen.generate(df.copy())
+
+    buf = bytearray(len(expected) + 10)
+    assert bytes(gen.render(df.copy(), out=buf)[:len(expected)]) == expected
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "out.rem")
+        assert gen.write_file(path, df.copy()) == len(expected)
+        with open(path, "rb") as f:
+            assert f.read() == expected
+    try:
+        gen.render(df.copy(), out=bytearray(10))
+        assert False, "buffer too small"
+    except ValueError:
+        pass
+
+def test_file_limits():
+    df = build_mixed_df() # 45 payments, 25 of them Pix: 70 detail records in 3 lotes -> 78 records
+    for columnar in (False, True):
+        gen = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA)
+        gen.MAX_FILE_RECORDS = 78
+        assert gen.generate(df.copy(), columnar=columnar).count(b'\r\n') == 77
+        gen.MAX_FILE_RECORDS = 77
+        try:
+            gen.generate(df.copy(), columnar=columnar)
+            assert False, "file over the record limit"
+        except ValueError as e:
+            assert "78 registros" in str(e) and "pelo menos 2 arquivos" in str(e)
+
+    # Lote numbers have 4 digits: 9999 lotes of 2 TED payments fit, one more payment does not
+    ted = pd.concat([df[df["COD_BANCO"] == "341"]] * 4000, ignore_index=True)
+    gen = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, max_lote_records=2)
+    gen.render(ted.iloc[:19998])
+    assert gen.lotes_count == 9999
+    try:
+        gen.render(ted.iloc[:19999])
+        assert False, "file over the lote limit"
+    except ValueError as e:
+        assert "10000 lotes" in str(e)
+    # Split into remessas that each fit
+    assert [entry["lotes"] for entry in gen.generate_split(ted.iloc[:19999], n_files=2, processes=1)["files"]] == [5000, 5000]
+
+if __name__ == "__main__":
+    test_columnar_matches_per_row()
+    test_lote_split_and_parallel_rendering()
+    test_payment_records_render_like_the_frame()
+    test_check_documents()
+    test_validated_cents_and_negative_values()
+    test_render_into_buffer_and_mmap()
+    test_file_limits()
+    print("Columnar output matches per-row output.")
@@ -0,0 +1,52 @@
+import sys
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+sys.path.append(os.getcwd())
+
+from src.config import NSAAllocator, load_config
+
+def _reserve_many(path, count, block):
+    allocator = NSAAllocator(path)
+    taken = []
+    for _ in range(count):
+        with allocator.reserve(block) as reservation:
+            taken.extend(reservation.nsas)
+    return taken
+
+def test_nsa_allocator_concurrent_reservations():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config.json")
+        with ThreadPoolExecutor(4) as pool:
+            threads = [pool.submit(_reserve_many, path, 20, 1) for _ in range(4)]
+        with ProcessPoolExecutor(2) as pool:
+            processes = [pool.submit(_reserve_many, path, 10, 3) for _ in range(2)]
+        taken = [nsa for f in threads + processes for nsa in f.result()]
+
+        # Every NSA handed out once, no gaps, open reservations all closed
+        assert sorted(taken) == list(range(1, 1 + 80 + 60))
+        config = load_config(path)
+        assert config["nsa"] == 141 and "nsa_reservas" not in config
+
+def test_nsa_allocator_release_and_manual_nsa():
+    with tempfile.TemporaryDirectory() as tmp:
+        allocator = NSAAllocator(os.path.join(tmp, "config.json"))
+        try:
+            with allocator.reserve(2):
+                raise RuntimeError("geração falhou")
+        except RuntimeError:
+            pass
+        assert allocator.peek() == 1 # Last reservation released: NSAs reused
+
+        first = allocator.reserve()
+        allocator.reserve().commit()
+        first.release()
+        assert allocator.peek() == 3 # Not the last one: NSA 1 becomes a gap, never a repeat
+
+        assert allocator.reserve(at=10).nsa == 10
+        try:
+            allocator.reserve(at=5)
+            assert False, "NSA below the next free one must be refused"
+        except ValueError:
+            pass
+        assert allocator.peek() == 11
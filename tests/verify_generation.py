@@ -19,26 +19,24 @@ def test_generation():
     # Create DF with mixed types
     data = [
         {
-            "Nome Favorecido": "JOAO TED",
-            "CPF/CNPJ": "111.222.333-44",
-            "Banco (Código)": "341",
-            "Agência": "1234",
-            "Conta": "55555",
-            "Valor": 100.00,
-            "Data Pagamento (DD/MM/AAAA)": "13/01/2026",
-            "Tipo de Pagamento (PIX/TED/DOC/CC)": "TED"
+            "NOME_FAVORECIDO": "JOAO TED",
+            "CPF_CNPJ": "111.222.333-44",
+            "COD_BANCO": "341",
+            "AGENCIA": "1234",
+            "CONTA": "55555",
+            "VALOR_PAGAMENTO": 100.00,
+            "DATA_PAGAMENTO": "13/01/2099",
         },
         {
-            "Nome Favorecido": "MARIA PIX",
-            "CPF/CNPJ": "555.666.777-88",
-            "Banco (Código)": "237",
-            "Agência": "1234",
-            "Conta": "66666",
-            "Valor": 50.00,
-            "Data Pagamento (DD/MM/AAAA)": "13/01/2026",
-            "Tipo de Pagamento (PIX/TED/DOC/CC)": "PIX",
-            "Chave Pix (Se PIX)": "maria@pix.com",
-            "Tipo Chave Pix (Email, Telefone, CPF, Aleatoria, Banco)": "Email"
+            "NOME_FAVORECIDO": "MARIA PIX",
+            "CPF_CNPJ": "555.666.777-88",
+            "COD_BANCO": "237",
+            "AGENCIA": "1234",
+            "CONTA": "66666",
+            "VALOR_PAGAMENTO": 50.00,
+            "DATA_PAGAMENTO": "13/01/2099",
+            "CHAVE_PIX": "maria@pix.com",
+            "TIPO_CHAVE_PIX": "Email"
         }
     ]
     
@@ -47,14 +45,13 @@ def test_generation():
     generator = CNABGenerator(nsa=1, empresa_data=empresa_data)
     content = generator.generate(df)
     
-    lines = content.split('\r\n')
+    lines = content.decode('cp1252').split('\r\n')
     
     print(f"Generated {len(lines)} lines.")
     
     for i, line in enumerate(lines):
         print(f"Line {i+1} Length: {len(line)}")
-        if len(line) != 240:
-            print(f"ERROR: Line {i+1} is not 240 chars!")
+        assert len(line) == 240, f"Line {i+1} is not 240 chars!"
         
         # Check specific content
         # Line 3 should be Seg A for TED (HeaderFile, HeaderLote(Pix? No mix groups?), HeaderLote(Ted?))
@@ -0,0 +1,37 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.getcwd())
+
+from src.generator import CNABGenerator
+from src.reader import CNABReader, read_frames
+from tests.verify_columnar import EMPRESA_DATA, build_mixed_df
+
+def test_reader_round_trip():
+    df = build_mixed_df()
+    content = CNABGenerator(nsa=7, empresa_data=EMPRESA_DATA).generate(df, columnar=True)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "CB0101007.REM")
+        with open(path, "wb") as f:
+            f.write(content)
+
+        with CNABReader(path) as reader:
+            records = list(reader)
+            kinds = [r.kind for r in records]
+            assert kinds[0] == "header_arquivo" and kinds[-1] == "trailer_arquivo"
+            assert kinds.count("segmento_a") + kinds.count("segmento_a_pix") == len(df)
+            assert kinds.count("segmento_b") == kinds.count("segmento_a_pix")
+            assert records[0]["nsa"] == "000007"
+            assert records[-1]["qtd_registros"] == str(len(records)).zfill(6)
+            lines = [r.text for r in records]
+            del records
+
+        frames = read_frames(path)
+        assert sum(len(f) for f in frames.values()) == len(lines)
+        seg_a = frames["segmento_a_pix"].iloc[0]
+        assert lines[seg_a["line_no"] - 1][43:73].rstrip() == seg_a["nome_favorecido"]
+
+if __name__ == "__main__":
+    test_reader_round_trip()
+    print("Reader round trip OK.")
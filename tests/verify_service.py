@@ -0,0 +1,141 @@
+import sys
+import os
+import asyncio
+import json
+import tempfile
+sys.path.append(os.getcwd())
+
+from benchmarks.loadtest import request
+from benchmarks.synthetic import synthetic_payroll
+from src.config import load_config
+from src.payment_index import PaymentIndex
+from src.service import JobService
+
+def _payroll(rows=50):
+    return synthetic_payroll(rows, seed=3).to_csv(index=False, sep=";").encode("utf-8")
+
+async def _wait(port, job_id):
+    while True:
+        job = json.loads((await request("127.0.0.1", port, "GET", f"/jobs/{job_id}"))[2])
+        if job["status"] not in ("queued", "running"):
+            return job
+        await asyncio.sleep(0.05)
+
+def test_service_submit_status_download():
+    async def scenario(tmp_dir):
+        config = os.path.join(tmp_dir, "config.json")
+        spool = os.path.join(tmp_dir, "spool")
+        service = JobService(os.path.join(tmp_dir, "out"), config_path=config, processes=1, spool_dir=spool)
+        await service.start(port=0)
+        try:
+            status, headers, body = await request("127.0.0.1", service.port, "POST",
+                                                  "/jobs?file_name=folha.csv&nome=EMPRESA%20TESTE", _payroll())
+            assert status == 202 and headers["location"] == f"/jobs/{json.loads(body)['job']}"
+            job = await _wait(service.port, json.loads(body)["job"])
+            assert job["status"] == "ok" and job["nsa"] == 1 and job["payments"] == 50
+
+            status, _, data = await request("127.0.0.1", service.port, "GET", f"/jobs/{job['job']}/download")
+            with open(job["output"], "rb") as f:
+                assert status == 200 and data == f.read() and len(data) == job["bytes"]
+            assert b"EMPRESA TESTE" in data[:240]
+            assert load_config(config)["nsa"] == 2
+
+            # A payroll missing columns: invalid, NSA released, nothing to download
+            status, _, body = await request("127.0.0.1", service.port, "POST", "/jobs?file_name=x.csv", b"a;b\n1;2\n")
+            job = await _wait(service.port, json.loads(body)["job"])
+            assert job["status"] == "invalid" and job["errors"]
+            assert (await request("127.0.0.1", service.port, "GET", f"/jobs/{job['job']}/download"))[0] == 409
+            assert (await request("127.0.0.1", service.port, "GET", "/jobs/nada"))[0] == 404
+            assert load_config(config)["nsa"] == 2
+            # Spool files go away whatever the outcome
+            assert os.listdir(spool) == []
+        finally:
+            await service.close()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(scenario(tmp_dir))
+
+def test_service_backpressure():
+    async def scenario(tmp_dir):
+        service = JobService(os.path.join(tmp_dir, "out"), config_path=os.path.join(tmp_dir, "config.json"),
+                             queue_size=1, processes=1)
+        await service.start(port=0)
+        try:
+            # One job running, one waiting: the queue is full, further submissions are refused
+            content = _payroll(2000)
+            replies = [await request("127.0.0.1", service.port, "POST", "/jobs?file_name=folha.csv", content)
+                       for _ in range(4)]
+            statuses = [status for status, _, _ in replies]
+            assert statuses[:2] == [202, 202] and 503 in statuses[2:]
+            assert all(headers["retry-after"] for status, headers, _ in replies if status == 503)
+            health = json.loads((await request("127.0.0.1", service.port, "GET", "/health"))[2])
+            assert health["queue_size"] == 1 and sum(health["jobs"].values()) == statuses.count(202)
+            for status, _, body in replies:
+                if status == 202:
+                    assert (await _wait(service.port, json.loads(body)["job"]))["status"] == "ok"
+        finally:
+            await service.close()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(scenario(tmp_dir))
+
+def test_service_refuses_before_the_body():
+    async def scenario(tmp_dir):
+        service = JobService(os.path.join(tmp_dir, "out"), config_path=os.path.join(tmp_dir, "config.json"),
+                             processes=1, max_uploads=1)
+        await service.start(port=0)
+        try:
+            content = _payroll()
+            # A slow upload holds the only upload slot
+            reader, writer = await asyncio.open_connection("127.0.0.1", service.port)
+            writer.write(f"POST /jobs?file_name=folha.csv HTTP/1.1\r\nContent-Length: {len(content)}\r\n"
+                         f"Connection: close\r\n\r\n".encode("latin-1") + content[:100])
+            await writer.drain()
+            while service.health()["receiving"] == 0:
+                await asyncio.sleep(0.01)
+
+            # With Expect: 100-continue the body is never sent; without it, it is read and dropped
+            status, headers, _ = await request("127.0.0.1", service.port, "POST", "/jobs", content)
+            assert status == 503 and headers["retry-after"]
+            other_reader, other_writer = await asyncio.open_connection("127.0.0.1", service.port)
+            other_writer.write(f"POST /jobs HTTP/1.1\r\nContent-Length: {len(content)}\r\n"
+                               f"Connection: close\r\n\r\n".encode("latin-1") + content)
+            assert (await other_reader.readline()).startswith(b"HTTP/1.1 503")
+            other_writer.close()
+
+            writer.write(content[100:])
+            status_line = await reader.readline()
+            writer.close()
+            assert status_line.startswith(b"HTTP/1.1 202")
+            assert service.health()["receiving"] == 0
+        finally:
+            await service.close()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(scenario(tmp_dir))
+
+def test_service_concurrent_jobs_with_index():
+    async def scenario(tmp_dir):
+        index_path = os.path.join(tmp_dir, "payments.db")
+        service = JobService(os.path.join(tmp_dir, "out"), config_path=os.path.join(tmp_dir, "config.json"),
+                             index_path=index_path, processes=2)
+        await service.start(port=0)
+        try:
+            # Jobs render at the same time and each records its payments in the shared index
+            replies = await asyncio.gather(*(request("127.0.0.1", service.port, "POST", "/jobs?file_name=folha.csv",
+                                                     _payroll(1000)) for _ in range(4)))
+            assert [status for status, _, _ in replies] == [202] * 4
+            jobs = [await _wait(service.port, json.loads(body)["job"]) for _, _, body in replies]
+            assert [job["status"] for job in jobs] == ["ok"] * 4
+            assert sorted(job["nsa"] for job in jobs) == [1, 2, 3, 4]
+            assert json.loads((await request("127.0.0.1", service.port, "GET", "/health"))[2])["index"]
+        finally:
+            await service.close()
+        with PaymentIndex(index_path) as index:
+            assert index.count() == 4000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        asyncio.run(scenario(tmp_dir))
+
+if __name__ == "__main__":
+    test_service_submit_status_download()
+    test_service_backpressure()
+    test_service_refuses_before_the_body()
+    test_service_concurrent_jobs_with_index()
+    print("Job service tests passed.")
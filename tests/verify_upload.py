@@ -0,0 +1,183 @@
+import sys
+import os
+import tempfile
+sys.path.append(os.getcwd())
+
+import numpy as np
+import pandas as pd
+from src.upload import read_upload, validate_upload, issue_messages, SEVERITY_WARNING
+from src.upload_cache import UploadCache
+from src.pix import classify_pix_keys, segmento_b_keys
+from src.validators import parse_cents, parse_cents_column, validate_documents, determine_inscription_type, CENTS_COLUMN
+
+def test_validate_upload():
+    df = pd.DataFrame([
+        {"NOME_FAVORECIDO": "A", "CPF_CNPJ": "529.982.247-25", "COD_BANCO": "237", "VALOR_PAGAMENTO": "R$ 10,50", "DATA_PAGAMENTO": "2099-12-31 00:00:00", "CHAVE_PIX": ""},
+        {"NOME_FAVORECIDO": "B", "CPF_CNPJ": "12345678909", "COD_BANCO": "341", "VALOR_PAGAMENTO": "abc", "DATA_PAGAMENTO": "31/12/2099", "CHAVE_PIX": ""},
+        {"NOME_FAVORECIDO": "C", "CPF_CNPJ": "12.345.678/0001-95", "COD_BANCO": "341", "VALOR_PAGAMENTO": "0", "DATA_PAGAMENTO": "01/01/2000", "CHAVE_PIX": "a@b.com"},
+    ], index=[0, 2, 5]) # Empty rows already filtered out
+
+    normalized, issues, total_val = validate_upload(df)
+
+    assert normalized.loc[0, "VALOR_PAGAMENTO"] == "10.50"
+    assert list(normalized[CENTS_COLUMN].astype(object)) == [1050, pd.NA, 0]
+    assert normalized.loc[0, "DATA_PAGAMENTO"] == "31/12/2099"
+    assert total_val == 10.5
+    assert list(issues["rule"]) == ["valor_formato", "ted_outro_banco", "valor_positivo", "data_futura"]
+    assert list(issues["row"]) == [4, 4, 7, 7]
+    assert issue_messages(issues) == [
+        "Linha 4: Formato de valor inválido",
+        "Linha 7: Valor inválido (R$ 0.0)",
+        "Linha 7: Data no passado ou inválida (01/01/2000)",
+    ]
+    assert len(issue_messages(issues, SEVERITY_WARNING)) == 1
+
+def test_validate_documents():
+    values = ["529.982.247-25", "5299822472", "529.982.247-26", "111.111.111-11",
+              "12.345.678/0001-95", "1234567800019", "999", ""]
+    tipo, numero, valid = validate_documents(pd.Series(values))
+    assert list(tipo) == ["1", "1", "1", "1", "2", "2", "0", "0"]
+    assert list(numero) == [b"52998224725", b"05299822472", b"52998224726", b"11111111111",
+                            b"12345678000195", b"01234567800019", b"999", b""]
+    assert list(valid) == [True, False, False, False, True, False, False, False]
+    assert all((t, n.decode()) == determine_inscription_type(v) for v, t, n in zip(values, tipo, numero))
+
+    df = pd.DataFrame({"NOME_FAVORECIDO": "A", "CPF_CNPJ": ["529.982.247-25", "529.982.247-26", "12.345.678/0001-96", "999"],
+                       "COD_BANCO": "237", "VALOR_PAGAMENTO": "1", "DATA_PAGAMENTO": "31/12/2099"})
+    _, issues, _ = validate_upload(df)
+    assert issue_messages(issues) == [
+        "Linha 3: CPF inválido (529.982.247-26)",
+        "Linha 4: CNPJ inválido (12.345.678/0001-96)",
+        "Linha 5: CPF/CNPJ inválido (999)",
+    ]
+
+def test_pix_keys():
+    keys = pd.Series(["Maria@Pix.com", "+55 (11) 98765-4321", "123.456.789-09", "123E4567-E89B-12D3-A456-426614174000",
+                      "11987654321", "52998224725", "52998224725", "chave_sem_tipo"])
+    tipos = pd.Series(["", "Email", "CPF", "", "", "", "Telefone", "Aleatoria"])
+    kind, normalized = classify_pix_keys(keys, tipos)
+    assert list(kind) == ["01", "02", "03", "04", "02", "03", "02", ""]
+    assert list(normalized) == ["maria@pix.com", "+5511987654321", "12345678909", "123e4567-e89b-12d3-a456-426614174000",
+                                "+5511987654321", "52998224725", "+5552998224725", "chave_sem_tipo"]
+    # Segmento B: unknown keys keep the typed type, CPF / CNPJ keys are left out
+    kind, chave = segmento_b_keys(keys, tipos)
+    assert list(kind[[2, 7]]) == ["03", "04"] and list(chave[[2, 7]]) == ["", "CHAVE_SEM_TIPO"]
+
+    df = pd.DataFrame({"NOME_FAVORECIDO": "A", "CPF_CNPJ": "529.982.247-25", "COD_BANCO": "237",
+                       "VALOR_PAGAMENTO": "1", "DATA_PAGAMENTO": "31/12/2099",
+                       "TIPO_CHAVE_PIX": ["Telefone", "", ""], "CHAVE_PIX": ["a@b.com", "xyz", ""]})
+    _, issues, _ = validate_upload(df)
+    assert issue_messages(issues) == ["Linha 3: Chave Pix inválida (xyz)"]
+    assert issue_messages(issues, SEVERITY_WARNING) == ["Linha 2: Chave Pix é e-mail, não Telefone"]
+
+def test_parse_cents():
+    values = ["R$ 1.234,56", "1,234.56", "1234.5", "1.234.567", "12.345", "0,005", "-3", "1e3", "1.2.3", "", "abc"]
+    expected = [123456, 123456, 123450, 123456700, 1235, 1, -300, 100000, None, None, None]
+    assert [parse_cents(v) for v in values] == expected
+
+    cents, valid = parse_cents_column(pd.Series(values))
+    assert list(valid) == [c is not None for c in expected]
+    assert list(cents[valid]) == [c for c in expected if c is not None]
+
+def test_read_upload_formats():
+    df = pd.DataFrame({
+        "NOME_FAVORECIDO": ["ANA", "", "JOSE"],
+        "CPF_CNPJ": ["123.456.789-09", "", "12345678000195"],
+        "VALOR_PAGAMENTO": [150.5, None, 100],
+        "DATA_PAGAMENTO": ["25/12/2099", "", "31/12/2099"],
+        "EXTRA": ["x", "y", "z"],
+    })
+    with tempfile.TemporaryDirectory() as tmp:
+        xlsx = os.path.join(tmp, "folha.xlsx")
+        csv = os.path.join(tmp, "folha.csv")
+        df.to_excel(xlsx, index=False)
+        df.assign(VALOR_PAGAMENTO=["150.5", "", "100"]).to_csv(csv, sep=";", index=False)
+
+        stats = {}
+        from_xlsx = read_upload(xlsx, stats=stats)
+        from_csv = read_upload(csv)
+
+    assert stats["format"] == "xlsx" and stats["rows"] == 2
+    assert list(from_xlsx.columns) == ["NOME_FAVORECIDO", "CPF_CNPJ", "VALOR_PAGAMENTO", "DATA_PAGAMENTO"]
+    assert list(from_xlsx.index) == [0, 2] # Spreadsheet line - 2
+    assert from_xlsx.loc[2, "VALOR_PAGAMENTO"] == "100"
+    assert from_xlsx.equals(from_csv)
+
+def test_upload_cache():
+    cache = UploadCache(max_entries=2)
+    data = "NOME_FAVORECIDO;VALOR_PAGAMENTO;DATA_PAGAMENTO\nANA;10,50;31/12/2099\n".encode("utf-8")
+
+    digest, (df, stats) = cache.read(data, "folha.csv")
+    assert cache.read(data, "folha.csv")[1][0] is df
+    normalized, issues, total_val = cache.validate(digest, df)
+    assert cache.validate(digest, df)[0] is normalized
+    assert total_val == 10.5 and stats["rows"] == 1
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 2
+
+    cache.read(b"NOME_FAVORECIDO;VALOR_PAGAMENTO\nJOSE;1\n", "outra.csv")
+    assert cache.stats()["evictions"] == 1 and cache.stats()["entries"] == 2
+
+def test_duplicate_issues():
+    from src.generator import CNABGenerator
+    from src.payment_index import PaymentIndex
+    from src.upload import duplicate_issues
+
+    df = pd.DataFrame([
+        {"NOME_FAVORECIDO": "A", "CPF_CNPJ": "123.456.789-09", "COD_BANCO": "341", "AGENCIA": "1", "CONTA": "2", "VALOR_PAGAMENTO": "10.50", "DATA_PAGAMENTO": "31/12/2099", "CHAVE_PIX": ""},
+        {"NOME_FAVORECIDO": "B", "CPF_CNPJ": "12345678909", "COD_BANCO": "0341", "AGENCIA": "0001", "CONTA": "2", "VALOR_PAGAMENTO": "R$ 10,50", "DATA_PAGAMENTO": "31/12/2099", "CHAVE_PIX": ""},
+        {"NOME_FAVORECIDO": "C", "CPF_CNPJ": "12345678909", "COD_BANCO": "341", "AGENCIA": "1", "CONTA": "2", "VALOR_PAGAMENTO": "10.51", "DATA_PAGAMENTO": "31/12/2099", "CHAVE_PIX": ""},
+    ])
+    normalized = validate_upload(df)[0]
+    with PaymentIndex(":memory:") as index:
+        assert list(duplicate_issues(normalized, index)["row"]) == [3]
+
+        CNABGenerator(nsa=4, empresa_data={"nome": "E", "cnpj": "1", "convenio": "1", "agencia": "1", "conta": "1"},
+                      payment_index=index).generate(normalized.iloc[2:], columnar=True)
+        issues = duplicate_issues(normalized, index)
+    assert list(issues["rule"]) == ["duplicado_planilha", "duplicado_historico"]
+    assert issues["message"].iloc[1] == "Linha 4: Pagamento já enviado na remessa NSA 4 (lote 1, registro 1)"
+
+def test_payment_filter_survives_concurrent_saves_and_corruption():
+    from concurrent.futures import ThreadPoolExecutor
+    from src.duplicates import BloomFilter
+    from src.payment_index import PaymentIndex
+
+    keys = np.random.default_rng(0).integers(-2**63, 2**63 - 1, 2000, dtype=np.int64)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "f.bloom.npz")
+        filters = [BloomFilter.for_capacity(4000) for _ in range(8)]
+        for i, bloom in enumerate(filters):
+            bloom.add(keys[:250 * (i + 1)])
+        with ThreadPoolExecutor(8) as pool:
+            list(pool.map(lambda bloom: [bloom.save(path) for _ in range(20)], filters))
+        assert BloomFilter.load(path).n_keys in {bloom.n_keys for bloom in filters}
+        assert os.listdir(tmp) == ["f.bloom.npz"]
+
+        # An unreadable filter file is rebuilt from the index instead of failing every lookup
+        with PaymentIndex(os.path.join(tmp, "payments.db")) as index:
+            with open(index.filter_path, "wb") as f:
+                f.write(b"PK\x03\x04 truncado")
+            assert index.key_filter().n_keys == 0
+            assert BloomFilter.load(index.filter_path).n_keys == 0
+
+def test_concurrent_generations_share_the_index():
+    from src.generator import CNABGenerator
+    from src.payment_index import PaymentIndex
+    from tests.verify_columnar import EMPRESA_DATA, build_mixed_df
+
+    df = build_mixed_df()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "payments.db")
+        with PaymentIndex(path) as first_index, PaymentIndex(path) as second_index:
+            second_index.conn.execute("PRAGMA busy_timeout = 1000")
+            # The first generation is halfway through its render, with payments already collected
+            first = CNABGenerator(nsa=1, empresa_data=EMPRESA_DATA, payment_index=first_index, max_lote_records=4)
+            lines = first.iter_lines(df.copy())
+            rendered = [next(lines) for _ in range(30)]
+            # A second generation runs start to end meanwhile instead of waiting for the index
+            CNABGenerator(nsa=2, empresa_data=EMPRESA_DATA, payment_index=second_index).generate(df.copy(), columnar=True)
+            assert second_index.count() == len(df)
+            rendered.extend(lines)
+            assert first_index.count() == 2 * len(df)
+            assert first_index.find_by_position(1, 12, 1)["forma_lancamento"] == "45"
+            assert second_index.find_by_position(2, 3, 1)["forma_lancamento"] == "45"
@@ -1,75 +1,297 @@
 #!/usr/bin/env python3
 """
-Validation script to check position 230 (Aviso ao Favorecido) in CNAB 240 files.
-This script verifies that all Segmento A lines have '0' at position 230.
+Structural validator for CNAB 240 remessa files.
+
+Checks, reporting every violation with its line and column:
+- every line is exactly 240 bytes
+- fields typed ZERO_LEFT in src/cnab_definitions.py contain only digits
+- position 230 (Aviso ao Favorecido) of every Segmento A is '0'
+- n_registro runs 1..N inside each lote and every record carries its lote number
+- TRAILER_LOTE qtd_registros / valor_total match the lote's records
+- lotes are numbered 1..N and TRAILER_ARQUIVO qtd_lotes / qtd_registros match the file
+
+Large files are split at lote boundaries and checked on a process pool.
 """
+import os
 import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.cnab_definitions import RECORD_LENGTH, PadType
+from src.reader import CNABReader, LAYOUTS, record_kind
+
+# Files with fewer lines are checked in a single process
+PARALLEL_MIN_LINES = 50000
+
+# ZERO_LEFT fields of each layout: (name, start, end)
+_DIGIT_FIELDS = {
+    kind: [(name, start, end) for name, (start, end, pad_type, _) in layout.items()
+           if pad_type == PadType.ZERO_LEFT]
+    for kind, layout in LAYOUTS.items()
+}
+
+def _field(raw, kind, name) -> bytes:
+    start, end, _, _ = LAYOUTS[kind][name]
+    return bytes(raw[start - 1:end])
+
+def _error(errors, line_no, start, end, message):
+    col = f"col {start}" if start == end else f"col {start}-{end}"
+    errors.append((line_no, start, f"Line {line_no}, {col}: {message}"))
+
+def _check_range(path, start_offset, end_offset, first_line_no):
+    """
+    Checks the lines in [start_offset, end_offset), which must start at a lote
+    boundary. Returns the errors found plus what the file-level merge needs.
+    """
+    errors = []
+    lotes = [] # (lote number, header line)
+    file_records = [] # (kind, line_no, {field: bytes})
+    seg_a_count = 0
+    line_count = 0
+
+    current = None # Open lote state
+    lote_forma = b""
+
+    def close_lote(line_no):
+        _error(errors, current["line_no"], 4, 7,
+               f"Lote {current['lote']} has no TRAILER_LOTE (next record at line {line_no})")
+
+    with CNABReader(path) as reader:
+        data = reader._map
+        view = reader._view
+        offset = start_offset
+        line_no = first_line_no - 1
+        while offset < end_offset:
+            end = data.find(b"\n", offset, end_offset)
+            if end == -1:
+                end = end_offset
+                next_offset = end_offset
+            else:
+                next_offset = end + 1
+            stop = end - 1 if end > offset and view[end - 1] == 13 else end
+            raw = view[offset:stop]
+            offset = next_offset
+            line_no += 1
+            line_count += 1
+
+            if len(raw) != RECORD_LENGTH:
+                _error(errors, line_no, min(len(raw), RECORD_LENGTH) + 1, min(len(raw), RECORD_LENGTH) + 1,
+                       f"Invalid length {len(raw)}, expected {RECORD_LENGTH}")
+                if len(raw) < 14:
+                    continue
+
+            kind = record_kind(raw, lote_forma)
+            if kind == "unknown":
+                _error(errors, line_no, 8, 8,
+                       f"Unknown record type (registro '{chr(raw[7])}', segmento '{chr(raw[13])}')")
+                continue
+
+            # Field types
+            for name, start, end_col in _DIGIT_FIELDS[kind]:
+                value = bytes(raw[start - 1:end_col])
+                if len(value) == end_col - start + 1 and not value.isdigit():
+                    _error(errors, line_no, start, end_col,
+                           f"{name} must be numeric, found '{value.decode('cp1252', errors='replace')}'")
+
+            if kind in ("header_arquivo", "trailer_arquivo"):
+                if current is not None:
+                    close_lote(line_no)
+                    current = None
+                fields = {name: _field(raw, kind, name) for name in ("qtd_lotes", "qtd_registros")} \
+                    if kind == "trailer_arquivo" else {}
+                file_records.append((kind, line_no, fields))
+                continue
+
+            lote = _field(raw, kind, "lote")
+
+            if kind == "header_lote":
+                if current is not None:
+                    close_lote(line_no)
+                lote_forma = _field(raw, kind, "forma_lancamento")
+                current = {"lote": lote, "line_no": line_no, "records": 1, "next_seq": 1, "total": 0}
+                lotes.append((lote, line_no))
+                continue
+
+            if current is None:
+                _error(errors, line_no, 4, 7, f"{kind} outside of a lote")
+                continue
+            if lote != current["lote"]:
+                _error(errors, line_no, 4, 7,
+                       f"Lote '{lote.decode()}' differs from its header ('{current['lote'].decode()}')")
+            current["records"] += 1
+
+            if kind == "trailer_lote":
+                qtd = _field(raw, kind, "qtd_registros")
+                if qtd.isdigit() and int(qtd) != current["records"]:
+                    _error(errors, line_no, 18, 23,
+                           f"qtd_registros {int(qtd)} but lote {current['lote'].decode()} has {current['records']} records")
+                total = _field(raw, kind, "valor_total")
+                if total.isdigit() and int(total) != current["total"]:
+                    _error(errors, line_no, 24, 41,
+                           f"valor_total {int(total)} but Segmento A values sum to {current['total']}")
+                current = None
+                lote_forma = b""
+                continue
 
-def validate_cnab_file(filepath):
+            # Detail record
+            n_registro = _field(raw, kind, "n_registro")
+            if n_registro.isdigit() and int(n_registro) != current["next_seq"]:
+                _error(errors, line_no, 9, 13,
+                       f"n_registro {int(n_registro)}, expected {current['next_seq']}")
+            current["next_seq"] += 1
+
+            if kind in ("segmento_a", "segmento_a_pix"):
+                seg_a_count += 1
+                valor = _field(raw, kind, "valor_pagamento")
+                if valor.isdigit():
+                    current["total"] += int(valor)
+                # Check position 230 (index 229 in 0-based)
+                if len(raw) >= 230 and raw[229] != ord('0'):
+                    _error(errors, line_no, 230, 230,
+                           f"Position 230 = '{chr(raw[229])}', expected '0' (Segmento A #{seg_a_count})")
+
+        if current is not None:
+            close_lote(line_no + 1)
+
+    return {
+        "errors": errors,
+        "lotes": lotes,
+        "file_records": file_records,
+        "seg_a_count": seg_a_count,
+        "line_count": line_count,
+    }
+
+def _lote_boundaries(reader):
+    """Returns ([(offset, line_no) of each HEADER_LOTE], total lines)."""
+    size = len(reader._view)
+    stride = RECORD_LENGTH + 2
+    if size and (size + 2) % stride == 0:
+        # Fixed CRLF layout: strided views of the map, no line scanning
+        n = (size + 2) // stride
+        flat = np.frombuffer(reader._map, dtype=np.uint8)
+        if (flat[RECORD_LENGTH::stride] == 13).all() and (flat[RECORD_LENGTH + 1::stride] == 10).all():
+            rows = np.flatnonzero(flat[7::stride] == ord('1'))
+            del flat
+            return [(int(i) * stride, int(i) + 1) for i in rows], n
+        del flat
+
+    starts = []
+    n = 0
+    for line_no, offset, raw in reader.iter_raw():
+        n = line_no
+        if len(raw) > 7 and raw[7] == ord('1'):
+            starts.append((offset, line_no))
+    return starts, n
+
+def _plan_chunks(path, workers):
+    with CNABReader(path) as reader:
+        size = len(reader._view)
+        starts, total_lines = _lote_boundaries(reader)
+    if workers <= 1 or total_lines < PARALLEL_MIN_LINES or len(starts) < 2:
+        return [(0, size, 1)]
+
+    # Group consecutive lotes into ~4 chunks per worker
+    target = max(1, size // (workers * 4))
+    chunks = []
+    chunk_start, chunk_line = 0, 1
+    for offset, line_no in starts[1:]:
+        if offset - chunk_start >= target:
+            chunks.append((chunk_start, offset, chunk_line))
+            chunk_start, chunk_line = offset, line_no
+    chunks.append((chunk_start, size, chunk_line))
+    return chunks
+
+def _merge(results):
+    errors = []
+    lotes = []
+    file_records = []
+    seg_a_count = 0
+    total_lines = 0
+    for r in results:
+        errors.extend(r["errors"])
+        lotes.extend(r["lotes"])
+        file_records.extend(r["file_records"])
+        seg_a_count += r["seg_a_count"]
+        total_lines += r["line_count"]
+
+    headers = [rec for rec in file_records if rec[0] == "header_arquivo"]
+    trailers = [rec for rec in file_records if rec[0] == "trailer_arquivo"]
+
+    if not headers or headers[0][1] != 1:
+        errors.append((1, 8, "Line 1, col 8: first record must be the HEADER_ARQUIVO (registro 0)"))
+    for _, line_no, _ in headers[1:]:
+        errors.append((line_no, 8, f"Line {line_no}, col 8: duplicated HEADER_ARQUIVO"))
+
+    if not trailers or trailers[-1][1] != total_lines:
+        errors.append((total_lines, 8, f"Line {total_lines}, col 8: last record must be the TRAILER_ARQUIVO (registro 9)"))
+    for _, line_no, _ in trailers[:-1]:
+        errors.append((line_no, 8, f"Line {line_no}, col 8: duplicated TRAILER_ARQUIVO"))
+
+    for expected, (lote, line_no) in enumerate(lotes, 1):
+        if not lote.isdigit() or int(lote) != expected:
+            errors.append((line_no, 4, f"Line {line_no}, col 4-7: lote '{lote.decode()}', expected {expected}"))
+
+    if trailers:
+        _, line_no, fields = trailers[-1]
+        qtd_lotes, qtd_registros = fields["qtd_lotes"], fields["qtd_registros"]
+        if qtd_lotes.isdigit() and int(qtd_lotes) != len(lotes):
+            errors.append((line_no, 18, f"Line {line_no}, col 18-23: qtd_lotes {int(qtd_lotes)} but file has {len(lotes)} lotes"))
+        if qtd_registros.isdigit() and int(qtd_registros) != total_lines:
+            errors.append((line_no, 24, f"Line {line_no}, col 24-29: qtd_registros {int(qtd_registros)} but file has {total_lines} lines"))
+
+    errors.sort(key=lambda e: (e[0], e[1]))
+    return [message for _, _, message in errors], seg_a_count
+
+def validate_cnab_file(filepath, workers=None):
     """
-    Validate CNAB 240 file for correct Aviso ao Favorecido field.
-    
+    Validate the structure of a CNAB 240 file.
+
     Args:
         filepath: Path to the .REM file
-        
+        workers: Processes used on large files (default: CPU count, 1 = serial)
+
     Returns:
-        tuple: (is_valid, error_messages)
+        tuple: (is_valid, error_messages, segmento_a_count)
     """
-    errors = []
-    segmento_a_count = 0
-    
+    workers = workers or os.cpu_count() or 1
     try:
-        with open(filepath, 'r', encoding='cp1252') as f:
-            for line_num, line in enumerate(f, 1):
-                # Remove line endings but keep trailing spaces
-                line = line.rstrip('\r\n')
-                
-                # Check if this is a Segmento A line
-                # Format: Position 8 = '3' (detail record), Position 14 = 'A' (segment A)
-                if len(line) >= 14 and line[7] == '3' and line[13] == 'A':
-                    segmento_a_count += 1
-                    
-                    # Check line length
-                    if len(line) != 240:
-                        errors.append(f"Line {line_num}: Invalid length {len(line)}, expected 240")
-                        continue
-                    
-                    # Check position 230 (index 229 in 0-based)
-                    aviso_value = line[229]
-                    if aviso_value != '0':
-                        errors.append(
-                            f"Line {line_num}: Position 230 = '{aviso_value}', expected '0' "
-                            f"(Segmento A #{segmento_a_count})"
-                        )
-    
+        chunks = _plan_chunks(filepath, workers)
+        if len(chunks) == 1:
+            results = [_check_range(filepath, *chunks[0])]
+        else:
+            with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+                results = list(pool.map(_check_range, [filepath] * len(chunks),
+                                        *zip(*chunks)))
+        errors, segmento_a_count = _merge(results)
     except FileNotFoundError:
-        errors.append(f"File not found: {filepath}")
+        return False, [f"File not found: {filepath}"], 0
     except Exception as e:
-        errors.append(f"Error reading file: {str(e)}")
-    
+        return False, [f"Error reading file: {str(e)}"], 0
+
     return len(errors) == 0, errors, segmento_a_count
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python validate_cnab.py <path_to_rem_file>")
         sys.exit(1)
-    
+
     filepath = sys.argv[1]
     is_valid, errors, seg_a_count = validate_cnab_file(filepath)
-    
-    print(f"\\n{'='*60}")
+
+    print(f"\n{'='*60}")
     print(f"CNAB 240 Validation Results")
     print(f"{'='*60}")
     print(f"File: {filepath}")
     print(f"Segmento A lines found: {seg_a_count}")
-    print(f"{'='*60}\\n")
-    
+    print(f"{'='*60}\n")
+
     if is_valid:
         print("✅ VALIDATION PASSED!")
-        print(f"All {seg_a_count} Segmento A lines have '0' at position 230.")
+        print(f"All {seg_a_count} Segmento A lines are structurally valid.")
     else:
         print("❌ VALIDATION FAILED!")
-        print(f"\\nErrors found ({len(errors)}):\\n")
+        print(f"\nErrors found ({len(errors)}):\n")
         for error in errors:
             print(f"  • {error}")
         sys.exit(1)